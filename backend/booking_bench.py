@@ -0,0 +1,228 @@
+"""
+Booking 酒店搜索离线录制 / 回放 / 基准测试工具
+
+录制一次真实搜索的全部页面流量到 HAR，之后在无网络的情况下回放，
+重复运行搜索并统计各阶段耗时、CPU 时间和峰值内存（含浏览器子进程，仅 Linux）
+
+用法：
+    python booking_bench.py record --destination 成都春熙路 --checkin 2025-11-13 --checkout 2025-11-14 --out fixtures/booking/chengdu
+    python booking_bench.py bench --fixture fixtures/booking/chengdu -n 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import threading
+import time
+from typing import Dict, List, Optional
+
+from booking_hotel_search import search_hotel
+from core.browser_pool import browser_pool
+
+HAR_FILENAME = "search.har"
+PARAMS_FILENAME = "params.json"
+
+_CLK_TCK = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _process_tree(root_pid: int) -> List[int]:
+    """返回 root_pid 及其所有子孙进程（读取 /proc）"""
+    children: Dict[int, List[int]] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # 进程名可能包含空格，从最后一个 ')' 之后开始解析
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        children.setdefault(int(fields[1]), []).append(int(entry))
+
+    pids, stack = [], [root_pid]
+    while stack:
+        pid = stack.pop()
+        pids.append(pid)
+        stack.extend(children.get(pid, []))
+    return pids
+
+
+def _tree_cpu_seconds(root_pid: int) -> float:
+    """进程树累计的用户态 + 内核态 CPU 时间（秒）"""
+    total = 0
+    for pid in _process_tree(root_pid):
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            # utime、stime 分别是 ')' 之后的第 12、13 个字段
+            total += int(fields[11]) + int(fields[12])
+        except (OSError, IndexError, ValueError):
+            continue
+    return total / _CLK_TCK
+
+
+def _tree_rss_bytes(root_pid: int) -> int:
+    """进程树当前常驻内存之和（字节）"""
+    total = 0
+    for pid in _process_tree(root_pid):
+        try:
+            with open(f"/proc/{pid}/statm") as f:
+                total += int(f.read().split()[1]) * _PAGE_SIZE
+        except (OSError, IndexError, ValueError):
+            continue
+    return total
+
+
+class _RssSampler:
+    """后台线程定期采样进程树内存，记录峰值"""
+
+    def __init__(self, interval: float = 0.1):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        pid = os.getpid()
+        while not self._stop.is_set():
+            self.peak = max(self.peak, _tree_rss_bytes(pid))
+            self._stop.wait(self.interval)
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def record(params: Dict, out_dir: str):
+    """执行一次真实搜索并把页面流量录制到 out_dir"""
+    os.makedirs(out_dir, exist_ok=True)
+    har_path = os.path.join(out_dir, HAR_FILENAME)
+    result = await search_hotel(**params, record_har=har_path)
+    with open(os.path.join(out_dir, PARAMS_FILENAME), "w", encoding="utf-8") as f:
+        json.dump({
+            "params": params,
+            "recorded_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "success": result.get("success"),
+            "hotels": len(result.get("hotels", [])),
+            "search_mode": result.get("search_mode"),
+        }, f, ensure_ascii=False, indent=2)
+    print(f"已录制到 {har_path}，成功: {result.get('success')}，酒店数: {len(result.get('hotels', []))}")
+
+
+async def bench(fixture_dir: str, runs: int, use_pool: bool) -> Dict:
+    """回放 fixture 重复搜索 runs 次，返回统计报告"""
+    with open(os.path.join(fixture_dir, PARAMS_FILENAME), encoding="utf-8") as f:
+        params = json.load(f)["params"]
+    har_path = os.path.join(fixture_dir, HAR_FILENAME)
+
+    if use_pool:
+        await browser_pool.start()
+    phases: Dict[str, List[float]] = {}
+    totals: List[float] = []
+    failures = 0
+    pid = os.getpid()
+    try:
+        cpu_start = _tree_cpu_seconds(pid)
+        wall_start = time.perf_counter()
+        with _RssSampler() as sampler:
+            for i in range(runs):
+                result = await search_hotel(**params, replay_har=har_path)
+                if not result.get("success"):
+                    failures += 1
+                timings = result.get("timings", {})
+                totals.append(timings.get("total_ms", 0.0))
+                for name, ms in timings.get("phases", {}).items():
+                    phases.setdefault(name, []).append(ms)
+                print(f"[{i + 1}/{runs}] {timings.get('total_ms', 0):.0f}ms 成功: {result.get('success')}")
+        wall = time.perf_counter() - wall_start
+        cpu = _tree_cpu_seconds(pid) - cpu_start
+    finally:
+        if use_pool:
+            await browser_pool.stop()
+
+    def summarize(values: List[float]) -> Dict:
+        return {
+            "p50_ms": round(_percentile(values, 50), 1),
+            "p95_ms": round(_percentile(values, 95), 1),
+            "max_ms": round(max(values), 1),
+            "mean_ms": round(statistics.mean(values), 1),
+        }
+
+    return {
+        "fixture": fixture_dir,
+        "runs": runs,
+        "failures": failures,
+        "pool": use_pool,
+        "total": summarize(totals),
+        "phases": {name: summarize(values) for name, values in sorted(phases.items())},
+        "wall_seconds": round(wall, 2),
+        "cpu_seconds": round(cpu, 2),
+        "cpu_seconds_per_search": round(cpu / runs, 3),
+        "peak_rss_mb": round(sampler.peak / 1024 / 1024, 1),
+    }
+
+
+def _print_report(report: Dict):
+    print(f"\n回放 {report['runs']} 次（失败 {report['failures']} 次），浏览器池: {report['pool']}")
+    print(f"{'阶段':<16}{'p50':>10}{'p95':>10}{'max':>10}")
+    rows = list(report["phases"].items()) + [("total", report["total"])]
+    for name, row in rows:
+        print(f"{name:<16}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['max_ms']:>10.1f}")
+    print(f"CPU 时间: {report['cpu_seconds']}s（每次 {report['cpu_seconds_per_search']}s），"
+          f"峰值内存: {report['peak_rss_mb']} MB，总耗时: {report['wall_seconds']}s")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Booking 酒店搜索录制/回放基准测试")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    rec = sub.add_parser("record", help="录制一次真实搜索")
+    rec.add_argument("--destination", required=True)
+    rec.add_argument("--checkin")
+    rec.add_argument("--checkout")
+    rec.add_argument("--adults", type=int, default=2)
+    rec.add_argument("--children", type=int, default=0)
+    rec.add_argument("--rooms", type=int, default=1)
+    rec.add_argument("--out", required=True, help="fixture 输出目录")
+
+    ben = sub.add_parser("bench", help="回放 fixture 并统计性能")
+    ben.add_argument("--fixture", required=True, help="record 生成的 fixture 目录")
+    ben.add_argument("-n", "--runs", type=int, default=10)
+    ben.add_argument("--no-pool", action="store_true", help="每次搜索单独启动浏览器（测量冷启动）")
+    ben.add_argument("--json", help="把报告另存为 JSON 文件")
+
+    args = parser.parse_args(argv)
+    if args.command == "record":
+        params = {
+            "destination": args.destination,
+            "checkin_date": args.checkin,
+            "checkout_date": args.checkout,
+            "adults": args.adults,
+            "children": args.children,
+            "rooms": args.rooms,
+        }
+        asyncio.run(record(params, args.out))
+    else:
+        report = asyncio.run(bench(args.fixture, args.runs, use_pool=not args.no_pool))
+        _print_report(report)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
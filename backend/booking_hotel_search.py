@@ -5,95 +5,122 @@ Booking.com 酒店搜索自动化脚本
 from playwright.async_api import async_playwright
 import asyncio
 import json
-from typing import Optional, Dict, List
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional, Dict, List, Tuple
 from datetime import datetime
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 
+from core.browser_pool import browser_pool, BROWSER_LAUNCH_ARGS, BROWSER_HEADLESS, SCRAPE_MODE
+from core.browser_profile import browser_profile
+from core.request_filter import RequestFilter
+from core.page_readiness import PageReadiness, PhaseTimer
+from hotel_ranking import enrich_hotel
+from core.metrics import metrics
+from core.popup_dismisser import PopupDismisser
 
-async def close_popups_dynamically(page):
-    """
-    动态关闭各种弹窗 - 可以在任何时候调用
-    """
-    popups_closed = []
-    
-    # ESC 键（最通用，可以关闭大多数弹窗）
-    try:
-        await page.keyboard.press("Escape")
-        await asyncio.sleep(0.3)
-        popups_closed.append("ESC键关闭")
-    except:
-        pass
-    
-    # 定义所有可能的弹窗关闭策略
-    close_strategies = [
-        # 通用关闭按钮
-        ('button[aria-label*="关闭"]', "关闭按钮"),
-        ('button[aria-label*="Close"]', "Close按钮"),
-        ('button[aria-label*="Dismiss"]', "Dismiss按钮"),
-        # Cookie 弹窗
-        ('.bui-modal__close', "Modal关闭"),
-        # X 按钮
-        ('button:has(svg)', "SVG关闭按钮"),
-    ]
-    
-    for selector, name in close_strategies:
-        try:
-            element = page.locator(selector).first
-            if await element.is_visible(timeout=1000):
-                await element.click()
-                popups_closed.append(name)
-                await asyncio.sleep(0.3)
-        except:
-            pass
-    
-    # 尝试点击特定文本按钮
-    text_buttons = [
-        ("接受", "Cookie接受"),
-        ("拒绝", "Cookie拒绝"),
-        ("留在国际版", "留在国际版"),
-    ]
-    
-    for text, name in text_buttons:
-        try:
-            element = page.get_by_role("button", name=text)
-            if await element.is_visible(timeout=1000):
-                await element.click()
-                popups_closed.append(name)
-                await asyncio.sleep(0.3)
-        except:
-            pass
-    
-    if popups_closed:
-        print(f"✓ 已关闭弹窗: {', '.join(popups_closed)}")
-    
-    return len(popups_closed) > 0
+# 搜索方式：deeplink 直接打开搜索结果页（无结果时自动回退到表单）；form 始终通过首页表单搜索
+BOOKING_SEARCH_MODE = os.getenv("BOOKING_SEARCH_MODE", "deeplink").lower()
+BOOKING_SEARCH_RESULTS_URL = "https://booking.cn/searchresults.zh-cn.html"
+# 未提供儿童年龄时使用的默认年龄
+DEFAULT_CHILD_AGE = 8
+
+# 搜索结果页中的酒店卡片
+PROPERTY_CARD_SELECTOR = '[data-testid="property-card"]'
+
+# 最多提取的酒店数量（LLM会从中选择5个推荐）
+HOTEL_MAX_CARDS = int(os.getenv("HOTEL_MAX_CARDS", 10))
+
+# 卡片内各字段的选择器，按优先级依次回退
+CARD_FIELD_SELECTORS = {
+    "name": ['[data-testid="title"]', 'h3, h4'],
+    "price": ['[data-testid="price-and-discounted-price"]', '.prco-valign-middle-helper'],
+    "score": ['[data-testid="review-score"]', '.bui-review-score__badge'],
+    "location": ['[data-testid="address"]', '[data-testid="distance"]'],
+}
+CARD_FACILITY_SELECTOR = '[data-testid="facility-group"]'
+
+# 字段缺失时的默认值
+CARD_FIELD_DEFAULTS = {
+    "price": "价格待询",
+    "score": "暂无评分",
+    "location": "位置信息待确认",
+}
+
+# 抓取指标
+SCRAPE_PHASE_SECONDS = metrics.histogram(
+    "scrape_phase_seconds", "酒店抓取各阶段耗时（秒）", ("phase",)
+)
+SCRAPE_DURATION_SECONDS = metrics.histogram(
+    "scrape_duration_seconds", "单次酒店抓取总耗时（秒）", ("outcome",)
+)
+SCRAPE_WAIT_TIMEOUTS = metrics.counter(
+    "scrape_wait_timeouts_total", "页面等待触达上限的次数", ("wait",)
+)
+SCRAPE_SELECTOR_HITS = metrics.counter(
+    "scrape_selector_hits_total", "卡片字段命中的选择器（primary / fallbackN / missing）", ("field", "selector")
+)
+SCRAPE_FAILURES = metrics.counter(
+    "scrape_failures_total", "酒店抓取失败次数（按原因分类）", ("category",)
+)
+SCRAPE_POPUPS_DISMISSED = metrics.counter(
+    "scrape_popups_dismissed_total", "自动关闭的弹窗数量", ("popup",)
+)
 
+# 在页面内一次性提取 [start, maxCards) 范围内卡片的脚本，避免逐字段往返浏览器
+_EXTRACT_CARDS_JS = """
+(cards, { fields, facilitySelector, start, maxCards }) => {
+    // 返回 [文本, 命中的选择器序号]，都未命中时序号为 -1
+    const firstText = (card, selectors) => {
+        for (let i = 0; i < selectors.length; i++) {
+            const el = card.querySelector(selectors[i]);
+            const text = el && el.innerText ? el.innerText.trim() : "";
+            if (text) return [text, i];
+        }
+        return [null, -1];
+    };
+    return cards.slice(start, maxCards).map(card => {
+        const info = { matched: {} };
+        for (const [field, selectors] of Object.entries(fields)) {
+            [info[field], info.matched[field]] = firstText(card, selectors);
+        }
+        info.facilities = Array.from(card.querySelectorAll(facilitySelector))
+            .map(el => (el.innerText || "").trim())
+            .filter(Boolean)
+            .slice(0, 5);
+        return info;
+    });
+}
+"""
 
-async def handle_cookie_consent(page):
+
+async def handle_cookie_consent(page, ready: Optional[PageReadiness] = None):
     """处理 Cookie 确认页面"""
     if "pipl_consent" in page.url:
         print("检测到 Cookie 确认页面，正在处理...")
+        ready = ready or PageReadiness(page)
         try:
-            # 等待页面加载
-            await asyncio.sleep(1)
+            # 等待"全选"标签出现
+            select_all_label = page.locator('label').filter(has_text="全选")
+            await ready.visible(select_all_label, timeout_ms=5000, name="consent_form")
             
             # 步骤1: 点击"全选"标签（点击label而不是checkbox）
             try:
-                # 使用 label 定位器查找包含"全选"文本的标签并点击
-                select_all_label = page.locator('label').filter(has_text="全选")
                 await select_all_label.click()
                 print("✓ 已点击全选")
-                await asyncio.sleep(0.5)
             except Exception as e:
                 print(f"点击全选时出错: {e}")
             
             # 步骤2: 点击"同意"按钮
             try:
+                consent_url = page.url
                 agree_button = page.get_by_role("button", name="同意")
                 await agree_button.click()
                 print("✓ 已点击'同意'按钮")
-                # 等待页面跳转
-                await page.wait_for_load_state("networkidle", timeout=10000)
-                await asyncio.sleep(2)
+                # 等待页面跳转离开确认页，并等 DOM 可用
+                await ready.url_changed(consent_url, timeout_ms=10000, name="consent_redirect")
+                await page.wait_for_load_state("domcontentloaded", timeout=10000)
                 print("✓ Cookie 确认完成，页面已跳转")
                 return True
             except Exception as e:
@@ -108,6 +135,75 @@ async def handle_cookie_consent(page):
     return False
 
 
+async def _eval_cards(page, start: int, max_cards: int) -> List[Dict]:
+    """在页面内提取第 start 张到第 max_cards 张卡片的原始字段"""
+    return await page.eval_on_selector_all(
+        PROPERTY_CARD_SELECTOR,
+        _EXTRACT_CARDS_JS,
+        {"fields": CARD_FIELD_SELECTORS, "facilitySelector": CARD_FACILITY_SELECTOR,
+         "start": start, "maxCards": max_cards},
+    )
+
+
+def _parse_card(card: Dict) -> Optional[Dict]:
+    """把原始字段整理为酒店信息（附带解析出的价格、评分、距离等数值），缺少名称时返回 None"""
+    if not card.get("name"):
+        return None
+    return enrich_hotel({
+        "name": card["name"],
+        "price": card.get("price") or CARD_FIELD_DEFAULTS["price"],
+        "score": card.get("score") or CARD_FIELD_DEFAULTS["score"],
+        "location": card.get("location") or CARD_FIELD_DEFAULTS["location"],
+        "facilities": card.get("facilities") or [],
+    })
+
+
+def _count_selector_hits(card: Dict, selector_hits: Dict[str, Dict[str, int]]):
+    for field, index in (card.get("matched") or {}).items():
+        label = "missing" if index < 0 else "primary" if index == 0 else f"fallback{index}"
+        field_hits = selector_hits.setdefault(field, {})
+        field_hits[label] = field_hits.get(label, 0) + 1
+
+
+async def iter_property_cards(
+    page,
+    ready: PageReadiness,
+    timer: PhaseTimer,
+    max_cards: int = HOTEL_MAX_CARDS,
+    stable_ms: int = 800,
+    timeout_ms: int = 5000,
+    selector_hits: Optional[Dict[str, Dict[str, int]]] = None
+) -> AsyncIterator[Dict]:
+    """
+    逐批提取酒店卡片并逐个产出：先提取已渲染的卡片，再等待懒加载的新卡片，
+    stable_ms 内没有新卡片或总时长超过 timeout_ms 时结束
+    
+    selector_hits 不为 None 时累计各字段命中的选择器：{字段: {"primary"/"fallback1"/"missing": 次数}}
+    """
+    seen = 0
+    deadline = time.monotonic() + timeout_ms / 1000
+    while seen < max_cards:
+        with timer.phase("extract"):
+            raw_cards = await _eval_cards(page, seen, max_cards)
+        for i, card in enumerate(raw_cards, seen + 1):
+            if selector_hits is not None:
+                _count_selector_hits(card, selector_hits)
+            hotel = _parse_card(card)
+            if hotel is None:
+                print(f"无法获取酒店 {i} 的名称，跳过")
+                continue
+            yield hotel
+        seen += len(raw_cards)
+        
+        remaining_ms = (deadline - time.monotonic()) * 1000
+        if seen >= max_cards or remaining_ms <= 0:
+            break
+        with timer.phase("results_wait"):
+            if not await ready.count_above(PROPERTY_CARD_SELECTOR, seen, timeout_ms=min(stable_ms, remaining_ms)):
+                break
+    print(f"找到 {seen} 家酒店")
+
+
 async def search_hotel(
     destination: str,
     checkin_date: Optional[str] = None,
@@ -116,7 +212,10 @@ async def search_hotel(
     children: int = 0,
     rooms: int = 1,
     children_ages: Optional[List[int]] = None,
-    pets: bool = False
+    pets: bool = False,
+    max_cards: Optional[int] = None,
+    record_har: Optional[str] = None,
+    replay_har: Optional[str] = None
 ) -> Dict:
     """
     搜索酒店并返回结果
@@ -130,10 +229,40 @@ async def search_hotel(
         rooms: 房间数量
         children_ages: 儿童年龄列表
         pets: 是否携带宠物
+        max_cards: 最多提取的酒店数量，默认 HOTEL_MAX_CARDS
+        record_har: 把本次搜索的全部页面流量录制到该 HAR 文件
+        replay_har: 从该 HAR 文件回放页面流量，不访问网络（HAR 中没有的请求直接中止）
     
     Returns:
         包含酒店信息的字典
     """
+    async for kind, payload in iter_search_hotel(
+        destination, checkin_date, checkout_date, adults, children, rooms, children_ages, pets,
+        max_cards=max_cards, record_har=record_har, replay_har=replay_har
+    ):
+        if kind == "result":
+            return payload
+
+
+async def iter_search_hotel(
+    destination: str,
+    checkin_date: Optional[str] = None,
+    checkout_date: Optional[str] = None,
+    adults: int = 2,
+    children: int = 0,
+    rooms: int = 1,
+    children_ages: Optional[List[int]] = None,
+    pets: bool = False,
+    max_cards: Optional[int] = None,
+    record_har: Optional[str] = None,
+    replay_har: Optional[str] = None
+) -> AsyncIterator[Tuple[str, Dict]]:
+    """
+    搜索酒店，每解析出一家酒店就立即产出（参数同 search_hotel）
+    
+    Yields:
+        ("hotel", 酒店信息) ...，最后是 ("result", 与 search_hotel 返回值相同的完整结果)
+    """
     result = {
         "success": False,
         "hotels": [],
@@ -150,217 +279,403 @@ async def search_hotel(
         }
     }
     
+    timer = PhaseTimer()
+    try:
+        launch_start = time.perf_counter()
+        context_options = {"record_har_path": record_har} if record_har else {}
+        # 复用保存的 Cookie 与静态资源缓存；录制/回放时保持干净的浏览器状态
+        profile_session = None
+        if browser_profile.enabled and not record_har and not replay_har:
+            profile_session = browser_profile.session()
+            context_options.update(profile_session.context_options())
+        async with _open_page(**context_options) as (page, wait_ms):
+            timer.add("launch", (time.perf_counter() - launch_start) * 1000)
+            result["pool_wait_ms"] = round(wait_ms, 1)
+            # 设置更长的默认超时
+            page.set_default_timeout(30000)
+            if replay_har:
+                # 先注册 HAR 回放，请求过滤器放行的请求会回退到这里
+                await page.route_from_har(replay_har, not_found="abort")
+            if profile_session:
+                # 须在请求过滤器之前注册：过滤器放行的请求再回退到缓存路由
+                await profile_session.install(page)
+            # 生产模式：拦截图片、字体、统计脚本等与文本提取无关的请求
+            request_filter = None
+            if SCRAPE_MODE == "production":
+                request_filter = RequestFilter()
+                await request_filter.install(page)
+            # 弹窗出现时由页面内脚本立即关闭，无需在流程中轮询
+            popup_dismisser = PopupDismisser()
+            await popup_dismisser.install(page)
+            try:
+                async for hotel in _iter_search(page, result, timer, destination, checkin_date, checkout_date,
+                                                adults, children, rooms, children_ages, pets,
+                                                max_cards or HOTEL_MAX_CARDS):
+                    yield "hotel", hotel
+            finally:
+                result["popups"] = popup_dismisser.stats()
+                if request_filter:
+                    result["network"] = request_filter.stats()
+                    print(f"已拦截 {request_filter.blocked_requests} 个请求，"
+                          f"约节省 {request_filter.estimated_bytes_saved / 1024:.0f} KB")
+                if profile_session:
+                    await profile_session.finish(page, result["success"])
+                    result["profile"] = profile_session.stats()
+    except Exception as e:
+        result["error"] = f"搜索过程出错: {str(e)}"
+        result["failure"] = _classify_exception(e)
+        print(result["error"])
+        import traceback
+        traceback.print_exc()
+    
+    # 各阶段耗时，便于比较 p50/p95
+    result["timings"] = timer.as_dict()
+    result["telemetry"] = _record_telemetry(result)
+    yield "result", result
+
+
+def _classify_exception(error: Exception) -> str:
+    """把搜索过程中的异常归类为失败原因"""
+    message = str(error).lower()
+    if type(error) is TimeoutError:
+        # 内置 TimeoutError 来自浏览器池等待空闲页面
+        return "pool_timeout"
+    if "timeout" in type(error).__name__.lower() or "timeout" in message:
+        return "navigation_timeout"
+    if any(word in message for word in ("target closed", "crash", "browser has been closed", "connection closed")):
+        return "browser_crash"
+    if "net::" in message:
+        return "network_error"
+    return "error"
+
+
+def _record_telemetry(result: Dict) -> Dict:
+    """汇总本次抓取的遥测数据并写入指标，返回附加到搜索结果上的摘要"""
+    timings = result.get("timings", {})
+    failure = None if result.get("success") else result.get("failure", "error")
+    selector_hits = result.pop("selector_hits", {})
+    popups = result.get("popups", {})
+    
+    for phase, ms in timings.get("phases", {}).items():
+        SCRAPE_PHASE_SECONDS.observe(ms / 1000, phase=phase)
+    SCRAPE_DURATION_SECONDS.observe(timings.get("total_ms", 0) / 1000, outcome="failure" if failure else "success")
+    for wait in timings.get("timeouts", []):
+        SCRAPE_WAIT_TIMEOUTS.inc(wait=wait)
+    for field, hits in selector_hits.items():
+        for selector, count in hits.items():
+            SCRAPE_SELECTOR_HITS.inc(count, field=field, selector=selector)
+    for name, count in popups.get("dismissed_by_name", {}).items():
+        SCRAPE_POPUPS_DISMISSED.inc(count, popup=name)
+    if failure:
+        SCRAPE_FAILURES.inc(category=failure)
+    
+    return {
+        "phases_ms": timings.get("phases", {}),
+        "total_ms": timings.get("total_ms"),
+        "timeouts": timings.get("timeouts", []),
+        "selector_hits": selector_hits,
+        "popups_dismissed": popups.get("dismissed", 0),
+        "blocked_requests": result.get("network", {}).get("blocked_requests"),
+        "search_mode": result.get("search_mode"),
+        "failure": failure,
+    }
+
+
+@asynccontextmanager
+async def _open_page(**context_options):
+    """
+    获取一个搜索用页面
+    应用内优先从共享浏览器池租用；浏览器池未启动时（如直接运行本脚本）临时启动浏览器
+    """
+    if browser_pool.running:
+        async with browser_pool.lease(**context_options) as lease:
+            yield lease.page, lease.wait_ms
+        return
+    
     async with async_playwright() as p:
-        # 使用非headless模式，可以看到浏览器操作过程
+        # debug 模式使用非headless模式，可以看到浏览器操作过程
         browser = await p.chromium.launch(
-            headless=False,
-            args=['--disable-blink-features=AutomationControlled']  # 避免被检测为机器人
+            headless=BROWSER_HEADLESS,
+            args=BROWSER_LAUNCH_ARGS
         )
-        page = await browser.new_page()
-        # 设置更长的默认超时
-        page.set_default_timeout(30000)
+        context = await browser.new_context(**context_options)
+        try:
+            page = await context.new_page()
+            yield page, 0.0
+        finally:
+            # 关闭 context 时才会写出录制的 HAR
+            await context.close()
+            await browser.close()
+
+
+async def _iter_search(
+    page,
+    result: Dict,
+    timer: PhaseTimer,
+    destination: str,
+    checkin_date: Optional[str],
+    checkout_date: Optional[str],
+    adults: int,
+    children: int,
+    rooms: int,
+    children_ages: Optional[List[int]],
+    pets: bool,
+    max_cards: int
+) -> AsyncIterator[Dict]:
+    """在给定页面上执行搜索流程，逐个产出解析出的酒店，并把结果写入 result"""
+    ready = PageReadiness(page, timer)
+    selector_hits = result.setdefault("selector_hits", {})
+    
+    found = False
+    if BOOKING_SEARCH_MODE == "deeplink":
+        result["search_mode"] = "deeplink"
+        result["occupancy_applied"] = True
+        search_url = build_search_url(destination, checkin_date, checkout_date, adults, children, rooms,
+                                      children_ages, pets)
+        try:
+            await _open_search_url(page, ready, timer, search_url)
+            found = await _wait_for_cards(ready, timer, timeout_ms=15000)
+        except Exception as e:
+            print(f"打开直达链接时出错: {e}")
+        if not found:
+            print("直达链接未返回酒店卡片，回退到首页表单搜索...")
+            result["search_mode"] = "form_fallback"
+    else:
+        result["search_mode"] = "form"
+    
+    if not found:
+        await _submit_search_form(page, ready, timer, destination, checkin_date, checkout_date)
+        found = await _wait_for_cards(ready, timer, timeout_ms=20000)
+        # 表单按 Booking 默认的 2 位成人、1 间房搜索，其他入住条件通过结果页 URL 设置
+        if adults == 2 and children == 0 and rooms == 1 and not pets:
+            result["occupancy_applied"] = True
+        else:
+            result["occupancy_applied"] = await _apply_occupancy(
+                page, ready, timer, adults, children, rooms, children_ages, pets
+            )
+            if result["occupancy_applied"]:
+                found = await _wait_for_cards(ready, timer, timeout_ms=20000)
+    
+    # 获取搜索结果
+    try:
+        if not found:
+            result["failure"] = "cards_timeout"
+            raise TimeoutError("等待酒店卡片超时（20s）")
+        print("酒店卡片已加载")
+        
+        async for hotel in iter_property_cards(page, ready, timer, max_cards, selector_hits=selector_hits):
+            result["hotels"].append(hotel)
+            print(f"{len(result['hotels'])}. {hotel['name']} - {hotel['price']}")
+            yield hotel
         
+        if not result["hotels"]:
+            # 保存页面截图用于调试
+            print("未找到酒店元素，保存页面截图...")
+            await page.screenshot(path="debug_screenshot.png")
+            print("页面URL:", page.url)
+            result["error"] = "未找到酒店搜索结果，可能是页面结构变化或网络问题"
+            result["failure"] = "no_results"
+            return
+        
+        result["success"] = True
+    
+    except Exception as e:
+        result["error"] = f"获取搜索结果时出错: {str(e)}"
+        result.setdefault("failure", "extract_error")
+        print(result["error"])
+
+
+def build_search_url(
+    destination: str,
+    checkin_date: Optional[str] = None,
+    checkout_date: Optional[str] = None,
+    adults: int = 2,
+    children: int = 0,
+    rooms: int = 1,
+    children_ages: Optional[List[int]] = None,
+    pets: bool = False
+) -> str:
+    """根据搜索参数直接构造搜索结果页 URL（包含入住人数、房间数、儿童年龄与宠物筛选）"""
+    params = [("ss", destination), ("lang", "zh-cn")]
+    if checkin_date and checkout_date:
+        params += [("checkin", checkin_date), ("checkout", checkout_date)]
+    params += _occupancy_params(adults, children, rooms, children_ages, pets)
+    return f"{BOOKING_SEARCH_RESULTS_URL}?{urlencode(params)}"
+
+
+def _occupancy_params(
+    adults: int,
+    children: int,
+    rooms: int,
+    children_ages: Optional[List[int]],
+    pets: bool
+) -> List[Tuple[str, object]]:
+    """搜索结果页 URL 中的入住人数、房间数、儿童年龄与宠物筛选参数"""
+    params = [("group_adults", adults), ("group_children", children), ("no_rooms", rooms)]
+    # 每个儿童都需要一个年龄参数，缺失时使用默认年龄
+    ages = list(children_ages or [])
+    for i in range(children):
+        params.append(("age", ages[i] if i < len(ages) else DEFAULT_CHILD_AGE))
+    if pets:
+        # 筛选"允许携带宠物"的住宿
+        params.append(("nflt", "hotelfacility=4"))
+    return params
+
+
+def with_occupancy(
+    url: str,
+    adults: int,
+    children: int,
+    rooms: int,
+    children_ages: Optional[List[int]] = None,
+    pets: bool = False
+) -> str:
+    """把搜索结果页 URL 中的入住信息替换为给定值（保留目的地、日期等其他参数）"""
+    parts = urlsplit(url)
+    replaced = {"group_adults", "group_children", "no_rooms", "age", "req_adults", "req_children", "req_age"}
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k not in replaced]
+    occupancy = _occupancy_params(adults, children, rooms, children_ages, pets)
+    if pets:
+        # 宠物筛选与页面上已有的其他筛选条件合并为一个 nflt 参数
+        filters = [f for k, v in query if k == "nflt" for f in v.split(";") if f and f != "hotelfacility=4"]
+        query = [(k, v) for k, v in query if k != "nflt"]
+        occupancy = [(k, ";".join(filters + [v]) if k == "nflt" else v) for k, v in occupancy]
+    return urlunsplit(parts._replace(query=urlencode(query + occupancy)))
+
+
+async def _open_search_url(page, ready: PageReadiness, timer: PhaseTimer, search_url: str):
+    """直接打开搜索结果页；遇到 Cookie 确认页时处理后重新打开"""
+    print(f"正在打开搜索结果页：{search_url}")
+    with timer.phase("goto"):
+        await page.goto(search_url, timeout=30000, wait_until="domcontentloaded")
+    
+    if "pipl_consent" in page.url:
+        with timer.phase("consent"):
+            await handle_cookie_consent(page, ready)
+        if "searchresults" not in page.url:
+            with timer.phase("goto"):
+                await page.goto(search_url, timeout=30000, wait_until="domcontentloaded")
+
+
+async def _wait_for_cards(ready: PageReadiness, timer: PhaseTimer, timeout_ms: int) -> bool:
+    """等待第一张酒店卡片出现（懒加载的后续卡片在提取时逐批等待）"""
+    print("等待酒店卡片加载...")
+    with timer.phase("results_wait"):
+        return await ready.visible(PROPERTY_CARD_SELECTOR, timeout_ms=timeout_ms, name="property_cards")
+
+
+async def _apply_occupancy(
+    page,
+    ready: PageReadiness,
+    timer: PhaseTimer,
+    adults: int,
+    children: int,
+    rooms: int,
+    children_ages: Optional[List[int]],
+    pets: bool
+) -> bool:
+    """表单搜索后把入住信息写入结果页 URL 并重新打开；未进入结果页或打开失败时返回 False"""
+    if "searchresults" not in page.url:
+        print("未进入搜索结果页，无法设置入住信息")
+        return False
+    print(f"正在设置旅客信息：{adults}位成人，{children}位儿童，{rooms}间房...")
+    try:
+        await _open_search_url(page, ready, timer,
+                               with_occupancy(page.url, adults, children, rooms, children_ages, pets))
+    except Exception as e:
+        print(f"设置旅客信息时出错: {e}")
+        return False
+    return "searchresults" in page.url
+
+
+async def _submit_search_form(
+    page,
+    ready: PageReadiness,
+    timer: PhaseTimer,
+    destination: str,
+    checkin_date: Optional[str],
+    checkout_date: Optional[str]
+):
+    """通过首页搜索表单提交搜索（直达链接无结果时的回退方式）；表单只填目的地和日期"""
+    # 访问 Booking.com
+    print(f"正在访问 Booking.com，搜索目的地：{destination}...")
+    print("开始加载页面...")
+    with timer.phase("goto"):
+        await page.goto("https://booking.cn/index.zh-cn.html", timeout=30000, wait_until="domcontentloaded")
+        print("DOM 已加载")
+        # 等待出现 Cookie 确认页或目的地输入框，任一满足即可继续
+        destination_input = page.get_by_role("combobox", name="目的地？")
+        await ready.first_of({
+            "consent": lambda: ready.url_changed("", timeout_ms=8000, contains="pipl_consent", name="consent_page"),
+            "form": lambda: ready.visible(destination_input, timeout_ms=8000, name="search_form"),
+        }, timeout_ms=8000, name="home_ready")
+    
+    # 处理 Cookie 确认页面
+    print("检查 Cookie 确认页面...")
+    with timer.phase("consent"):
+        cookie_handled = await handle_cookie_consent(page, ready)
+        if cookie_handled:
+            print("Cookie 处理完成，等待搜索表单...")
+            await ready.visible(destination_input, timeout_ms=10000, name="search_form")
+        else:
+            print("无需处理 Cookie")
+    
+    # 1. 输入目的地
+    print(f"正在输入目的地：{destination}...")
+    with timer.phase("destination"):
         try:
-            # 访问 Booking.com
-            print(f"正在访问 Booking.com，搜索目的地：{destination}...")
-            print("开始加载页面...")
-            await page.goto("https://booking.cn/index.zh-cn.html", timeout=30000, wait_until="domcontentloaded")
-            print("DOM 已加载")
-            await asyncio.sleep(3)
-            
-            # 处理 Cookie 确认页面
-            print("检查 Cookie 确认页面...")
-            cookie_handled = await handle_cookie_consent(page)
-            if cookie_handled:
-                print("Cookie 处理完成，等待页面稳定...")
-                await asyncio.sleep(2)
-            else:
-                print("无需处理 Cookie")
-            
-            # 🆕 动态关闭所有可能的初始弹窗
-            print("关闭初始弹窗...")
-            await close_popups_dynamically(page)
-            await asyncio.sleep(1)
-            
-            # 1. 输入目的地
-            print(f"正在输入目的地：{destination}...")
-            # 🆕 操作前关闭弹窗
-            await close_popups_dynamically(page)
+            await destination_input.clear()
+            await destination_input.fill(destination)
+            print(f"已输入目的地：{destination}")
+            # 等待联想下拉框出现后再确认
+            await ready.visible('[data-testid="autocomplete-results"], [role="listbox"] [role="option"]',
+                                timeout_ms=3000, name="autocomplete")
+            await destination_input.press("Enter")
+            print("已按下 Enter 键")
+        except Exception as e:
+            print(f"输入目的地时出错: {e}")
+            raise
+    
+    # 2. 设置日期
+    if checkin_date and checkout_date:
+        print(f"正在设置日期：{checkin_date} 至 {checkout_date}...")
+        with timer.phase("dates"):
             try:
-                destination_input = page.get_by_role("combobox", name="目的地？")
-                await destination_input.clear()
-                await destination_input.fill(destination)
-                print(f"已输入目的地：{destination}")
-                await asyncio.sleep(2)
-                await destination_input.press("Enter")
-                print("已按下 Enter 键")
-                await asyncio.sleep(1)
-                # 🆕 操作后关闭弹窗
-                await close_popups_dynamically(page)
-            except Exception as e:
-                print(f"输入目的地时出错: {e}")
-                raise
-            
-            # 2. 设置日期
-            if checkin_date and checkout_date:
-                print(f"正在设置日期：{checkin_date} 至 {checkout_date}...")
-                try:
+                checkin = page.locator(f'span[data-date="{checkin_date}"]').first
+                # 回车选中目的地后日期选择器通常会自动弹出，未弹出时再手动打开
+                if not await checkin.is_visible():
                     date_button = page.get_by_role("button", name="入住日期 — 退房日期")
                     await date_button.click()
                     print("已打开日期选择器")
-                    await asyncio.sleep(1)
-                    
-                    checkin = page.locator(f'span[data-date="{checkin_date}"]').first
-                    await checkin.click()
-                    print(f"已选择入住日期：{checkin_date}")
-                    await asyncio.sleep(0.5)
-                    
-                    checkout = page.locator(f'span[data-date="{checkout_date}"]').first
-                    await checkout.click()
-                    print(f"已选择退房日期：{checkout_date}")
-                    await asyncio.sleep(1)
-                except Exception as e:
-                    print(f"日期选择出现问题: {e}")
-            
-            # 3. 设置旅客信息
-            if adults != 2 or children != 0 or rooms != 1:
-                print(f"正在设置旅客信息：{adults}位成人，{children}位儿童，{rooms}间房...")
-                # 这里可以添加更复杂的旅客设置逻辑
-            
-            # 🆕 搜索前再次关闭弹窗
-            print("搜索前关闭弹窗...")
-            await close_popups_dynamically(page)
-            
-            # 4. 点击搜索按钮
-            print("正在搜索...")
-            search_button = page.get_by_role("button", name="搜特价")
-            # 使用 force=True 强制点击，忽略遮挡
-            await search_button.click(force=True)
-            
-            # 等待搜索结果页面加载
-            print("等待页面跳转...")
-            try:
-                await page.wait_for_url("**/searchresults.*", timeout=15000)
-                print("页面已跳转到搜索结果")
-            except:
-                print("URL未按预期变化，继续...")
-            
-            await page.wait_for_load_state("networkidle", timeout=30000)
-            await asyncio.sleep(3)
-            
-            # 再次检查 Cookie 确认页面
-            await handle_cookie_consent(page)
-            
-            # 🆕 搜索结果页面关闭弹窗
-            print("关闭搜索结果页面弹窗...")
-            await close_popups_dynamically(page)
-            await asyncio.sleep(1)
-            
-            # 获取搜索结果
-            try:
-                # 等待页面加载完成
-                print("等待搜索结果加载...")
-                await asyncio.sleep(8)  # 给页面更多时间加载
-                
-                # 等待酒店卡片出现
-                print("等待酒店卡片加载...")
-                await page.wait_for_selector('[data-testid="property-card"]', timeout=20000)
-                print("酒店卡片已加载")
-                
-                # 获取酒店卡片
-                hotels = await page.locator('[data-testid="property-card"]').all()
-                
-                if not hotels or len(hotels) == 0:
-                    # 保存页面截图用于调试
-                    print("未找到酒店元素，保存页面截图...")
-                    await page.screenshot(path="debug_screenshot.png")
-                    print("页面URL:", page.url)
-                    result["error"] = "未找到酒店搜索结果，可能是页面结构变化或网络问题"
-                    return result
+                    await ready.visible(checkin, timeout_ms=3000, name="date_picker")
                 
-                print(f"找到 {len(hotels)} 家酒店")
+                await checkin.click()
+                print(f"已选择入住日期：{checkin_date}")
                 
-                # 提取前10个酒店信息（LLM会从中选择5个推荐）
-                for i, hotel in enumerate(hotels[:10], 1):
-                    try:
-                        hotel_info = {}
-                        
-                        # 酒店名称
-                        try:
-                            hotel_info["name"] = await hotel.locator('[data-testid="title"]').inner_text(timeout=3000)
-                        except:
-                            try:
-                                hotel_info["name"] = await hotel.locator('h3, h4').first.inner_text(timeout=3000)
-                            except:
-                                print(f"无法获取酒店 {i} 的名称，跳过")
-                                continue
-                        
-                        # 价格
-                        try:
-                            price = await hotel.locator('[data-testid="price-and-discounted-price"]').inner_text(timeout=3000)
-                            hotel_info["price"] = price
-                        except:
-                            try:
-                                price = await hotel.locator('.prco-valign-middle-helper').first.inner_text(timeout=3000)
-                                hotel_info["price"] = price
-                            except:
-                                hotel_info["price"] = "价格待询"
-                        
-                        # 评分
-                        try:
-                            score = await hotel.locator('[data-testid="review-score"]').inner_text(timeout=3000)
-                            hotel_info["score"] = score
-                        except:
-                            try:
-                                score = await hotel.locator('.bui-review-score__badge').first.inner_text(timeout=3000)
-                                hotel_info["score"] = score
-                            except:
-                                hotel_info["score"] = "暂无评分"
-                        
-                        # 位置
-                        try:
-                            location = await hotel.locator('[data-testid="address"]').inner_text(timeout=3000)
-                            hotel_info["location"] = location
-                        except:
-                            try:
-                                location = await hotel.locator('[data-testid="distance"]').inner_text(timeout=3000)
-                                hotel_info["location"] = location
-                            except:
-                                hotel_info["location"] = "位置信息待确认"
-                        
-                        # 设施/特色
-                        try:
-                            facilities = await hotel.locator('[data-testid="facility-group"]').all_inner_texts()
-                            hotel_info["facilities"] = facilities[:5] if facilities else []
-                        except:
-                            hotel_info["facilities"] = []
-                        
-                        result["hotels"].append(hotel_info)
-                        print(f"{i}. {hotel_info['name']} - {hotel_info['price']}")
-                        
-                    except Exception as e:
-                        print(f"提取酒店 {i} 信息时出错: {e}")
-                        continue
-                
-                if len(result["hotels"]) > 0:
-                    result["success"] = True
-                else:
-                    result["error"] = "成功访问页面但未能提取酒店信息"
-                        
+                checkout = page.locator(f'span[data-date="{checkout_date}"]').first
+                await checkout.click()
+                print(f"已选择退房日期：{checkout_date}")
             except Exception as e:
-                result["error"] = f"获取搜索结果时出错: {str(e)}"
-                print(result["error"])
-            
-        except Exception as e:
-            result["error"] = f"搜索过程出错: {str(e)}"
-            print(result["error"])
-            import traceback
-            traceback.print_exc()
+                print(f"日期选择出现问题: {e}")
+    
+    # 3. 点击搜索按钮（入住信息由调用方在结果页 URL 中设置）
+    print("正在搜索...")
+    with timer.phase("submit"):
+        search_button = page.get_by_role("button", name="搜特价")
+        home_url = page.url
+        # 使用 force=True 强制点击，忽略遮挡
+        await search_button.click(force=True)
         
-        finally:
-            await browser.close()
+        # 等待搜索结果页面加载
+        print("等待页面跳转...")
+        if await ready.url_changed(home_url, timeout_ms=15000, contains="searchresults", name="results_redirect"):
+            print("页面已跳转到搜索结果")
+        else:
+            print("URL未按预期变化，继续...")
     
-    return result
+    with timer.phase("consent"):
+        # 再次检查 Cookie 确认页面
+        await handle_cookie_consent(page, ready)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,290 @@
+"""
+Playwright 浏览器池
+由 FastAPI 应用生命周期管理，常驻若干 Chromium 实例，每次搜索分配一个独立的 context/page
+"""
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
+from playwright.async_api import async_playwright, Browser, Page, Playwright
+
+logger = logging.getLogger(__name__)
+
+# 抓取模式：production 为无头浏览器 + 资源拦截；debug 为有头浏览器、不拦截任何请求，便于观察
+SCRAPE_MODE = os.getenv("BOOKING_SCRAPE_MODE", "production").lower()
+
+# 池配置（均可通过环境变量调整）
+BROWSER_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", 2))            # 最多同时存在的浏览器数
+BROWSER_POOL_WARM = int(os.getenv("BROWSER_POOL_WARM", 1))            # 启动时预热、并始终保持的浏览器数
+BROWSER_MAX_PAGES = int(os.getenv("BROWSER_MAX_PAGES", 4))            # 每个浏览器同时打开的页面上限
+BROWSER_MAX_USES = int(os.getenv("BROWSER_MAX_USES", 50))             # 每个浏览器累计服务次数上限，达到后回收
+BROWSER_ACQUIRE_TIMEOUT = float(os.getenv("BROWSER_ACQUIRE_TIMEOUT", 60))  # 等待空闲页面的超时（秒）
+BROWSER_HEADLESS = os.getenv("BROWSER_HEADLESS", "true" if SCRAPE_MODE == "production" else "false").lower() == "true"
+
+# 避免被检测为机器人
+BROWSER_LAUNCH_ARGS = ['--disable-blink-features=AutomationControlled']
+
+
+class _PooledBrowser:
+    """池中的单个浏览器及其使用计数"""
+
+    def __init__(self, browser: Browser):
+        self.browser = browser
+        self.active = 0      # 当前打开的页面数
+        self.uses = 0        # 累计分配次数
+        self.retiring = False  # 崩溃或达到上限后标记为待回收
+
+    @property
+    def usable(self) -> bool:
+        return self.browser.is_connected() and not self.retiring
+
+
+class PageLease:
+    """一次页面租用：page 为独立 context 中的新页面，wait_ms 为等待分配的耗时"""
+
+    def __init__(self, page: Page, wait_ms: float):
+        self.page = page
+        self.wait_ms = wait_ms
+
+
+class BrowserPool:
+    """
+    常驻 Chromium 浏览器池
+
+    - 启动时预热 warm 个浏览器，按需扩容到 size 个
+    - 每次 lease() 分配一个全新的 context + page，用完即关闭，互不共享 Cookie
+    - 浏览器累计服务 max_uses 次或崩溃后自动回收，并补齐预热数量
+    """
+
+    def __init__(
+        self,
+        size: int = BROWSER_POOL_SIZE,
+        warm: int = BROWSER_POOL_WARM,
+        max_pages: int = BROWSER_MAX_PAGES,
+        max_uses: int = BROWSER_MAX_USES,
+        acquire_timeout: float = BROWSER_ACQUIRE_TIMEOUT,
+        headless: bool = BROWSER_HEADLESS,
+    ):
+        self.size = max(1, size)
+        self.warm = max(0, min(warm, self.size))
+        self.max_pages = max(1, max_pages)
+        self.max_uses = max(1, max_uses)
+        self.acquire_timeout = acquire_timeout
+        self.headless = headless
+
+        self._playwright: Optional[Playwright] = None
+        self._browsers: List[_PooledBrowser] = []
+        self._launching = 0
+        self._cond = asyncio.Condition()
+        self._background: set = set()
+
+        # 统计信息
+        self._acquire_count = 0
+        self._wait_total_ms = 0.0
+        self._wait_max_ms = 0.0
+        self._recycled = 0
+        self._crashed = 0
+
+    @property
+    def running(self) -> bool:
+        return self._playwright is not None
+
+    async def start(self):
+        """启动 Playwright 并预热浏览器"""
+        if self.running:
+            return
+        self._playwright = await async_playwright().start()
+        launched = await asyncio.gather(
+            *[self._launch() for _ in range(self.warm)], return_exceptions=True
+        )
+        async with self._cond:
+            for item in launched:
+                if isinstance(item, Exception):
+                    logger.error(f"预热浏览器失败: {item}")
+                else:
+                    self._browsers.append(item)
+        logger.info(f"🌐 浏览器池已启动，预热 {len(self._browsers)}/{self.size} 个浏览器")
+
+    async def stop(self):
+        """关闭所有浏览器并停止 Playwright"""
+        for task in list(self._background):
+            task.cancel()
+        async with self._cond:
+            browsers, self._browsers = self._browsers, []
+        for pb in browsers:
+            await self._close_browser(pb)
+        if self._playwright:
+            await self._playwright.stop()
+            self._playwright = None
+        logger.info("🌐 浏览器池已关闭")
+
+    @asynccontextmanager
+    async def lease(self, **context_options):
+        """
+        租用一个独立 context 中的新页面
+
+        Args:
+            context_options: 透传给 browser.new_context 的参数
+
+        Yields:
+            PageLease
+        """
+        start = time.perf_counter()
+        pb = await self._acquire()
+        wait_ms = (time.perf_counter() - start) * 1000
+        self._record_wait(wait_ms)
+
+        context = None
+        try:
+            context = await pb.browser.new_context(**context_options)
+            page = await context.new_page()
+            page.on("crash", lambda _: self._mark_crashed(pb))
+            yield PageLease(page, wait_ms)
+        finally:
+            if context is not None:
+                try:
+                    await context.close()
+                except Exception:
+                    pass
+            if not pb.browser.is_connected():
+                self._mark_crashed(pb)
+            await self._release(pb)
+
+    def stats(self) -> Dict:
+        """返回池的运行统计（包括分配等待耗时）"""
+        return {
+            "running": self.running,
+            "size": self.size,
+            "warm": self.warm,
+            "max_pages": self.max_pages,
+            "browsers": len(self._browsers),
+            "active_pages": sum(pb.active for pb in self._browsers),
+            "acquire_count": self._acquire_count,
+            "acquire_wait_avg_ms": round(self._wait_total_ms / self._acquire_count, 1) if self._acquire_count else 0.0,
+            "acquire_wait_max_ms": round(self._wait_max_ms, 1),
+            "recycled": self._recycled,
+            "crashed": self._crashed,
+        }
+
+    async def _acquire(self) -> _PooledBrowser:
+        """分配一个有空闲页面额度的浏览器，必要时启动新浏览器或等待"""
+        if not self.running:
+            raise RuntimeError("浏览器池未启动")
+
+        deadline = time.monotonic() + self.acquire_timeout
+        async with self._cond:
+            while True:
+                # 移除空闲时崩溃/断开的浏览器，腾出名额
+                dead = [pb for pb in self._browsers if pb.active == 0 and not pb.usable]
+                for pb in dead:
+                    self._browsers.remove(pb)
+                    self._spawn(self._close_browser(pb))
+                # 优先填满已有浏览器，让空闲浏览器有机会被回收
+                for pb in self._browsers:
+                    if pb.usable and pb.uses < self.max_uses and pb.active < self.max_pages:
+                        pb.active += 1
+                        pb.uses += 1
+                        return pb
+                if len(self._browsers) + self._launching < self.size:
+                    self._launching += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"等待浏览器超时（{self.acquire_timeout}s）")
+                try:
+                    await asyncio.wait_for(self._cond.wait(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    raise TimeoutError(f"等待浏览器超时（{self.acquire_timeout}s）")
+
+        try:
+            pb = await self._launch()
+        except Exception:
+            async with self._cond:
+                self._launching -= 1
+                self._cond.notify_all()
+            raise
+
+        async with self._cond:
+            self._launching -= 1
+            pb.active += 1
+            pb.uses += 1
+            self._browsers.append(pb)
+            self._cond.notify_all()
+        return pb
+
+    async def _release(self, pb: _PooledBrowser):
+        """归还页面额度；浏览器空闲且需要回收时关闭它"""
+        retire = False
+        async with self._cond:
+            pb.active -= 1
+            if pb.active == 0 and (pb.retiring or pb.uses >= self.max_uses or not pb.browser.is_connected()):
+                if pb in self._browsers:
+                    self._browsers.remove(pb)
+                    retire = True
+            self._cond.notify_all()
+
+        if retire:
+            self._recycled += 1
+            logger.info(f"♻️ 回收浏览器（累计使用 {pb.uses} 次）")
+            await self._close_browser(pb)
+            self._spawn(self._ensure_warm())
+
+    async def _ensure_warm(self):
+        """补齐预热浏览器数量"""
+        while self.running:
+            async with self._cond:
+                if len(self._browsers) + self._launching >= self.warm:
+                    return
+                self._launching += 1
+            try:
+                pb = await self._launch()
+            except Exception as e:
+                logger.error(f"补充预热浏览器失败: {e}")
+                async with self._cond:
+                    self._launching -= 1
+                return
+            async with self._cond:
+                self._launching -= 1
+                self._browsers.append(pb)
+                self._cond.notify_all()
+
+    async def _launch(self) -> _PooledBrowser:
+        browser = await self._playwright.chromium.launch(
+            headless=self.headless,
+            args=BROWSER_LAUNCH_ARGS,
+        )
+        pb = _PooledBrowser(browser)
+        browser.on("disconnected", lambda _: self._mark_crashed(pb))
+        return pb
+
+    def _mark_crashed(self, pb: _PooledBrowser):
+        if not pb.retiring:
+            pb.retiring = True
+            self._crashed += 1
+            logger.warning("⚠️ 浏览器或页面崩溃，已标记回收")
+
+    async def _close_browser(self, pb: _PooledBrowser):
+        pb.retiring = True
+        try:
+            await pb.browser.close()
+        except Exception:
+            pass
+
+    def _record_wait(self, wait_ms: float):
+        self._acquire_count += 1
+        self._wait_total_ms += wait_ms
+        self._wait_max_ms = max(self._wait_max_ms, wait_ms)
+        if wait_ms > 1000:
+            logger.info(f"⏱️ 等待浏览器页面 {wait_ms:.0f}ms")
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+
+# 应用级共享的浏览器池，由 main.py 的启动/关闭事件管理
+browser_pool = BrowserPool()
@@ -0,0 +1,318 @@
+"""
+浏览器持久化配置
+把 Cookie / localStorage（Playwright storage state）保存在配置目录中，新建的 context 直接加载，
+后续搜索无需再次通过 Cookie 确认页；同时把静态资源（脚本、样式）缓存到磁盘并通过路由回放。
+
+浏览器池中每次搜索使用独立 context，Chromium 自身的 HTTP 磁盘缓存无法跨 context 保留，
+因此静态资源缓存在路由层实现。多个 context 并发读写时，文件均先写临时文件再原子替换
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+
+def _env_list(name: str, default: str) -> List[str]:
+    return [item.strip().lower() for item in os.getenv(name, default).split(",") if item.strip()]
+
+
+# 目录中保存 Booking 的会话 Cookie，默认放在用户缓存目录而不是源码目录下；为空时不使用持久化配置
+BROWSER_PROFILE_DIR = os.getenv(
+    "BROWSER_PROFILE_DIR",
+    os.path.join(os.getenv("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "ai-travel-agent", "browser_profile"),
+)
+BROWSER_PROFILE_TTL = int(os.getenv("BROWSER_PROFILE_TTL", 24 * 3600))              # 登录态/Cookie 最长使用时长（秒）
+BROWSER_PROFILE_SAVE_INTERVAL = int(os.getenv("BROWSER_PROFILE_SAVE_INTERVAL", 600))  # 两次保存的最小间隔（秒）
+BROWSER_ASSET_CACHE_TTL = int(os.getenv("BROWSER_ASSET_CACHE_TTL", 7 * 24 * 3600))
+BROWSER_ASSET_CACHE_MAX_BYTES = int(os.getenv("BROWSER_ASSET_CACHE_MAX_BYTES", 100 * 1024 * 1024))
+BROWSER_ASSET_CACHE_TYPES = _env_list("BROWSER_ASSET_CACHE_TYPES", "script,stylesheet")
+BROWSER_ASSET_CACHE_HOSTS = _env_list("BROWSER_ASSET_CACHE_HOSTS", "bstatic.com")
+
+# 出现该页面说明已保存的 Cookie 失效
+CONSENT_URL_PATTERN = "pipl_consent"
+
+# 回放缓存时不应原样返回的响应头（body 已解压，长度由 Playwright 重新计算）
+_DROP_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "set-cookie"}
+
+
+def _atomic_write(path: str, data: bytes):
+    """先写同目录临时文件再替换，读者不会看到写了一半的文件"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _host_matches(host: str, patterns: List[str]) -> bool:
+    return any(host == p or host.endswith("." + p) for p in patterns)
+
+
+class _AssetStore:
+    """静态资源磁盘缓存（同步实现，由调用方放到线程中执行）；目录在第一次写入时创建"""
+
+    def __init__(self, directory: str, ttl: int, max_bytes: int):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._total_bytes: Optional[int] = None
+
+    @property
+    def total_bytes(self) -> int:
+        """缓存占用的字节数；首次访问时统计已有文件"""
+        if self._total_bytes is None:
+            try:
+                self._total_bytes = sum(
+                    entry.stat().st_size for entry in os.scandir(self.directory) if entry.is_file()
+                )
+            except FileNotFoundError:
+                self._total_bytes = 0
+        return self._total_bytes
+
+    def _paths(self, url: str):
+        digest = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        base = os.path.join(self.directory, digest)
+        return base + ".body", base + ".json"
+
+    def load(self, url: str) -> Optional[Dict]:
+        body_path, meta_path = self._paths(url)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if time.time() - meta["stored_at"] > self.ttl:
+                return None
+            with open(body_path, "rb") as f:
+                meta["body"] = f.read()
+            return meta
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def save(self, url: str, status: int, headers: Dict[str, str], body: bytes):
+        body_path, meta_path = self._paths(url)
+        meta = json.dumps({"url": url, "status": status, "headers": headers, "stored_at": time.time()})
+        os.makedirs(self.directory, exist_ok=True)
+        total = self.total_bytes
+        # 先写 body 再写元数据，元数据存在即表示 body 完整
+        _atomic_write(body_path, body)
+        _atomic_write(meta_path, meta.encode("utf-8"))
+        self._total_bytes = total + len(body) + len(meta)
+        if self._total_bytes > self.max_bytes:
+            self._evict()
+
+    def _evict(self):
+        """按条目（body + 元数据）的修改时间淘汰最旧的缓存，直到占用降到上限的 90%"""
+        groups: Dict[str, List] = {}
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.startswith(".tmp-"):
+                stat = entry.stat()
+                groups.setdefault(entry.name.split(".")[0], []).append((entry.path, stat.st_size, stat.st_mtime))
+        total = sum(size for files in groups.values() for _, size, _ in files)
+        for files in sorted(groups.values(), key=lambda files: max(mtime for _, _, mtime in files)):
+            if total <= self.max_bytes * 0.9:
+                break
+            for path, size, _ in files:
+                try:
+                    os.unlink(path)
+                    total -= size
+                except OSError:
+                    continue
+        self._total_bytes = total
+
+
+class ProfileSession:
+    """单次搜索对持久化配置的使用：加载登录态、挂载静态资源缓存、结束后保存或作废"""
+
+    def __init__(self, profile: "BrowserProfile"):
+        self.profile = profile
+        self.state_loaded = False
+        self.consent_seen = False
+        self.asset_hits = 0
+        self.asset_misses = 0
+
+    def context_options(self) -> Dict:
+        """新建 context 时使用的参数（包含已保存的 storage state）"""
+        state = self.profile.load_state()
+        self.state_loaded = state is not None
+        return {"storage_state": state} if state else {}
+
+    async def install(self, page):
+        """注册静态资源缓存路由，并监听是否出现 Cookie 确认页"""
+        page.on("framenavigated", self._on_navigated)
+        if self.profile.assets:
+            await page.route("**/*", self._handle_route)
+
+    def _on_navigated(self, frame):
+        if frame.parent_frame is None and CONSENT_URL_PATTERN in frame.url:
+            self.consent_seen = True
+
+    async def _handle_route(self, route):
+        request = route.request
+        host = (urlsplit(request.url).hostname or "").lower()
+        if (
+            request.method != "GET"
+            or request.resource_type not in BROWSER_ASSET_CACHE_TYPES
+            or not _host_matches(host, BROWSER_ASSET_CACHE_HOSTS)
+        ):
+            await route.fallback()
+            return
+
+        cached = await asyncio.to_thread(self.profile.assets.load, request.url)
+        if cached:
+            self.asset_hits += 1
+            self.profile.asset_hits += 1
+            await route.fulfill(status=cached["status"], headers=cached["headers"], body=cached["body"])
+            return
+
+        self.asset_misses += 1
+        self.profile.asset_misses += 1
+        try:
+            response = await route.fetch()
+        except Exception:
+            # 浏览器已关闭或网络错误，交给后续路由/浏览器自行处理
+            await route.fallback()
+            return
+        body = await response.body()
+        headers = {k: v for k, v in response.headers.items() if k.lower() not in _DROP_HEADERS}
+        cache_control = response.headers.get("cache-control", "")
+        if response.status == 200 and "no-store" not in cache_control:
+            try:
+                await asyncio.to_thread(self.profile.assets.save, request.url, response.status, headers, body)
+            except OSError as e:
+                logger.error(f"写入静态资源缓存失败: {e}")
+        await route.fulfill(status=response.status, headers=headers, body=body)
+
+    async def finish(self, page, success: bool):
+        """
+        搜索结束（context 关闭前）调用
+        已加载的登录态仍触发了确认页说明已失效：先作废，搜索成功时再保存确认后的新状态
+        """
+        if self.consent_seen and self.state_loaded:
+            logger.info("已保存的浏览器登录态失效（再次出现 Cookie 确认页），重新保存")
+            await self.profile.invalidate()
+        if success:
+            await self.profile.save_state(page.context, force=self.consent_seen)
+
+    def stats(self) -> Dict:
+        return {
+            "state_loaded": self.state_loaded,
+            "consent_seen": self.consent_seen,
+            "asset_hits": self.asset_hits,
+            "asset_misses": self.asset_misses,
+        }
+
+
+class BrowserProfile:
+    """应用级共享的浏览器持久化配置目录"""
+
+    def __init__(
+        self,
+        directory: str = BROWSER_PROFILE_DIR,
+        ttl: int = BROWSER_PROFILE_TTL,
+        save_interval: int = BROWSER_PROFILE_SAVE_INTERVAL,
+    ):
+        self.directory = directory
+        self.ttl = ttl
+        self.save_interval = save_interval
+        self.state_path = os.path.join(directory, "storage_state.json") if directory else ""
+        # 目录在第一次保存时才创建，导入模块不会在磁盘上留下任何文件
+        self.assets: Optional[_AssetStore] = _AssetStore(
+            os.path.join(directory, "assets"), BROWSER_ASSET_CACHE_TTL, BROWSER_ASSET_CACHE_MAX_BYTES
+        ) if directory else None
+
+        self._state: Optional[Dict] = None
+        self._state_saved_at = 0.0
+        self._loaded_from_disk = False
+        self._lock = asyncio.Lock()
+
+        # 统计信息
+        self.state_loads = 0
+        self.state_saves = 0
+        self.invalidations = 0
+        self.asset_hits = 0
+        self.asset_misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory)
+
+    def session(self) -> ProfileSession:
+        return ProfileSession(self)
+
+    def load_state(self) -> Optional[Dict]:
+        """返回仍在有效期内的 storage state；没有或已过期时返回 None"""
+        if not self.enabled:
+            return None
+        if not self._loaded_from_disk:
+            self._loaded_from_disk = True
+            try:
+                with open(self.state_path, "r", encoding="utf-8") as f:
+                    self._state = json.load(f)
+                self._state_saved_at = os.path.getmtime(self.state_path)
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError) as e:
+                logger.error(f"读取浏览器登录态失败: {e}")
+        if self._state is None or time.time() - self._state_saved_at > self.ttl:
+            return None
+        self.state_loads += 1
+        return self._state
+
+    async def save_state(self, context, force: bool = False):
+        """保存 context 当前的 storage state；未到保存间隔且未强制时跳过"""
+        if not self.enabled:
+            return
+        fresh = self._state is not None and time.time() - self._state_saved_at < self.save_interval
+        if fresh and not force:
+            return
+        async with self._lock:
+            try:
+                state = await context.storage_state()
+                payload = json.dumps(state, ensure_ascii=False).encode("utf-8")
+                await asyncio.to_thread(os.makedirs, self.directory, exist_ok=True)
+                await asyncio.to_thread(_atomic_write, self.state_path, payload)
+            except Exception as e:
+                logger.error(f"保存浏览器登录态失败: {e}")
+                return
+            self._state = state
+            self._state_saved_at = time.time()
+            self.state_saves += 1
+
+    async def invalidate(self):
+        """作废已保存的登录态"""
+        async with self._lock:
+            self._state = None
+            self._state_saved_at = 0.0
+            self.invalidations += 1
+            try:
+                os.unlink(self.state_path)
+            except OSError:
+                pass
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "state_age_s": round(time.time() - self._state_saved_at) if self._state else None,
+            "state_loads": self.state_loads,
+            "state_saves": self.state_saves,
+            "invalidations": self.invalidations,
+            "asset_hits": self.asset_hits,
+            "asset_misses": self.asset_misses,
+            "asset_bytes": self.assets.total_bytes if self.assets else 0,
+        }
+
+
+# 应用级共享的浏览器持久化配置
+browser_profile = BrowserProfile()
@@ -0,0 +1,236 @@
+"""
+酒店搜索结果缓存
+按规范化后的搜索参数缓存结果：新鲜期内直接命中；过期但仍在陈旧窗口内时立即返回旧结果并在后台刷新。
+内存层按条目数和占用字节数做 LRU 淘汰，可选 SQLite 持久层使缓存在重启后保留
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+HOTEL_CACHE_TTL = int(os.getenv("HOTEL_CACHE_TTL", 1800))                # 新鲜期（秒）
+HOTEL_CACHE_STALE_TTL = int(os.getenv("HOTEL_CACHE_STALE_TTL", 6 * 3600))  # 过期后仍可返回旧结果的时长（秒）
+HOTEL_CACHE_MAX_ENTRIES = int(os.getenv("HOTEL_CACHE_MAX_ENTRIES", 256))
+HOTEL_CACHE_MAX_BYTES = int(os.getenv("HOTEL_CACHE_MAX_BYTES", 20 * 1024 * 1024))
+HOTEL_CACHE_SQLITE_PATH = os.getenv("HOTEL_CACHE_SQLITE_PATH", "")       # 为空时只使用内存缓存
+
+# 只描述某一次抓取的字段（耗时、等待浏览器、合并、拦截与弹窗统计），不随结果缓存，
+# 否则命中时会被当作新的测量值再次记录
+PER_SCRAPE_FIELDS = ("cache", "coalesced", "pool_wait_ms", "timings", "telemetry", "network", "popups", "profile")
+
+
+def normalize_search_key(params: Dict) -> str:
+    """
+    把搜索参数规范化为缓存键
+    目的地去除首尾及多余空白、统一全/半角与大小写；人数等缺省值按搜索默认值补齐
+    """
+    destination = unicodedata.normalize("NFKC", str(params.get("destination") or ""))
+    destination = " ".join(destination.split()).casefold()
+    key = [
+        destination,
+        (params.get("checkin_date") or "").strip(),
+        (params.get("checkout_date") or "").strip(),
+        int(params.get("adults") or 2),
+        int(params.get("children") or 0),
+        int(params.get("rooms") or 1),
+        sorted(int(age) for age in (params.get("children_ages") or [])),
+        bool(params.get("pets", False)),
+    ]
+    return json.dumps(key, ensure_ascii=False, separators=(",", ":"))
+
+
+class _Entry:
+    __slots__ = ("payload", "stored_at", "size")
+
+    def __init__(self, payload: str, stored_at: float):
+        self.payload = payload
+        self.stored_at = stored_at
+        self.size = len(payload.encode("utf-8"))
+
+
+class _SqliteStore:
+    """SQLite 持久层（同步实现，由调用方放到线程中执行）"""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS hotel_cache ("
+            "key TEXT PRIMARY KEY, stored_at REAL NOT NULL, payload TEXT NOT NULL)"
+        )
+        self._conn.commit()
+
+    def load(self, key: str) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, stored_at FROM hotel_cache WHERE key = ?", (key,)
+            ).fetchone()
+        return row
+
+    def save(self, key: str, payload: str, stored_at: float, expire_before: float):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO hotel_cache (key, stored_at, payload) VALUES (?, ?, ?)",
+                (key, stored_at, payload),
+            )
+            # 顺便清理超出陈旧窗口的记录
+            self._conn.execute("DELETE FROM hotel_cache WHERE stored_at < ?", (expire_before,))
+            self._conn.commit()
+
+
+class HotelResultCache:
+    """带后台刷新（stale-while-revalidate）的酒店搜索结果缓存"""
+
+    def __init__(
+        self,
+        ttl: int = HOTEL_CACHE_TTL,
+        stale_ttl: int = HOTEL_CACHE_STALE_TTL,
+        max_entries: int = HOTEL_CACHE_MAX_ENTRIES,
+        max_bytes: int = HOTEL_CACHE_MAX_BYTES,
+        sqlite_path: str = HOTEL_CACHE_SQLITE_PATH,
+    ):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._store = _SqliteStore(sqlite_path) if sqlite_path else None
+        self._refreshing: Dict[str, asyncio.Task] = {}
+
+        # 统计信息
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.evictions = 0
+
+    async def get_or_fetch(
+        self,
+        key: str,
+        fetch: Callable[[], Awaitable[Dict]],
+        refresh: Optional[Callable[[], Awaitable[Dict]]] = None,
+    ) -> Dict:
+        """
+        读取缓存，未命中时调用 fetch 获取并写入缓存
+
+        Args:
+            key: 缓存键
+            fetch: 未命中时获取结果的协程函数
+            refresh: 后台刷新陈旧条目使用的协程函数，默认与 fetch 相同
+
+        返回结果的 "cache" 字段标明来源：hit / stale / miss
+        """
+        entry = await self._lookup(key)
+        now = time.time()
+
+        if entry and now - entry.stored_at <= self.ttl:
+            self.hits += 1
+            return self._load(entry, "hit")
+
+        if entry and now - entry.stored_at <= self.ttl + self.stale_ttl:
+            self.stale_hits += 1
+            self._refresh_in_background(key, refresh or fetch)
+            return self._load(entry, "stale")
+
+        self.misses += 1
+        result = await fetch()
+        await self.set(key, result)
+        result["cache"] = "miss"
+        return result
+
+    async def set(self, key: str, result: Dict):
+        """写入缓存；只缓存成功的搜索结果，去掉单次抓取的统计字段"""
+        if not result.get("success"):
+            return
+        payload = json.dumps(
+            {k: v for k, v in result.items() if k not in PER_SCRAPE_FIELDS}, ensure_ascii=False
+        )
+        entry = _Entry(payload, time.time())
+        self._put(key, entry)
+        if self._store:
+            try:
+                await asyncio.to_thread(
+                    self._store.save, key, payload, entry.stored_at,
+                    entry.stored_at - self.ttl - self.stale_ttl,
+                )
+            except Exception as e:
+                logger.error(f"写入酒店缓存数据库失败: {e}")
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.stale_hits) / lookups, 3) if lookups else 0.0,
+            "refreshes": self.refreshes,
+            "evictions": self.evictions,
+        }
+
+    async def _lookup(self, key: str) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry:
+            self._entries.move_to_end(key)
+            return entry
+        if not self._store:
+            return None
+        try:
+            row = await asyncio.to_thread(self._store.load, key)
+        except Exception as e:
+            logger.error(f"读取酒店缓存数据库失败: {e}")
+            return None
+        if not row:
+            return None
+        entry = _Entry(row[0], row[1])
+        self._put(key, entry)
+        return entry
+
+    def _put(self, key: str, entry: _Entry):
+        old = self._entries.pop(key, None)
+        if old:
+            self._bytes -= old.size
+        self._entries[key] = entry
+        self._bytes += entry.size
+        # LRU 淘汰：超过条目数或字节上限时移除最久未使用的条目
+        while len(self._entries) > 1 and (
+            len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+        ):
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+            self.evictions += 1
+
+    def _load(self, entry: _Entry, source: str) -> Dict:
+        result = json.loads(entry.payload)
+        result["cache"] = source
+        return result
+
+    def _refresh_in_background(self, key: str, fetch: Callable[[], Awaitable[Dict]]):
+        if key in self._refreshing:
+            return
+
+        async def refresh():
+            try:
+                result = await fetch()
+                await self.set(key, result)
+                self.refreshes += 1
+            except Exception as e:
+                logger.error(f"后台刷新酒店缓存失败: {e}")
+            finally:
+                self._refreshing.pop(key, None)
+
+        self._refreshing[key] = asyncio.create_task(refresh())
+
+
+# 应用级共享的酒店结果缓存
+hotel_cache = HotelResultCache()
@@ -0,0 +1,305 @@
+"""
+增量 JSON 解析
+LLM 流式输出 JSON 时逐片喂入：
+- JsonArrayStream：目标数组（如顶层对象的 "itinerary"）中的每个元素一闭合就解析产出，无需等待整个响应结束
+- JsonObjectExtractor：单次扫描提取第一个完整的 JSON 对象，同时修复 LLM 常见的格式问题
+  （代码块标记、前后说明文字、注释、尾随逗号），并记录实际做了哪些修复
+两者都会跳过根对象之前的多余文字（如 ```json）
+"""
+import json
+import logging
+import re
+from typing import Any, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+
+class _Frame:
+    __slots__ = ("kind", "key", "expect_key", "start")
+
+    def __init__(self, kind: str, start: int):
+        self.kind = kind            # "{" 或 "["
+        self.key = None             # 对象中最近读到的键
+        self.expect_key = kind == "{"
+        self.start = start          # 该容器在文本中的起始位置
+
+
+class JsonArrayStream:
+    """
+    用法：
+        days = JsonArrayStream(("itinerary",))
+        for chunk in llm_chunks:
+            for day in days.feed(chunk):   # 每闭合一个 itinerary 元素产出一次
+                ...
+        days.text                           # 完整的原始文本，流结束后做最终解析
+    """
+
+    def __init__(self, path: Sequence[str]):
+        self.path = tuple(path)
+        self.text = ""
+        self.items_emitted = 0
+        self.items_failed = 0
+        self._pos = 0
+        self._stack: List[_Frame] = []
+        self._started = False
+        self._done = False
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+
+    def _at_target_array(self) -> bool:
+        """栈顶是否正是目标数组：根对象起依次经过 path 中的各个键"""
+        depth = len(self.path)
+        if len(self._stack) != depth + 1 or self._stack[-1].kind != "[":
+            return False
+        return all(
+            frame.kind == "{" and frame.key == key for frame, key in zip(self._stack, self.path)
+        )
+
+    def feed(self, chunk: str) -> List[Any]:
+        self.text += chunk
+        items: List[Any] = []
+        text = self.text
+        while self._pos < len(text) and not self._done:
+            ch = text[self._pos]
+            pos = self._pos
+            self._pos += 1
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    top = self._stack[-1]
+                    if top.kind == "{" and top.expect_key:
+                        try:
+                            top.key = json.loads(text[self._string_start:pos + 1])
+                        except ValueError:
+                            top.key = None
+                        top.expect_key = False
+                continue
+
+            if not self._started:
+                if ch == "{":
+                    self._started = True
+                    self._stack.append(_Frame("{", pos))
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = pos
+            elif ch in "{[":
+                self._stack.append(_Frame(ch, pos))
+            elif ch in "}]":
+                frame = self._stack.pop()
+                if not self._stack:
+                    self._done = True
+                elif self._at_target_array() and frame.kind == "{":
+                    self._emit(text[frame.start:pos + 1], items)
+            elif ch == "," and self._stack[-1].kind == "{":
+                self._stack[-1].expect_key = True
+        return items
+
+    def _emit(self, raw: str, items: List[Any]):
+        try:
+            items.append(json.loads(raw))
+            self.items_emitted += 1
+        except ValueError as e:
+            # 单个元素格式有误时跳过，最终结果仍以完整文本的解析为准
+            self.items_failed += 1
+            logger.warning(f"增量解析数组元素失败: {e}; 内容前100字符: {raw[:100]}")
+
+    @property
+    def complete(self) -> bool:
+        """根对象是否已闭合"""
+        return self._done
+
+
+# 修复类型
+REPAIR_CODE_FENCE = "code_fence"          # ```json ... ``` 代码块标记
+REPAIR_PREFIX_TEXT = "prefix_text"        # JSON 之前的说明文字
+REPAIR_SUFFIX_TEXT = "suffix_text"        # JSON 之后的说明文字
+REPAIR_COMMENTS = "comments"              # // 或 /* */ 注释
+REPAIR_TRAILING_COMMA = "trailing_comma"  # 对象/数组末尾多余的逗号
+
+# 一次跳过字符串、数字、字面量、冒号和空白，直到下一个结构字符 { } [ ] , / 或未闭合的字符串
+_SKIP_RE = re.compile(r'(?:[^"{}\[\],/]+|"[^"\\]*(?:\\.[^"\\]*)*")*')
+_FENCE_RE = re.compile(r"```(?:json)?", re.IGNORECASE)
+_DECODER = json.JSONDecoder()
+
+
+class JsonObjectExtractor:
+    """
+    单次扫描、可逐片喂入的 JSON 对象提取器
+
+    扫描时直接去掉字符串之外的注释和尾随逗号，根对象闭合后只调用一次 json.loads；
+    字符串和标量由正则整段跳过，Python 层只处理括号、逗号和注释
+
+    用法：
+        extractor = JsonObjectExtractor()
+        for chunk in llm_chunks:
+            extractor.feed(chunk)
+        data = extractor.result()      # 未找到完整对象或解析失败时为 None
+        extractor.repairs              # 如 ["code_fence", "trailing_comma"]
+
+        extractor = JsonObjectExtractor.parse(text)   # 已有完整文本时
+    """
+
+    def __init__(self):
+        self.repairs: List[str] = []
+        self.error: Optional[str] = None
+        self._buf = ""                 # 尚未扫描完的尾部（被拆开的字符串、注释开头等）
+        self._out: List[str] = []      # 修复后的根对象文本片段
+        self._prefix: List[str] = []
+        self._suffix: List[str] = []
+        self._state = "prefix"         # prefix / value / line_comment / block_comment / done
+        self._depth = 0
+        self._pending_comma = False    # 逗号先不输出，确认后面不是 } 或 ] 再补上
+        self._parsed: Any = None
+        self._parse_done = False
+
+    @classmethod
+    def parse(cls, text: str) -> "JsonObjectExtractor":
+        """
+        一次性提取完整文本中的 JSON 对象
+        先从第一个 { 起直接解码（干净的输出只需这一遍 C 实现的解析），失败时才逐段扫描修复
+        """
+        extractor = cls()
+        start = text.find("{")
+        if start >= 0:
+            try:
+                obj, end = _DECODER.raw_decode(text, start)
+            except ValueError:
+                pass
+            else:
+                extractor._note_outer_text(text[:start], REPAIR_PREFIX_TEXT)
+                extractor._note_outer_text(text[end:], REPAIR_SUFFIX_TEXT)
+                extractor._state = "done"
+                extractor._parsed, extractor._parse_done = obj, True
+                return extractor
+        extractor.feed(text)
+        return extractor
+
+    def _repair(self, kind: str):
+        if kind not in self.repairs:
+            self.repairs.append(kind)
+
+    def _note_outer_text(self, text: str, repair_kind: str):
+        """根对象前后的文字：区分代码块标记与说明文字"""
+        if _FENCE_RE.search(text):
+            self._repair(REPAIR_CODE_FENCE)
+        if _FENCE_RE.sub("", text).strip():
+            self._repair(repair_kind)
+
+    def feed(self, chunk: str) -> bool:
+        """喂入一段文本，返回根对象是否已闭合"""
+        buf = self._buf + chunk
+        i, n = 0, len(buf)
+        out = self._out
+        copy_from = 0                  # buf 中尚未写入 out 的保留文本起点
+        pending = self._pending_comma
+        state = self._state
+        while i < n:
+            if state == "value":
+                j = _SKIP_RE.match(buf, i).end()
+                if j > i:
+                    if pending and not buf[i:j].isspace():
+                        out.append(buf[copy_from:i])
+                        out.append(",")
+                        copy_from, pending = i, False
+                    i = j
+                    if i >= n:
+                        break
+                c = buf[i]
+                if c == '"':
+                    break                      # 字符串还没输出完，等下一片
+                if c == ",":
+                    out.append(buf[copy_from:i])
+                    if pending:
+                        out.append(",")
+                    copy_from, pending = i + 1, True
+                    i += 1
+                elif c in "}]":
+                    if pending:
+                        self._repair(REPAIR_TRAILING_COMMA)
+                        pending = False
+                    i += 1
+                    self._depth -= 1
+                    if self._depth == 0:
+                        out.append(buf[copy_from:i])
+                        copy_from, state = i, "done"
+                elif c in "{[":
+                    if pending:
+                        out.append(buf[copy_from:i])
+                        out.append(",")
+                        copy_from, pending = i, False
+                    self._depth += 1
+                    i += 1
+                else:  # "/"
+                    if i + 1 >= n:
+                        break                  # 可能是注释开头，等下一片
+                    if buf[i + 1] in "/*":
+                        self._repair(REPAIR_COMMENTS)
+                        out.append(buf[copy_from:i])
+                        state = "line_comment" if buf[i + 1] == "/" else "block_comment"
+                        i += 2
+                        copy_from = i
+                    else:
+                        if pending:
+                            out.append(buf[copy_from:i])
+                            out.append(",")
+                            copy_from, pending = i, False
+                        i += 1
+            elif state == "line_comment":
+                end = buf.find("\n", i)
+                i = n if end < 0 else end
+                copy_from = i
+                if end >= 0:
+                    state = "value"
+            elif state == "block_comment":
+                end = buf.find("*/", i)
+                if end < 0:
+                    i = copy_from = max(i, n - 1)  # 保留可能是 "*/" 前半的最后一个字符
+                    break
+                i = copy_from = end + 2
+                state = "value"
+            elif state == "prefix":
+                start = buf.find("{", i)
+                if start < 0:
+                    self._prefix.append(buf[i:])
+                    i = n
+                else:
+                    self._prefix.append(buf[i:start])
+                    self._note_outer_text("".join(self._prefix), REPAIR_PREFIX_TEXT)
+                    self._depth = 1
+                    state = "value"
+                    copy_from, i = start, start + 1
+            else:  # done
+                self._suffix.append(buf[i:])
+                i = n
+        if state == "value":
+            out.append(buf[copy_from:i])
+        self._buf = buf[i:]
+        self._state = state
+        self._pending_comma = pending
+        return state == "done"
+
+    @property
+    def complete(self) -> bool:
+        return self._state == "done"
+
+    def result(self) -> Optional[Any]:
+        """解析修复后的根对象；未闭合或解析失败时返回 None（失败原因见 error）"""
+        if not self.complete:
+            self.error = self.error or "未找到完整的JSON对象"
+            return None
+        if not self._parse_done:
+            self._parse_done = True
+            self._note_outer_text("".join(self._suffix), REPAIR_SUFFIX_TEXT)
+            try:
+                self._parsed = json.loads("".join(self._out))
+            except ValueError as e:
+                self.error = str(e)
+        return self._parsed
@@ -0,0 +1,180 @@
+"""
+LLM 网关
+应用内所有 LLM 调用共享一个 AsyncOpenAI 客户端及其 HTTP 连接池（keep-alive 复用连接），
+调用不阻塞事件循环，可按调用设置超时；统计进行中的请求数、连接池饱和度、耗时与首 token 时间
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import AsyncIterator, Dict, Optional
+
+import httpx
+from openai import AsyncOpenAI
+
+from core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "https://ark.cn-beijing.volces.com/api/v3")
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", 32))                 # 连接池上限（同时进行的请求数）
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", 16))  # 保持的空闲连接数
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", 60))              # 空闲连接保留时长（秒）
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", 5))
+LLM_POOL_TIMEOUT = float(os.getenv("LLM_POOL_TIMEOUT", 30))                      # 连接池满时等待空闲连接的时长
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 120))                               # 默认的单次调用读取超时
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 2))
+
+LLM_IN_FLIGHT = metrics.gauge("llm_requests_in_flight", "进行中的 LLM 请求数", ("call",))
+LLM_POOL_SATURATION = metrics.gauge("llm_pool_saturation", "进行中的 LLM 请求数占连接池上限的比例")
+LLM_POOL_SATURATED = metrics.counter(
+    "llm_pool_saturated_total", "发起时连接池已满、需要排队等待连接的 LLM 请求数", ("call",)
+)
+LLM_REQUEST_SECONDS = metrics.histogram(
+    "llm_request_duration_seconds", "LLM 请求耗时（流式请求到最后一个片段；outcome 为 ok / error / cancelled）", ("call", "outcome")
+)
+LLM_FIRST_TOKEN_SECONDS = metrics.histogram(
+    "llm_time_to_first_token_seconds", "流式 LLM 请求收到第一个内容片段的时间", ("call",)
+)
+
+
+class LLMGateway:
+    """
+    共享的 LLM 调用入口
+
+    用法：
+        response = await llm_gateway.complete("chat", model=..., messages=[...])
+        async for text in llm_gateway.stream("recommendation", model=..., messages=[...]):
+            ...
+    """
+
+    def __init__(
+        self,
+        base_url: str = LLM_BASE_URL,
+        max_connections: int = LLM_MAX_CONNECTIONS,
+        max_keepalive_connections: int = LLM_MAX_KEEPALIVE_CONNECTIONS,
+        timeout: float = LLM_TIMEOUT,
+    ):
+        self.base_url = base_url
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.timeout = timeout
+        self._client: Optional[AsyncOpenAI] = None
+        self._http: Optional[httpx.AsyncClient] = None
+
+        # 统计信息
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.saturated = 0
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        """首次使用时创建（此时环境变量已由 load_dotenv 加载）"""
+        if self._client is None:
+            self._http = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive_connections,
+                    keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+                ),
+                timeout=self._timeout(None),
+            )
+            self._client = AsyncOpenAI(
+                base_url=self.base_url,
+                api_key=os.environ.get("ARK_API_KEY"),
+                http_client=self._http,
+                max_retries=LLM_MAX_RETRIES,
+            )
+        return self._client
+
+    def _timeout(self, timeout: Optional[float]) -> httpx.Timeout:
+        return httpx.Timeout(timeout or self.timeout, connect=LLM_CONNECT_TIMEOUT, pool=LLM_POOL_TIMEOUT)
+
+    def _begin(self, call: str):
+        if self.in_flight >= self.max_connections:
+            self.saturated += 1
+            LLM_POOL_SATURATED.inc(call=call)
+            logger.warning(f"LLM 连接池已满（{self.in_flight}/{self.max_connections}），{call} 请求排队等待连接")
+        self.in_flight += 1
+        self.requests += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        LLM_IN_FLIGHT.inc(call=call)
+        LLM_POOL_SATURATION.set(self.in_flight / self.max_connections)
+
+    def _end(self, call: str, started: float, outcome: str):
+        self.in_flight -= 1
+        if outcome == "error":
+            self.errors += 1
+        LLM_IN_FLIGHT.dec(call=call)
+        LLM_POOL_SATURATION.set(self.in_flight / self.max_connections)
+        LLM_REQUEST_SECONDS.observe(time.perf_counter() - started, call=call, outcome=outcome)
+
+    async def complete(self, call: str, timeout: Optional[float] = None, **kwargs):
+        """
+        非流式调用，返回完整的 ChatCompletion
+
+        Args:
+            call: 调用名称，用于指标标签（如 "intent"、"plan_generation"）
+            timeout: 本次调用的读取超时（秒），默认 LLM_TIMEOUT
+            kwargs: 透传给 chat.completions.create 的参数
+        """
+        started = time.perf_counter()
+        self._begin(call)
+        outcome = "error"
+        try:
+            response = await self.client.chat.completions.create(timeout=self._timeout(timeout), **kwargs)
+            outcome = "ok"
+            return response
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        finally:
+            self._end(call, started, outcome)
+
+    async def stream(self, call: str, timeout: Optional[float] = None, **kwargs) -> AsyncIterator[str]:
+        """流式调用，逐个产出非空的内容片段；调用方提前停止迭代时关闭底层连接"""
+        started = time.perf_counter()
+        self._begin(call)
+        outcome = "error"
+        response = None
+        try:
+            response = await self.client.chat.completions.create(
+                timeout=self._timeout(timeout), stream=True, **kwargs
+            )
+            first = True
+            async for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if first:
+                        first = False
+                        LLM_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - started, call=call)
+                    yield chunk.choices[0].delta.content
+            outcome = "ok"
+        except (GeneratorExit, asyncio.CancelledError):
+            outcome = "cancelled"
+            raise
+        finally:
+            if response is not None and outcome != "ok":
+                await response.close()
+            self._end(call, started, outcome)
+
+    async def close(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+            self._client = None
+
+    def stats(self) -> Dict:
+        return {
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "max_connections": self.max_connections,
+            "requests": self.requests,
+            "errors": self.errors,
+            "saturated": self.saturated,
+        }
+
+
+# 应用级共享的 LLM 网关
+llm_gateway = LLMGateway()
@@ -0,0 +1,126 @@
+"""
+页面就绪等待
+用具体条件（元素可见、URL 变化、元素数量增加）代替固定 sleep，
+每个条件都有上限时间，并按阶段记录耗时
+"""
+import asyncio
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Union
+
+from playwright.async_api import Locator, Page, TimeoutError as PlaywrightTimeoutError
+
+
+class PhaseTimer:
+    """按阶段累计耗时（同名阶段多次执行时累加），并记录触达上限的等待"""
+
+    def __init__(self):
+        self._start = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.timeouts: List[str] = []
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - start) * 1000)
+
+    def add(self, name: str, elapsed_ms: float):
+        self.phases[name] = self.phases.get(name, 0.0) + elapsed_ms
+
+    def timeout(self, name: str):
+        self.timeouts.append(name)
+
+    def as_dict(self) -> Dict:
+        return {
+            "phases": {name: round(ms, 1) for name, ms in self.phases.items()},
+            "total_ms": round((time.perf_counter() - self._start) * 1000, 1),
+            "timeouts": list(self.timeouts),
+        }
+
+
+class PageReadiness:
+    """
+    绑定到单个页面的就绪等待器
+
+    所有 wait 方法在条件满足时返回真值，超过上限时返回假值并记录到 timer.timeouts，
+    不抛出异常，由调用方决定是否继续
+    """
+
+    def __init__(self, page: Page, timer: Optional[PhaseTimer] = None):
+        self.page = page
+        self.timer = timer or PhaseTimer()
+
+    def _timed_out(self, name: str):
+        self.timer.timeout(name)
+        print(f"等待 {name} 超时，继续执行")
+
+    async def visible(self, target: Union[str, Locator], timeout_ms: int, name: str = "visible") -> bool:
+        """等待元素可见"""
+        locator = self.page.locator(target) if isinstance(target, str) else target
+        try:
+            await locator.first.wait_for(state="visible", timeout=timeout_ms)
+            return True
+        except PlaywrightTimeoutError:
+            self._timed_out(name)
+            return False
+
+    async def url_changed(
+        self,
+        old_url: str,
+        timeout_ms: int,
+        contains: Optional[str] = None,
+        name: str = "url_changed",
+    ) -> bool:
+        """等待 URL 离开 old_url（可要求新 URL 包含指定片段）"""
+        def predicate(url: str) -> bool:
+            return url != old_url and (contains is None or contains in url)
+
+        try:
+            await self.page.wait_for_url(predicate, timeout=timeout_ms, wait_until="commit")
+            return True
+        except PlaywrightTimeoutError:
+            self._timed_out(name)
+            return False
+
+    async def count_above(self, selector: str, count: int, timeout_ms: int) -> int:
+        """
+        等待匹配元素数量超过 count，返回新的数量；超时返回 0
+        超时表示数量已稳定，是正常结束条件，不计入 timeouts
+        """
+        locator = self.page.locator(selector)
+        deadline = time.monotonic() + timeout_ms / 1000
+        while True:
+            current = await locator.count()
+            if current > count:
+                return current
+            if time.monotonic() >= deadline:
+                return 0
+            await asyncio.sleep(0.1)
+
+    async def first_of(self, waits: Dict[str, Callable], timeout_ms: int, name: str = "first_of") -> Optional[str]:
+        """
+        并发等待多个条件，返回最先满足的条件名；全部失败或超时返回 None
+
+        Args:
+            waits: {条件名: 返回协程的无参函数}
+        """
+        tasks = {asyncio.ensure_future(factory()): key for key, factory in waits.items()}
+        pending = set(tasks)
+        deadline = time.monotonic() + timeout_ms / 1000
+        try:
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if not task.cancelled() and task.exception() is None and task.result():
+                        return tasks[task]
+            self._timed_out(name)
+            return None
+        finally:
+            for task in pending:
+                task.cancel()
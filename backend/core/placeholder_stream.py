@@ -0,0 +1,76 @@
+"""
+流式占位符识别
+在 LLM 逐片输出的文本中识别 [HOTEL_CARD:X] 这类占位符，占位符被拆在多个片段之间时
+先暂存可能属于占位符的尾部，确认后再输出，文本部分原样透传
+"""
+import re
+from typing import List, Tuple
+
+# 占位符值的最大长度，超过仍未闭合则视为普通文本
+_MAX_VALUE_LEN = 16
+
+
+class PlaceholderScanner:
+    """
+    用法：
+        scanner = PlaceholderScanner("[HOTEL_CARD:", "]")
+        for kind, value in scanner.feed(chunk):   # kind 为 "text" 或 "placeholder"
+            ...
+        for kind, value in scanner.flush():       # 流结束时输出暂存的文本
+            ...
+    """
+
+    def __init__(self, prefix: str, suffix: str = "]", value_pattern: str = r"\d{1,4}"):
+        self.prefix = prefix
+        self.suffix = suffix
+        self._value_re = re.compile(value_pattern)
+        self._pending = ""
+
+    def _partial_prefix_len(self, text: str, start: int) -> int:
+        """text 末尾（start 之后）与占位符前缀开头重合的长度"""
+        for k in range(min(len(self.prefix) - 1, len(text) - start), 0, -1):
+            if text.endswith(self.prefix[:k]):
+                return k
+        return 0
+
+    def feed(self, text: str) -> List[Tuple[str, str]]:
+        buffer = self._pending + text
+        self._pending = ""
+        items: List[Tuple[str, str]] = []
+
+        def emit_text(segment: str):
+            if not segment:
+                return
+            if items and items[-1][0] == "text":
+                items[-1] = ("text", items[-1][1] + segment)
+            else:
+                items.append(("text", segment))
+
+        pos = 0
+        while True:
+            start = buffer.find(self.prefix, pos)
+            if start < 0:
+                keep = self._partial_prefix_len(buffer, pos)
+                emit_text(buffer[pos:len(buffer) - keep])
+                self._pending = buffer[len(buffer) - keep:]
+                break
+            value_start = start + len(self.prefix)
+            end = buffer.find(self.suffix, value_start)
+            if end < 0 and len(buffer) - value_start <= _MAX_VALUE_LEN:
+                # 占位符还没输出完，等下一个片段
+                emit_text(buffer[pos:start])
+                self._pending = buffer[start:]
+                break
+            if end >= 0 and self._value_re.fullmatch(buffer[value_start:end]):
+                emit_text(buffer[pos:start])
+                items.append(("placeholder", buffer[value_start:end]))
+                pos = end + len(self.suffix)
+            else:
+                # 形似前缀但不是合法占位符，按普通文本输出
+                emit_text(buffer[pos:start + 1])
+                pos = start + 1
+        return items
+
+    def flush(self) -> List[Tuple[str, str]]:
+        pending, self._pending = self._pending, ""
+        return [("text", pending)] if pending else []
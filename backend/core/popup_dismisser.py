@@ -0,0 +1,130 @@
+"""
+弹窗自动关闭
+通过页面初始化脚本注入 MutationObserver，DOM 变化时立即关闭已知的遮罩/弹窗，
+代替在搜索流程中反复轮询可见性；每次关闭都会回报给 Python 侧累计（跨页面导航）
+"""
+import json
+import logging
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 关闭按钮选择器：(CSS 选择器, 名称)
+POPUP_CLOSE_SELECTORS: List[Tuple[str, str]] = [
+    # 通用关闭按钮
+    ('button[aria-label*="关闭"]', "关闭按钮"),
+    ('button[aria-label*="Close"]', "Close按钮"),
+    ('button[aria-label*="Dismiss"]', "Dismiss按钮"),
+    # Cookie 弹窗
+    ('.bui-modal__close', "Modal关闭"),
+    # X 按钮（只在对话框内查找，避免误点页面上的普通图标按钮）
+    ('[role="dialog"] button:has(svg), [aria-modal="true"] button:has(svg)', "SVG关闭按钮"),
+]
+
+# 按按钮文字关闭：(按钮文字, 名称)
+POPUP_TEXT_BUTTONS: List[Tuple[str, str]] = [
+    ("接受", "Cookie接受"),
+    ("拒绝", "Cookie拒绝"),
+    ("留在国际版", "留在国际版"),
+]
+
+# 这些页面由专门的流程处理（如 Cookie 确认页），不自动点击
+POPUP_SKIP_URL_PATTERNS: List[str] = ["pipl_consent"]
+
+_DISMISSER_JS = """
+((config) => {
+    if (window.__popupDismissals) return;
+    const stats = window.__popupDismissals = { total: 0, by_name: {} };
+    const clicked = new WeakSet();
+
+    const isVisible = el => {
+        if (!el.isConnected) return false;
+        const style = getComputedStyle(el);
+        if (style.visibility === "hidden" || style.display === "none") return false;
+        return el.getClientRects().length > 0;
+    };
+    const dismiss = (el, name) => {
+        if (clicked.has(el) || !isVisible(el)) return;
+        clicked.add(el);
+        try { el.click(); } catch (e) { return; }
+        stats.total += 1;
+        stats.by_name[name] = (stats.by_name[name] || 0) + 1;
+        if (window.__popupDismissed) window.__popupDismissed(name).catch(() => {});
+    };
+    const scan = () => {
+        if (config.skipUrls.some(pattern => location.href.includes(pattern))) return;
+        for (const [selector, name] of config.selectors) {
+            let elements;
+            try { elements = document.querySelectorAll(selector); } catch (e) { continue; }
+            elements.forEach(el => dismiss(el, name));
+        }
+        if (config.texts.length) {
+            document.querySelectorAll("button, [role=button]").forEach(el => {
+                const text = (el.innerText || "").trim();
+                for (const [label, name] of config.texts) {
+                    if (text === label) { dismiss(el, name); break; }
+                }
+            });
+        }
+    };
+
+    // 一帧内的多次 DOM 变化只扫描一次
+    let scheduled = false;
+    const schedule = () => {
+        if (scheduled) return;
+        scheduled = true;
+        requestAnimationFrame(() => { scheduled = false; scan(); });
+    };
+    const start = () => {
+        new MutationObserver(schedule).observe(document.documentElement, {
+            childList: true, subtree: true, attributes: true, attributeFilter: ["class", "style", "hidden", "aria-hidden"],
+        });
+        schedule();
+    };
+    if (document.documentElement) start();
+    else document.addEventListener("readystatechange", start, { once: true });
+})(%s);
+"""
+
+
+class PopupDismisser:
+    """
+    单次搜索的弹窗自动关闭器
+
+    用法：
+        dismisser = PopupDismisser()
+        await dismisser.install(page)   # 必须在 page.goto 之前调用
+        ...
+        result["popups"] = dismisser.stats()
+    """
+
+    def __init__(
+        self,
+        selectors: Optional[List[Tuple[str, str]]] = None,
+        text_buttons: Optional[List[Tuple[str, str]]] = None,
+        skip_url_patterns: Optional[List[str]] = None,
+    ):
+        config = {
+            "selectors": selectors if selectors is not None else POPUP_CLOSE_SELECTORS,
+            "texts": text_buttons if text_buttons is not None else POPUP_TEXT_BUTTONS,
+            "skipUrls": skip_url_patterns if skip_url_patterns is not None else POPUP_SKIP_URL_PATTERNS,
+        }
+        self.script = _DISMISSER_JS % json.dumps(config, ensure_ascii=False)
+        self.dismissed = 0
+        self.dismissed_by_name: Dict[str, int] = {}
+
+    async def install(self, page):
+        """注册回报函数与初始化脚本，此后页面的每次导航都会自动注入"""
+        await page.expose_function("__popupDismissed", self._on_dismissed)
+        await page.add_init_script(self.script)
+
+    def _on_dismissed(self, name: str):
+        self.dismissed += 1
+        self.dismissed_by_name[name] = self.dismissed_by_name.get(name, 0) + 1
+        logger.debug(f"已关闭弹窗: {name}")
+
+    def stats(self) -> Dict:
+        return {
+            "dismissed": self.dismissed,
+            "dismissed_by_name": dict(self.dismissed_by_name),
+        }
@@ -0,0 +1,122 @@
+"""
+提示词压缩与 token 预算
+旅行计划、酒店列表等上下文以紧凑 JSON 写入提示词，只保留模型会用到的字段和相关的行程天；
+超出预算时从列表末尾逐项裁剪，并记录每次调用的估算 token 数
+"""
+import json
+import logging
+import os
+import re
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", 3000))  # 单次调用（系统 + 用户消息）的估算 token 上限
+
+PROMPT_TOKENS = metrics.histogram(
+    "llm_prompt_tokens_estimated",
+    "LLM 调用提示词的估算 token 数",
+    ("prompt",),
+    buckets=(250, 500, 1000, 2000, 3000, 4000, 6000, 8000, 16000),
+)
+PROMPT_ITEMS_TRIMMED = metrics.counter(
+    "llm_prompt_items_trimmed_total", "因超出 token 预算被裁掉的上下文条目数", ("prompt",)
+)
+
+# 旅行计划中模型会用到的字段
+_PLAN_FIELDS = ("destination", "city", "start_date", "end_date", "people")
+_DAY_FIELDS = ("day", "date")
+
+_CJK_RE = re.compile(r"[\u3000-\u303f\u3400-\u9fff\uff00-\uffef]")
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中日韩字符约 1 字 1 token，其余约 4 字符 1 token"""
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def compact_json(obj) -> str:
+    """不缩进、不留空格的 JSON"""
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def _day_in_range(item: Dict, date_range: Tuple[str, str]) -> bool:
+    item_date = str(item.get("date") or "")
+    return bool(item_date) and date_range[0] <= item_date <= date_range[1]
+
+
+def compact_travel_plan(
+    travel_plan: Dict,
+    days: Optional[Iterable[int]] = None,
+    date_range: Optional[Tuple[str, str]] = None,
+) -> Dict:
+    """
+    只保留目的地、日期、人数和每天的景点名称
+
+    Args:
+        days: 只保留这些天（如第 2 晚需要第 2、3 天）；为空时保留全部
+        date_range: 只保留日期落在 [入住日, 退房日] 内的天；与 days 同时给出时取并集
+    筛选后没有任何一天时保留全部行程
+    """
+    plan = travel_plan.get("plan") if isinstance(travel_plan.get("plan"), dict) else travel_plan
+    compact: Dict = {k: plan[k] for k in _PLAN_FIELDS if plan.get(k) not in (None, "", [])}
+
+    itinerary = [item for item in travel_plan.get("itinerary") or [] if isinstance(item, dict)]
+    day_set = set(days or [])
+    if day_set or date_range:
+        selected = [
+            item for item in itinerary
+            if item.get("day") in day_set or (date_range and _day_in_range(item, date_range))
+        ]
+        itinerary = selected or itinerary
+
+    compact["itinerary"] = [
+        {
+            **{k: item[k] for k in _DAY_FIELDS if item.get(k) is not None},
+            "activities": [
+                a.get("name") if isinstance(a, dict) else a
+                for a in item.get("activities") or []
+                if (a.get("name") if isinstance(a, dict) else a)
+            ],
+        }
+        for item in itinerary
+    ]
+    return compact
+
+
+def fit_to_budget(
+    render: Callable[[List], str],
+    items: Sequence,
+    budget: int,
+    name: str = "",
+    keep: int = 1,
+) -> str:
+    """
+    用 render(items) 生成文本；估算 token 超出 budget 时从末尾逐项去掉 items（至少保留 keep 项）
+
+    调用方应把最不重要的条目排在后面（如排序靠后的酒店、离入住日最远的行程天）
+    """
+    items = list(items)
+    text = render(items)
+    trimmed = 0
+    while estimate_tokens(text) > budget and len(items) > keep:
+        items.pop()
+        trimmed += 1
+        text = render(items)
+    if trimmed:
+        PROMPT_ITEMS_TRIMMED.inc(trimmed, prompt=name)
+        logger.info(f"提示词 {name} 超出预算 {budget} tokens，裁掉 {trimmed} 项上下文")
+    return text
+
+
+def record_prompt(name: str, messages: List[Dict]) -> int:
+    """记录一次调用的估算 token 数并写日志，返回估算值"""
+    tokens = sum(estimate_tokens(m.get("content") or "") for m in messages)
+    PROMPT_TOKENS.observe(tokens, prompt=name)
+    logger.info(f"提示词 {name}: 约 {tokens} tokens（{sum(len(m.get('content') or '') for m in messages)} 字符）")
+    return tokens
@@ -0,0 +1,114 @@
+"""
+抓取请求过滤
+生产模式下通过 Playwright 路由拦截图片、媒体、字体、统计脚本以及第三方域名，
+并按次搜索记录节省的请求数与流量
+"""
+import os
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+
+def _env_list(name: str, default: str) -> List[str]:
+    return [item.strip().lower() for item in os.getenv(name, default).split(",") if item.strip()]
+
+
+# 直接拦截的资源类型
+SCRAPE_BLOCK_TYPES = _env_list("SCRAPE_BLOCK_TYPES", "image,media,font")
+# 允许访问的域名（含子域名），不在列表中的第三方域名一律拦截
+SCRAPE_ALLOW_HOSTS = _env_list("SCRAPE_ALLOW_HOSTS", "booking.cn,booking.com,bstatic.com")
+# 即使属于允许域名也要拦截的统计/广告域名，优先级高于允许列表
+SCRAPE_DENY_HOSTS = _env_list(
+    "SCRAPE_DENY_HOSTS",
+    "google-analytics.com,googletagmanager.com,doubleclick.net,googlesyndication.com,"
+    "facebook.net,facebook.com,hotjar.com,criteo.com,criteo.net,bat.bing.com,clarity.ms,"
+    "taboola.com,outbrain.com,scorecardresearch.com,adnxs.com,tiktok.com",
+)
+
+# 被拦截请求的典型响应大小（字节），用于估算节省的流量
+_TYPICAL_BYTES = {
+    "image": 40_000,
+    "media": 500_000,
+    "font": 60_000,
+    "script": 80_000,
+    "stylesheet": 30_000,
+    "xhr": 5_000,
+    "fetch": 5_000,
+}
+_DEFAULT_TYPICAL_BYTES = 10_000
+
+
+def _host_matches(host: str, patterns: List[str]) -> bool:
+    return any(host == p or host.endswith("." + p) for p in patterns)
+
+
+class RequestFilter:
+    """
+    单次搜索的请求过滤器
+
+    用法：
+        request_filter = RequestFilter()
+        await request_filter.install(page)
+        ...
+        result["network"] = request_filter.stats()
+    """
+
+    def __init__(
+        self,
+        block_types: Optional[List[str]] = None,
+        allow_hosts: Optional[List[str]] = None,
+        deny_hosts: Optional[List[str]] = None,
+    ):
+        self.block_types = set(block_types if block_types is not None else SCRAPE_BLOCK_TYPES)
+        self.allow_hosts = allow_hosts if allow_hosts is not None else SCRAPE_ALLOW_HOSTS
+        self.deny_hosts = deny_hosts if deny_hosts is not None else SCRAPE_DENY_HOSTS
+
+        self.allowed_requests = 0
+        self.allowed_bytes = 0
+        self.blocked_requests = 0
+        self.estimated_bytes_saved = 0
+        self.blocked_by_reason: Dict[str, int] = {}
+
+    async def install(self, page):
+        """在页面上注册路由拦截与响应统计"""
+        await page.route("**/*", self._handle_route)
+        page.on("response", self._on_response)
+
+    def block_reason(self, url: str, resource_type: str) -> Optional[str]:
+        """返回拦截原因；None 表示放行"""
+        host = (urlsplit(url).hostname or "").lower()
+        if _host_matches(host, self.deny_hosts):
+            return "tracker"
+        if resource_type in self.block_types:
+            return resource_type
+        if host and not _host_matches(host, self.allow_hosts):
+            return "third_party"
+        return None
+
+    async def _handle_route(self, route):
+        request = route.request
+        reason = self.block_reason(request.url, request.resource_type)
+        if reason is None:
+            self.allowed_requests += 1
+            # 交给更早注册的其他路由（如 HAR 回放）处理，没有则正常发出请求
+            await route.fallback()
+            return
+
+        self.blocked_requests += 1
+        self.blocked_by_reason[reason] = self.blocked_by_reason.get(reason, 0) + 1
+        self.estimated_bytes_saved += _TYPICAL_BYTES.get(request.resource_type, _DEFAULT_TYPICAL_BYTES)
+        await route.abort("blockedbyclient")
+
+    def _on_response(self, response):
+        try:
+            self.allowed_bytes += int(response.headers.get("content-length", 0))
+        except (TypeError, ValueError):
+            pass
+
+    def stats(self) -> Dict:
+        return {
+            "allowed_requests": self.allowed_requests,
+            "allowed_bytes": self.allowed_bytes,
+            "blocked_requests": self.blocked_requests,
+            "blocked_by_reason": dict(self.blocked_by_reason),
+            "estimated_bytes_saved": self.estimated_bytes_saved,
+        }
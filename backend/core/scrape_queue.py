@@ -0,0 +1,135 @@
+"""
+抓取任务准入队列
+限制同时运行的浏览器抓取数量；超出并发上限的请求按先后排队，队列满时立即拒绝。
+排队期间通过回调通知调用者当前排队位置与预计等待时间
+"""
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Callable, Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+SCRAPE_CONCURRENCY = int(os.getenv("SCRAPE_CONCURRENCY", 4))            # 同时运行的抓取数上限
+SCRAPE_QUEUE_MAX_DEPTH = int(os.getenv("SCRAPE_QUEUE_MAX_DEPTH", 20))   # 最多排队的抓取数
+SCRAPE_EXPECTED_DURATION = float(os.getenv("SCRAPE_EXPECTED_DURATION", 20))  # 单次抓取耗时的初始估计（秒）
+
+# 位置回调：(排队位置, 预计等待秒数)，位置为 0 表示已开始执行
+PositionCallback = Callable[[int, float], None]
+
+
+class QueueFullError(Exception):
+    """排队人数已达上限"""
+
+
+class _Ticket:
+    __slots__ = ("admitted", "on_position")
+
+    def __init__(self, on_position: Optional[PositionCallback]):
+        self.admitted: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.on_position = on_position
+
+
+class ScrapeQueue:
+    """带排队位置通知的并发准入控制"""
+
+    def __init__(
+        self,
+        concurrency: int = SCRAPE_CONCURRENCY,
+        max_depth: int = SCRAPE_QUEUE_MAX_DEPTH,
+        expected_duration: float = SCRAPE_EXPECTED_DURATION,
+    ):
+        self.concurrency = max(1, concurrency)
+        self.max_depth = max(0, max_depth)
+        self._running = 0
+        self._waiting: Deque[_Ticket] = deque()
+        # 抓取耗时的指数移动平均，用于估算等待时间
+        self._avg_duration = expected_duration
+
+        # 统计信息
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+
+    @asynccontextmanager
+    async def slot(self, on_position: Optional[PositionCallback] = None):
+        """
+        占用一个抓取名额，离开上下文时释放
+
+        Raises:
+            QueueFullError: 排队人数已达上限
+        """
+        if self._running < self.concurrency and not self._waiting:
+            self._running += 1
+        else:
+            if len(self._waiting) >= self.max_depth:
+                self.rejected += 1
+                raise QueueFullError("当前搜索人数较多，请稍后再试")
+            ticket = _Ticket(on_position)
+            self._waiting.append(ticket)
+            self.queued += 1
+            self._notify_positions()
+            try:
+                await ticket.admitted
+            except asyncio.CancelledError:
+                if ticket in self._waiting:
+                    self._waiting.remove(ticket)
+                    self._notify_positions()
+                elif ticket.admitted.done() and not ticket.admitted.cancelled():
+                    # 名额已移交给本调用者但来不及使用，归还给下一位
+                    self._release(None)
+                raise
+
+        self.admitted += 1
+        if on_position:
+            on_position(0, 0.0)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(time.monotonic() - start)
+
+    def estimated_wait(self, position: int) -> float:
+        """排在第 position 位时的预计等待秒数"""
+        rounds = math.ceil(position / self.concurrency)
+        return round(rounds * self._avg_duration, 1)
+
+    def stats(self) -> Dict:
+        return {
+            "concurrency": self.concurrency,
+            "max_depth": self.max_depth,
+            "running": self._running,
+            "waiting": len(self._waiting),
+            "avg_duration_s": round(self._avg_duration, 1),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+        }
+
+    def _release(self, duration: Optional[float]):
+        if duration is not None:
+            self._avg_duration = 0.8 * self._avg_duration + 0.2 * duration
+        # 名额直接移交给队首，保持先来先服务
+        while self._waiting:
+            ticket = self._waiting.popleft()
+            if not ticket.admitted.done():
+                ticket.admitted.set_result(True)
+                self._notify_positions()
+                return
+        self._running -= 1
+
+    def _notify_positions(self):
+        for index, ticket in enumerate(self._waiting, 1):
+            if ticket.on_position:
+                try:
+                    ticket.on_position(index, self.estimated_wait(index))
+                except Exception as e:
+                    logger.error(f"通知排队位置失败: {e}")
+
+
+# 应用级共享的抓取准入队列
+scrape_queue = ScrapeQueue()
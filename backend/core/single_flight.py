@@ -0,0 +1,105 @@
+"""
+请求合并（single-flight）
+相同键的并发调用只执行一次：第一个调用者发起任务，后续调用者等待同一个任务的结果。
+单个调用者被取消不会影响其他调用者；所有调用者都离开后才取消底层任务。
+任务执行过程中发出的进度事件会广播给所有等待者（后加入者会先收到此前的事件）
+"""
+import asyncio
+import copy
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+EventCallback = Callable[[Dict], None]
+
+
+class _Flight:
+    __slots__ = ("task", "waiters", "listeners", "history")
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.waiters = 0
+        self.listeners: List[EventCallback] = []
+        self.history: List[Dict] = []
+
+    def emit(self, event: Dict):
+        self.history.append(event)
+        for listener in list(self.listeners):
+            try:
+                listener(event)
+            except Exception as e:
+                logger.error(f"分发进度事件失败: {e}")
+
+
+class SingleFlight:
+    """按键合并并发的异步调用"""
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def do(
+        self,
+        key: str,
+        fn: Callable[[EventCallback], Awaitable[Any]],
+        on_event: Optional[EventCallback] = None,
+    ) -> Tuple[Any, bool]:
+        """
+        执行或加入键为 key 的调用
+
+        Args:
+            key: 合并键
+            fn: 实际执行的协程函数，参数为广播进度事件的 emit 函数
+            on_event: 接收进度事件的回调
+
+        Returns:
+            (结果的独立副本, 是否复用了其他调用者发起的任务)
+        """
+        flight = self._flights.get(key)
+        shared = flight is not None
+        if flight is None:
+            flight = _Flight()
+            flight.task = asyncio.create_task(fn(flight.emit))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+            self.leaders += 1
+        else:
+            self.followers += 1
+            logger.info(f"🔗 合并到进行中的相同请求（当前等待者 {flight.waiters + 1} 个）")
+
+        if on_event:
+            for event in flight.history:
+                on_event(event)
+            flight.listeners.append(on_event)
+        flight.waiters += 1
+        try:
+            # shield 保证某个等待者被取消时底层任务继续运行
+            result = await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if on_event:
+                flight.listeners.remove(on_event)
+            if flight.waiters == 0 and not flight.task.done():
+                # 取消后任务还要清理（关闭页面、保存登录态）才结束，
+                # 立即移除，避免这期间到达的相同请求加入一个正在取消的任务
+                self._forget(key, flight)
+                flight.task.cancel()
+        # 每个调用者拿到独立副本，避免相互修改
+        return copy.deepcopy(result), shared
+
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    def stats(self) -> Dict:
+        return {
+            "in_flight": len(self._flights),
+            "leaders": self.leaders,
+            "followers": self.followers,
+        }
+
+    def _forget(self, key: str, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
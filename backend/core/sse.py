@@ -0,0 +1,129 @@
+"""
+SSE 事件写出
+接口的事件生成器只产出事件字典，由这里统一序列化并写出：
+- 合并：生成器连续产出、客户端尚未取走的多个事件合并为一次写出，不额外等待
+- 心跳：生成器长时间没有事件（如等待抓取或 LLM）时按定时器发送注释行，保持代理和浏览器连接
+- 节奏：可选的事件最小间隔（打字机效果，调试/演示用），生产环境默认关闭
+- 指标：每个流的首字节时间和总时长
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import AsyncGenerator, AsyncIterator, Dict, Optional
+
+from core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+SSE_PACING_MS = float(os.getenv("SSE_PACING_MS", 0))              # 事件之间的最小间隔（毫秒），0 表示不限速
+SSE_HEARTBEAT_INTERVAL = float(os.getenv("SSE_HEARTBEAT_INTERVAL", 15))  # 无事件多久后发送心跳（秒），0 关闭
+SSE_MAX_WRITE_BYTES = int(os.getenv("SSE_MAX_WRITE_BYTES", 64 * 1024))    # 合并写出的单次上限
+SSE_QUEUE_SIZE = 256  # 客户端读取慢时生成器最多领先的事件数
+
+SSE_FIRST_BYTE_SECONDS = metrics.histogram(
+    "sse_time_to_first_byte_seconds", "SSE 流从接口返回到写出第一个事件的时间", ("stream",)
+)
+SSE_STREAM_SECONDS = metrics.histogram(
+    "sse_stream_duration_seconds",
+    "SSE 流总时长（outcome 为 ok / error / disconnected）",
+    ("stream", "outcome"),
+    buckets=(0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300),
+)
+SSE_EVENTS = metrics.counter("sse_events_total", "写出的 SSE 事件数", ("stream",))
+SSE_WRITES = metrics.counter("sse_writes_total", "SSE 写出次数（合并后；与事件数之比即合并效果）", ("stream",))
+SSE_HEARTBEATS = metrics.counter("sse_heartbeats_total", "发送的 SSE 心跳数", ("stream",))
+
+HEARTBEAT_FRAME = ": ping\n\n"
+_END = object()
+
+
+def sse_frame(event: Dict) -> str:
+    return f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+
+async def sse_stream(
+    events: AsyncGenerator[Dict, None],
+    name: str,
+    pacing_ms: Optional[float] = None,
+    heartbeat_interval: Optional[float] = None,
+) -> AsyncIterator[str]:
+    """
+    把事件生成器转换为 SSE 文本流
+
+    生成器在后台任务中运行，因此等待期间可以发送心跳，连续产出的事件可以合并写出；
+    客户端断开时取消后台任务，生成器中的 finally 照常执行
+
+    用法：
+        return StreamingResponse(sse_stream(generate(), "hotel_chat"), media_type="text/event-stream")
+    """
+    pacing = (SSE_PACING_MS if pacing_ms is None else pacing_ms) / 1000
+    heartbeat = SSE_HEARTBEAT_INTERVAL if heartbeat_interval is None else heartbeat_interval
+    started = time.perf_counter()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=SSE_QUEUE_SIZE)
+    error: Optional[BaseException] = None
+    closed = False  # 写出端已退出（客户端断开或流结束）
+
+    async def pump():
+        nonlocal error
+        try:
+            async for event in events:
+                await queue.put(sse_frame(event))
+        except BaseException as e:
+            # 生成器内部抛出的 CancelledError 等也作为流的错误结束，否则写出端会一直发心跳
+            error = e
+            if closed:
+                raise
+        finally:
+            # 被取消时生成器可能停在 yield 处，显式关闭以执行其 finally
+            await events.aclose()
+            if not closed:
+                await queue.put(_END)
+
+    task = asyncio.create_task(pump())
+    outcome = "disconnected"
+    first = True
+    try:
+        while True:
+            try:
+                item = await asyncio.wait_for(queue.get(), heartbeat or None)
+            except asyncio.TimeoutError:
+                SSE_HEARTBEATS.inc(stream=name)
+                yield HEARTBEAT_FRAME
+                continue
+
+            frames = []
+            size = 0
+            # 不限速时把已经排队的事件一起写出
+            while item is not _END:
+                frames.append(item)
+                size += len(item)
+                if pacing or size >= SSE_MAX_WRITE_BYTES or queue.empty():
+                    break
+                item = queue.get_nowait()
+
+            if frames:
+                if first:
+                    first = False
+                    SSE_FIRST_BYTE_SECONDS.observe(time.perf_counter() - started, stream=name)
+                SSE_EVENTS.inc(len(frames), stream=name)
+                SSE_WRITES.inc(stream=name)
+                yield "".join(frames)
+                if pacing:
+                    await asyncio.sleep(pacing)
+            if item is _END:
+                break
+
+        # 生成器内部未处理的异常
+        if error is not None:
+            outcome = "error"
+            logger.error(f"SSE 流 {name} 异常结束: {error!r}")
+            yield sse_frame({"type": "error", "content": f"处理请求时出错: {error}"})
+        else:
+            outcome = "ok"
+    finally:
+        closed = True
+        if not task.done():
+            task.cancel()
+        SSE_STREAM_SECONDS.observe(time.perf_counter() - started, stream=name, outcome=outcome)
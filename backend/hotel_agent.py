@@ -2,20 +2,27 @@
 智能酒店推荐代理
 处理用户输入，识别意图，提取参数，搜索酒店，生成推荐
 """
+import asyncio
 import json
 import os
-from typing import Dict, Optional
-from openai import OpenAI
+from datetime import date, timedelta
+from typing import AsyncIterator, Callable, Dict, List, Optional
 from dotenv import load_dotenv
-from booking_hotel_search import search_hotel
+from booking_hotel_search import iter_search_hotel, SCRAPE_FAILURES
+from core.hotel_cache import hotel_cache, normalize_search_key
+from core.single_flight import SingleFlight
+from core.scrape_queue import scrape_queue, QueueFullError
+from core.llm_gateway import llm_gateway
+from hotel_ranking import rank_hotels, compact_records
+from hotel_intent import INTENT_FAST_PATH, fast_intent, partial_intent_params, requested_days
+from core.prompt_budget import (
+    PROMPT_TOKEN_BUDGET, compact_json, compact_travel_plan, estimate_tokens, fit_to_budget, record_prompt
+)
 
 load_dotenv()
 
-# 初始化OpenAI客户端
-client = OpenAI(
-    base_url="https://ark.cn-beijing.volces.com/api/v3",
-    api_key=os.environ.get("ARK_API_KEY"),
-)
+# 整段行程搜索时同时进行的酒店搜索数（每个搜索占用浏览器池中的一个页面）
+ITINERARY_SEARCH_CONCURRENCY = int(os.getenv("ITINERARY_SEARCH_CONCURRENCY", 3))
 
 # 意图识别和参数提取的系统提示词
 INTENT_SYSTEM_PROMPT = """你是一个智能的旅行酒店推荐助手。你的任务是分析用户输入，判断是否需要进行"预订酒店"的搜索与推荐。
@@ -44,6 +51,8 @@ INTENT_SYSTEM_PROMPT = """你是一个智能的旅行酒店推荐助手。你的
 - rooms (number): 房间数量，默认 1
 - children_ages (array): 儿童年龄列表
 - pets (boolean): 是否携带宠物，默认 false
+- max_price (number): 每晚价格上限（用户明确提到预算时）
+- min_score (number): 最低住客评分（10 分制，如"评分 8 分以上"）
 
 输出格式要求（仅输出 JSON，不要输出任何其他文字）：
 - 若涉及酒店或旅行相关需求，输出：
@@ -103,7 +112,7 @@ RECOMMENDATION_SYSTEM_PROMPT = """你是一个专业的旅行酒店推荐顾问
 
 🎯 重要：酒店卡片占位符使用规则
 - 在推荐每个酒店时，在推荐理由段落的**最后**添加占位符 [HOTEL_CARD:X]
-- X 是酒店在列表中的索引（从0开始）
+- X 是该酒店记录中的 index 字段值（不是它在列表中的位置）
 - 占位符必须单独占一行
 - 示例格式：
 
@@ -136,54 +145,125 @@ RECOMMENDATION_SYSTEM_PROMPT = """你是一个专业的旅行酒店推荐顾问
 注意：
 - 推荐理由要具体，结合酒店特点和用户需求
 - 🆕 如果提供了旅行计划，推荐理由必须说明该酒店如何方便用户游览计划中的景点
-- **必须在每个酒店推荐段落末尾添加占位符 [HOTEL_CARD:X]，X为酒店索引（0,1,2...）**
+- 酒店列表已按评分、价格、距离预先排序，排在前面的通常更合适
+- **必须在每个酒店推荐段落末尾添加占位符 [HOTEL_CARD:X]，X为酒店记录中的 index 字段值**
 - 语气要亲切、专业
 - 如果酒店信息不完整，不要编造，可以说明信息待确认"""
 
 
+# 系统提示词是固定的，导入时估算一次 token 数，剩余预算留给用户消息
+INTENT_SYSTEM_TOKENS = estimate_tokens(INTENT_SYSTEM_PROMPT)
+RECOMMENDATION_SYSTEM_TOKENS = estimate_tokens(RECOMMENDATION_SYSTEM_PROMPT)
+
+INTENT_USER_TEMPLATE = """用户消息：{message}
+
+【用户的旅行计划】
+{travel_plan}
+
+请结合旅行计划分析用户的酒店需求，从计划中提取目的地、日期等信息。"""
+
+RECOMMENDATION_TRAVEL_PLAN_TEMPLATE = """
+
+【用户的旅行计划】
+以下是用户已经规划好的旅行行程（入住期间相关的天），请根据这个行程推荐最合适的酒店：
+{travel_plan}
+
+注意事项：
+- 根据行程中的景点位置，推荐交通便利的酒店
+- 考虑每日的活动安排，推荐合适的酒店类型
+- 如果行程跨越多天，建议是否需要在不同区域预订多家酒店
+- 结合行程节奏，推荐适合休息的酒店
+"""
+
+RECOMMENDATION_USER_TEMPLATE = """用户需求：{message}
+
+搜索参数：{search_params}
+{travel_plan_context}
+
+找到的酒店列表（已预先排序，index 为 [HOTEL_CARD:X] 中使用的编号）：
+{hotels}
+
+请从以上酒店中选择最合适的（最多5个），并生成专业的推荐。"""
+
+
+def _optional_float(value) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
 class HotelAgent:
     """智能酒店推荐代理"""
     
     def __init__(self):
-        self.client = client
+        self.llm = llm_gateway
+        # 合并并发的相同酒店搜索
+        self.search_flight = SingleFlight()
     
-    def analyze_intent(self, user_message: str, travel_plan: Optional[Dict] = None) -> Dict:
+    async def analyze_intent(
+        self,
+        user_message: str,
+        travel_plan: Optional[Dict] = None,
+        on_partial: Optional[Callable[[Dict], None]] = None
+    ) -> Dict:
         """
-        分析用户意图并提取参数
+        分析用户意图并提取参数（LLM 流式输出）
         
         Args:
             user_message: 用户消息
             travel_plan: 用户的旅行计划（可选）
+            on_partial: 输出到一半、已能解析出目的地和入住/退房日期时调用一次，参数为已解析的搜索参数，
+                        调用方可据此提前启动搜索（最终参数可能不同，需自行核对）
         
         Returns:
             {"intent": "book_hotel", "params": {...}} 或
             {"intent": "chat", "message": "..."}
         """
+        # 表述明确的订酒店消息直接用规则解析，省去一次 LLM 调用
+        if INTENT_FAST_PATH:
+            fast_result = fast_intent(user_message, travel_plan)
+            if fast_result:
+                print(f"规则快速通道命中: {json.dumps(fast_result['params'], ensure_ascii=False)}")
+                return fast_result
+
         try:
-            # 🆕 如果有旅行计划，添加到用户消息中
+            # 🆕 如果有旅行计划，只带上提到的那几天（没提到时带全部行程），超出预算时裁掉靠后的天
             user_content = user_message
             if travel_plan:
-                travel_plan_json = json.dumps(travel_plan, ensure_ascii=False, indent=2)
-                user_content = f"""用户消息：{user_message}
-
-【用户的旅行计划】
-```json
-{travel_plan_json}
-```
-
-请结合旅行计划分析用户的酒店需求，从计划中提取目的地、日期等信息。"""
-            
-            response = self.client.chat.completions.create(
+                plan = compact_travel_plan(travel_plan, days=requested_days(user_message))
+                itinerary = plan.pop("itinerary")
+                user_content = fit_to_budget(
+                    lambda days: INTENT_USER_TEMPLATE.format(
+                        message=user_message, travel_plan=compact_json({**plan, "itinerary": days})
+                    ),
+                    itinerary,
+                    PROMPT_TOKEN_BUDGET - INTENT_SYSTEM_TOKENS,
+                    name="intent",
+                )
+
+            messages = [
+                {"role": "system", "content": INTENT_SYSTEM_PROMPT},
+                {"role": "user", "content": user_content}
+            ]
+            record_prompt("intent", messages)
+            parts = []
+            partial_sent = on_partial is None
+            async for text in self.llm.stream(
+                "intent",
                 model="doubao-1-5-thinking-vision-pro-250428",
-                messages=[
-                    {"role": "system", "content": INTENT_SYSTEM_PROMPT},
-                    {"role": "user", "content": user_content}
-                ],
+                messages=messages,
                 temperature=0.3,
-                max_tokens=1000
-            )
-            
-            content = response.choices[0].message.content.strip()
+                max_tokens=1000,
+                timeout=60
+            ):
+                parts.append(text)
+                if not partial_sent:
+                    partial_params = partial_intent_params("".join(parts))
+                    if partial_params:
+                        partial_sent = True
+                        on_partial(partial_params)
+            content = "".join(parts).strip()
             
             # 尝试解析JSON
             try:
@@ -204,37 +284,51 @@ class HotelAgent:
             print(f"意图分析错误: {e}")
             return {"intent": "chat", "message": user_message}
     
-    async def search_hotels(self, params: Dict) -> Dict:
+    async def search_hotels(self, params: Dict, on_event: Optional[Callable[[Dict], None]] = None) -> Dict:
         """
-        搜索酒店（异步）
+        搜索酒店（异步），优先使用缓存结果；并发的相同搜索只抓取一次
         
         Args:
             params: 搜索参数
+            on_event: 接收搜索进度事件的回调，如 {"type": "queue", "position": 2, "estimated_wait_s": 40}
+                      或 {"type": "hotel_partial", "index": 0, "hotel": {...}}（缓存命中时不会产生）
         
         Returns:
-            搜索结果
+            搜索结果（cache 字段标明 hit / stale / miss，coalesced 表示复用了进行中的相同搜索）
         """
         try:
             import logging
             logger = logging.getLogger(__name__)
             logger.info(f"🔍 开始搜索酒店，参数: {params}")
             
-            result = await search_hotel(
-                destination=params.get("destination"),
-                checkin_date=params.get("checkin_date"),
-                checkout_date=params.get("checkout_date"),
-                adults=params.get("adults", 2),
-                children=params.get("children", 0),
-                rooms=params.get("rooms", 1),
-                children_ages=params.get("children_ages"),
-                pets=params.get("pets", False)
+            key = normalize_search_key(params)
+            result = await hotel_cache.get_or_fetch(
+                key,
+                lambda: self._scrape_coalesced(key, params, on_event),
+                refresh=lambda: self._scrape_coalesced(key, params),
             )
             
-            logger.info(f"✅ 搜索完成，成功: {result.get('success')}, 酒店数: {len(result.get('hotels', []))}")
+            # 命中缓存时没有本次抓取的合并/等待数据，不输出
+            scrape_info = ""
+            if result.get('cache') == 'miss':
+                scrape_info = f", 合并: {result.get('coalesced', False)}, 等待浏览器: {result.get('pool_wait_ms', 0)}ms"
+            logger.info(f"✅ 搜索完成，成功: {result.get('success')}, 酒店数: {len(result.get('hotels', []))}, "
+                        f"缓存: {result.get('cache')}{scrape_info}")
             if not result.get('success'):
                 logger.error(f"❌ 搜索失败: {result.get('error')}")
             
             return result
+        except QueueFullError as e:
+            import logging
+            logging.getLogger(__name__).warning(f"⛔ 抓取队列已满，拒绝搜索: {params.get('destination')}")
+            SCRAPE_FAILURES.inc(category="queue_rejected")
+            return {
+                "success": False,
+                "error": str(e),
+                "hotels": [],
+                "rejected": True,
+                "failure": "queue_rejected"
+            }
         except Exception as e:
             import logging
             import traceback
@@ -247,7 +341,144 @@ class HotelAgent:
                 "hotels": []
             }
     
-    def generate_recommendations(self, user_message: str, search_result: Dict, travel_plan: Optional[Dict] = None):
+    async def _scrape_coalesced(self, key: str, params: Dict, on_event: Optional[Callable[[Dict], None]] = None) -> Dict:
+        """抓取酒店；与进行中的相同搜索合并，调用者取消不影响其他等待者"""
+        result, shared = await self.search_flight.do(
+            key,
+            lambda emit: self._scrape_hotels(params, emit),
+            on_event
+        )
+        if shared:
+            result["coalesced"] = True
+        return result
+    
+    async def _scrape_hotels(self, params: Dict, emit: Callable[[Dict], None]) -> Dict:
+        """
+        经准入队列限流后实际抓取 Booking 搜索结果
+        排队期间通过 emit 报告排队位置，抓取时每解析出一家酒店就发出 hotel_partial 事件
+        """
+        def on_position(position: int, estimated_wait: float):
+            emit({"type": "queue", "position": position, "estimated_wait_s": estimated_wait})
+        
+        async with scrape_queue.slot(on_position):
+            index = 0
+            async for kind, payload in iter_search_hotel(
+                destination=params.get("destination"),
+                checkin_date=params.get("checkin_date"),
+                checkout_date=params.get("checkout_date"),
+                adults=params.get("adults", 2),
+                children=params.get("children", 0),
+                rooms=params.get("rooms", 1),
+                children_ages=params.get("children_ages"),
+                pets=params.get("pets", False)
+            ):
+                if kind == "result":
+                    return payload
+                emit({"type": "hotel_partial", "index": index, "hotel": payload})
+                index += 1
+    
+    def plan_stays(self, travel_plan: Dict, group_by: str = "area") -> List[Dict]:
+        """
+        根据旅行计划规划每晚的住宿
+        
+        每晚住在当天最后一个景点附近；group_by 为 "area" 时，连续几晚落在同一区域则合并为一次入住，
+        为 "night" 时每晚单独搜索
+        
+        Returns:
+            [{"nights": [第几天...], "destination", "checkin_date", "checkout_date", "adults"}, ...]
+        """
+        plan = travel_plan.get("plan") or {}
+        city = (plan.get("city") or "").strip()
+        adults = int(plan.get("people") or 2)
+        end_date = plan.get("end_date")
+        
+        days = []
+        for item in travel_plan.get("itinerary") or []:
+            try:
+                day_date = date.fromisoformat(str(item.get("date")))
+            except ValueError:
+                continue
+            days.append((day_date, item))
+        days.sort(key=lambda pair: pair[0])
+        
+        stays: List[Dict] = []
+        for i, (day_date, item) in enumerate(days):
+            # 最后一天通常返程；计划结束日期晚于最后一天时才需要住宿
+            if i == len(days) - 1 and not (end_date and str(end_date) > day_date.isoformat()):
+                break
+            names = [a.get("name") for a in item.get("activities") or [] if a.get("name")]
+            area = names[-1] if names else (plan.get("destination") or city)
+            if not area:
+                continue
+            destination = area if not city or city in area else f"{city} {area}"
+            checkout = (day_date + timedelta(days=1)).isoformat()
+            
+            last = stays[-1] if stays else None
+            if (group_by == "area" and last and last["destination"] == destination
+                    and last["checkout_date"] == day_date.isoformat()):
+                last["checkout_date"] = checkout
+                last["nights"].append(item.get("day", i + 1))
+                continue
+            stays.append({
+                "nights": [item.get("day", i + 1)],
+                "destination": destination,
+                "checkin_date": day_date.isoformat(),
+                "checkout_date": checkout,
+                "adults": adults,
+            })
+        return stays
+    
+    async def search_itinerary(
+        self,
+        stays: List[Dict],
+        concurrency: int = ITINERARY_SEARCH_CONCURRENCY
+    ) -> AsyncIterator[Dict]:
+        """
+        并发搜索多段住宿，按完成顺序逐个产出
+        
+        Args:
+            stays: plan_stays 的返回值
+            concurrency: 同时进行的搜索数上限
+        
+        Yields:
+            {"type": "event", "stay_index": i, "event": 进度事件} 或
+            {"type": "result", "stay_index": i, "result": 搜索结果}
+        """
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        queue: asyncio.Queue = asyncio.Queue()
+        
+        async def run(index: int, stay: Dict):
+            try:
+                async with semaphore:
+                    params = {k: v for k, v in stay.items() if k != "nights"}
+                    result = await self.search_hotels(
+                        params,
+                        on_event=lambda event: queue.put_nowait({"type": "event", "stay_index": index, "event": event})
+                    )
+            except Exception as e:
+                result = {"success": False, "error": f"搜索酒店时出错: {str(e)}", "hotels": []}
+            queue.put_nowait({"type": "result", "stay_index": index, "result": result})
+        
+        tasks = [asyncio.create_task(run(i, stay)) for i, stay in enumerate(stays)]
+        try:
+            remaining = len(tasks)
+            while remaining:
+                item = await queue.get()
+                if item["type"] == "result":
+                    remaining -= 1
+                yield item
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+    
+    async def generate_recommendations(
+        self,
+        user_message: str,
+        search_result: Dict,
+        travel_plan: Optional[Dict] = None,
+        constraints: Optional[Dict] = None
+    ):
         """
         基于搜索结果生成酒店推荐（流式）
         
@@ -255,64 +486,67 @@ class HotelAgent:
             user_message: 用户原始消息
             search_result: 酒店搜索结果
             travel_plan: 用户的旅行计划（可选）
+            constraints: 意图分析得到的筛选条件，如 {"max_price": 600, "min_score": 8}
         
         Yields:
             推荐文本片段
         """
         try:
-            # 构建提示
-            hotels_info = json.dumps(search_result.get("hotels", []), ensure_ascii=False, indent=2)
-            search_params = json.dumps(search_result.get("search_params", {}), ensure_ascii=False, indent=2)
-            
-            # 🆕 如果有旅行计划，添加到提示中
+            # 先在本地按约束过滤并排序，只把前几名的精简记录交给模型
+            constraints = constraints or {}
+            ranked = rank_hotels(
+                search_result.get("hotels", []),
+                max_price=_optional_float(constraints.get("max_price")),
+                min_score=_optional_float(constraints.get("min_score")),
+            )
+            search_params = {
+                k: v for k, v in search_result.get("search_params", {}).items() if v not in (None, "", [])
+            }
+            if search_result.get("occupancy_applied") is False:
+                # 结果按 Booking 默认的 2 位成人、1 间房搜索，让模型在推荐中说明
+                search_params["occupancy_applied"] = False
+
+            # 🆕 如果有旅行计划，只带上入住期间的行程
             travel_plan_context = ""
             if travel_plan:
-                travel_plan_json = json.dumps(travel_plan, ensure_ascii=False, indent=2)
-                travel_plan_context = f"""
-
-【用户的旅行计划】
-以下是用户已经规划好的旅行行程，请根据这个行程推荐最合适的酒店：
-```json
-{travel_plan_json}
-```
-
-注意事项：
-- 根据行程中的景点位置，推荐交通便利的酒店
-- 考虑每日的活动安排，推荐合适的酒店类型
-- 如果行程跨越多天，建议是否需要在不同区域预订多家酒店
-- 结合行程节奏，推荐适合休息的酒店
-"""
-            
-            prompt = f"""用户需求：{user_message}
-
-搜索参数：
-{search_params}
-{travel_plan_context}
-
-找到的酒店列表：
-{hotels_info}
+                date_range = None
+                if search_params.get("checkin_date") and search_params.get("checkout_date"):
+                    date_range = (search_params["checkin_date"], search_params["checkout_date"])
+                travel_plan_context = RECOMMENDATION_TRAVEL_PLAN_TEMPLATE.format(
+                    travel_plan=compact_json(compact_travel_plan(travel_plan, date_range=date_range))
+                )
+
+            # 超出预算时裁掉排序靠后的酒店
+            prompt = fit_to_budget(
+                lambda records: RECOMMENDATION_USER_TEMPLATE.format(
+                    message=user_message,
+                    search_params=compact_json(search_params),
+                    travel_plan_context=travel_plan_context,
+                    hotels=compact_json(records),
+                ),
+                compact_records(ranked),
+                PROMPT_TOKEN_BUDGET - RECOMMENDATION_SYSTEM_TOKENS,
+                name="recommendation",
+            )
 
-请从以上酒店中选择最合适的（最多5个），并生成专业的推荐。"""
-            
-            stream = self.client.chat.completions.create(
+            messages = [
+                {"role": "system", "content": RECOMMENDATION_SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ]
+            record_prompt("recommendation", messages)
+            async for text in self.llm.stream(
+                "recommendation",
                 model="doubao-1-5-thinking-vision-pro-250428",
-                messages=[
-                    {"role": "system", "content": RECOMMENDATION_SYSTEM_PROMPT},
-                    {"role": "user", "content": prompt}
-                ],
+                messages=messages,
                 temperature=0.7,
-                max_tokens=2000,
-                stream=True
-            )
-            
-            for chunk in stream:
-                if chunk.choices and chunk.choices[0].delta.content:
-                    yield chunk.choices[0].delta.content
+                max_tokens=2000
+            ):
+                yield text
         
         except Exception as e:
             yield f"生成推荐时出错: {str(e)}"
     
-    def chat(self, user_message: str) -> str:
+    async def chat(self, user_message: str) -> str:
         """
         普通聊天
         
@@ -323,7 +557,8 @@ class HotelAgent:
             回复内容
         """
         try:
-            response = self.client.chat.completions.create(
+            response = await self.llm.complete(
+                "hotel_chat",
                 model="doubao-1-5-thinking-vision-pro-250428",
                 messages=[
                     {"role": "system", "content": "你是一个友好的AI助手，可以回答各种问题。"},
@@ -346,11 +581,11 @@ if __name__ == "__main__":
     # 测试1: 酒店预订意图
     print("=== 测试1: 酒店预订 ===")
     test_message = "我想在成都春熙路附近找个酒店，11月13号入住，住一晚，两个人"
-    intent_result = agent.analyze_intent(test_message)
+    intent_result = asyncio.run(agent.analyze_intent(test_message))
     print(f"意图分析结果: {json.dumps(intent_result, ensure_ascii=False, indent=2)}")
     
     # 测试2: 普通聊天
     print("\n=== 测试2: 普通聊天 ===")
     test_message2 = "今天天气怎么样？"
-    intent_result2 = agent.analyze_intent(test_message2)
+    intent_result2 = asyncio.run(agent.analyze_intent(test_message2))
     print(f"意图分析结果: {json.dumps(intent_result2, ensure_ascii=False, indent=2)}")
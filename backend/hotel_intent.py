@@ -0,0 +1,348 @@
+"""
+酒店意图规则快速通道
+对"帮我订成都春熙路11月13号的酒店两个人"这类表述明确的消息，直接用规则提取目的地、日期、人数，
+跳过一次 LLM 调用；只要有任何无法确定的部分就返回 None，交给 LLM 处理。
+另外提供从 LLM 流式输出的部分意图 JSON 中提取搜索参数的解析，用于提前启动酒店搜索
+"""
+import json
+import os
+import re
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from core.metrics import metrics
+
+INTENT_FAST_PATH = os.getenv("INTENT_FAST_PATH", "true").lower() == "true"
+
+INTENT_FAST_PATH_TOTAL = metrics.counter(
+    "intent_fast_path_total", "规则意图识别结果（hit 命中 / miss 回退到 LLM）", ("outcome", "reason")
+)
+
+_CN_DIGITS = {"零": 0, "一": 1, "二": 2, "两": 2, "俩": 2, "三": 3, "四": 4, "五": 5,
+              "六": 6, "七": 7, "八": 8, "九": 9, "十": 10}
+_NUM = r"(\d{1,2}|[一二两俩三四五六七八九十]{1,3})"
+
+_BOOK_RE = re.compile(r"帮我订|帮忙订|给我订|我要订|我想订|预订|预定|订房|订酒店|订一?间|订个|订一家|订.{0,12}酒店")
+_HOTEL_RE = re.compile(r"酒店|宾馆|旅馆|民宿|住宿|订房|住哪|住在哪")
+# 出现这些表述时规则无法可靠处理
+_NEGATION_RE = re.compile(r"不要|不用|别订|取消|不想|还是|或者|换一|改成|退订|\?|？.*？")
+_UNPARSED_DATE_RE = re.compile(r"周[一二三四五六日天末]|星期|礼拜|国庆|春节|元旦|五一|中秋|假期|下个?月|月底|月初|下周|这周|本周|周末")
+
+_ABS_DATE_RE = re.compile(r"(?:(\d{4})[年\-/.])?(\d{1,2})(?:月|[\-/.])(\d{1,2})[日号]?")
+_DAY_ONLY_RE = re.compile(r"(?:到|至|-|~)\s*(\d{1,2})[日号]")
+_REL_DATES = [("大后天", 3), ("后天", 2), ("明天", 1), ("明晚", 1), ("今天", 0), ("今晚", 0)]
+_NIGHTS_RE = re.compile(rf"(?:住|待)?{_NUM}\s*(?:个)?晚(?!上)")
+_NTH_NIGHT_RE = re.compile(rf"第{_NUM}(?:晚|天|日)|[Dd]ay\s*(\d{{1,2}})")
+
+# 从尚未输出完的意图 JSON 中提取已完整的字段（字符串需已闭合，数字/布尔值后需已出现分隔符）
+_PARTIAL_STRING_FIELDS = ("destination", "checkin_date", "checkout_date")
+_PARTIAL_NUMBER_FIELDS = ("adults", "children", "rooms")
+_PARTIAL_DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+_ADULTS_RE = re.compile(rf"{_NUM}\s*(?:个|位)?(?:大人|成人|成年人)")
+_PEOPLE_RE = re.compile(rf"{_NUM}\s*(?:个|位)\s*人|{_NUM}人(?:入住|住)?")
+_CHILDREN_RE = re.compile(rf"{_NUM}\s*(?:个|位)?(?:小孩|孩子|儿童|宝宝)")
+_ROOMS_RE = re.compile(rf"{_NUM}\s*间(?:房)?")
+_PETS_RE = re.compile(r"宠物|带狗|带猫|狗狗|猫咪")
+_FAMILY_RE = re.compile(r"一家[三四五]口|我们一家|全家")
+
+_DESTINATION_PATTERNS = [
+    re.compile(r"离([^\s，。,、的在去到离]{2,15}?)(?:很近|较近|比较近|最近|近|不远)"),
+    re.compile(r"(?:在|去|到)([^\s，。,、的在去到]{2,15}?)(?:附近|周边|旁边|一带|那边|边上|边)"),
+    re.compile(r"([^\s，。,、的在去到]{2,15}?)(?:附近|周边|旁边|一带|边)?的?(?:酒店|宾馆|旅馆|民宿|住宿)"),
+    re.compile(r"(?:在|去|到)([^\s，。,、的在去到]{2,15}?)(?:找|订|住)"),
+]
+# 提取目的地前先去掉的动词/填充词
+_FILLER_RE = re.compile(r"帮我|帮忙|给我|我想|我要|我们|想要|需要|请|麻烦|预订|预定|订房|订一?间|订一?家|订个|订|找个|找一?家|找")
+# 酒店类型修饰词（"三亚亚龙湾的海景酒店"），提取目的地前去掉，避免被当作目的地
+_HOTEL_TYPE = r"海景|江景|湖景|山景|景观|亲子|情侣|精品|主题|电竞|温泉|度假|网红|带[^\s，。,、的]{1,6}"
+_HOTEL_TYPE_RE = re.compile(rf"(?:(?:{_HOTEL_TYPE})的?)+(?=酒店|宾馆|旅馆|民宿|住宿)")
+# 目的地中不应出现的词（含评分、星级、位置偏好、类型等酒店属性）
+_BAD_DESTINATION_RE = re.compile(
+    r"[\d一二两三四五六七八九十]晚|便宜|好的|合适|哪|什么|一个|一家|附近|入住|退房|住|这|那|个人"
+    r"|评分|好评|口碑|星级|[1-5一二三四五]星|豪华|高档|经济|性价比|靠近|方便|离"
+    rf"|^(?:{_HOTEL_TYPE})$|^带"
+)
+# 只有泛指地点、没有具体位置的目的地
+_GENERIC_DESTINATION_RE = re.compile(r"(?:地铁站?|火车站|高铁站|汽车站|车站|机场|市中心|市区|景区|海边)")
+# 规则不提取的筛选条件：出现时交给 LLM，避免丢掉用户的约束
+_UNPARSED_CONSTRAINT_RE = re.compile(
+    r"预算|价格|价位|\d+\s*(?:元|块)|以内|以下|不超过|便宜|评分|好评|口碑|星级|[1-5一二三四五]星|豪华|高档|经济型|性价比"
+)
+
+
+def _cn_number(text: str) -> Optional[int]:
+    if text.isdigit():
+        return int(text)
+    if text == "十":
+        return 10
+    if len(text) == 1:
+        return _CN_DIGITS.get(text)
+    if text.startswith("十"):
+        return 10 + _CN_DIGITS.get(text[1], 0)
+    if len(text) == 2 and text.endswith("十"):
+        return _CN_DIGITS.get(text[0], 0) * 10
+    if len(text) == 3 and text[1] == "十":
+        return _CN_DIGITS.get(text[0], 0) * 10 + _CN_DIGITS.get(text[2], 0)
+    return None
+
+
+def _first_number(match: re.Match) -> Optional[int]:
+    value = next((g for g in match.groups() if g), None)
+    return _cn_number(value) if value else None
+
+
+def _resolve_date(year: Optional[str], month: int, day: int, today: date) -> Optional[date]:
+    try:
+        if year:
+            return date(int(year), month, day)
+        candidate = date(today.year, month, day)
+        # 没写年份且日期已过，视为明年
+        return candidate if candidate >= today else date(today.year + 1, month, day)
+    except ValueError:
+        return None
+
+
+def _parse_dates(text: str, today: date) -> Tuple[Optional[date], Optional[date], str]:
+    """返回 (入住日期, 退房日期, 去掉日期表述后的文本)"""
+    dates: List[date] = []
+    for match in _ABS_DATE_RE.finditer(text):
+        parsed = _resolve_date(match.group(1), int(match.group(2)), int(match.group(3)), today)
+        if parsed:
+            dates.append(parsed)
+    text = _ABS_DATE_RE.sub(" ", text)
+
+    # "13号到15号" 的后半段只有日，沿用前一个日期的月份
+    if len(dates) == 1:
+        day_match = _DAY_ONLY_RE.search(text)
+        if day_match:
+            try:
+                second = dates[0].replace(day=int(day_match.group(1)))
+                if second > dates[0]:
+                    dates.append(second)
+            except ValueError:
+                pass
+            text = _DAY_ONLY_RE.sub(" ", text)
+
+    for word, offset in _REL_DATES:
+        if word in text:
+            dates.append(today + timedelta(days=offset))
+            text = text.replace(word, " ")
+
+    dates.sort()
+    checkin = dates[0] if dates else None
+    checkout = dates[1] if len(dates) > 1 and dates[1] > dates[0] else None
+
+    # 晚数只有用上（推出退房日期，或与已有退房日期一致）时才从文本中去掉，否则留给调用方判定为未解析
+    nights_match = _NIGHTS_RE.search(text)
+    if nights_match:
+        nights = _first_number(nights_match)
+        if checkin and nights and not checkout:
+            checkout = checkin + timedelta(days=nights)
+        if checkin and nights and (checkout - checkin).days == nights:
+            text = _NIGHTS_RE.sub(" ", text)
+    if checkin and not checkout:
+        checkout = checkin + timedelta(days=1)
+    return checkin, checkout, text
+
+
+def _resolve_nth_night(match: re.Match, travel_plan: Dict) -> Optional[Dict]:
+    """按旅行计划解析"第X晚"：当天日期入住，住在当天最后一个景点附近"""
+    n = _first_number(match)
+    for item in travel_plan.get("itinerary") or []:
+        if item.get("day") != n:
+            continue
+        try:
+            checkin = date.fromisoformat(str(item.get("date")))
+        except ValueError:
+            return None
+        names = [a.get("name") for a in item.get("activities") or [] if a.get("name")]
+        if not names:
+            return None
+        return {
+            "destination": names[-1],
+            "checkin_date": checkin.isoformat(),
+            "checkout_date": (checkin + timedelta(days=1)).isoformat(),
+        }
+    return None
+
+
+def requested_days(message: str) -> List[int]:
+    """
+    消息中提到的"第X晚/第X天/Day X"对应的行程天
+    第 X 晚需要当天和次日的行程（次日第一个景点也影响住哪里）
+    """
+    days: List[int] = []
+    for match in _NTH_NIGHT_RE.finditer(message):
+        n = _first_number(match)
+        if n:
+            days.extend(d for d in (n, n + 1) if d not in days)
+    return days
+
+
+def _partial_field(text: str, name: str, value_pattern: str) -> Optional[str]:
+    match = re.search(rf'"{re.escape(name)}"\s*:\s*{value_pattern}', text)
+    return match.group(1) if match else None
+
+
+def partial_intent_params(text: str) -> Optional[Dict]:
+    """
+    从 LLM 流式输出到一半的意图 JSON 中提取搜索参数
+
+    目的地、入住和退房日期都已完整输出，且尚未判定为普通聊天或不预订时返回参数，否则返回 None；
+    此时人数等字段可能还没输出，调用方需要在完整结果出来后再核对一次
+    """
+    if _partial_field(text, "hotel-book", r"(false)") or _partial_field(text, "intent", r'"(chat)"'):
+        return None
+    params: Dict = {}
+    for name in _PARTIAL_STRING_FIELDS:
+        value = _partial_field(text, name, r'"((?:[^"\\]|\\.)*)"')
+        if value is None:
+            return None
+        try:
+            params[name] = json.loads(f'"{value}"').strip()
+        except ValueError:
+            return None
+    if not params["destination"] or not all(
+        _PARTIAL_DATE_RE.fullmatch(params[k]) for k in ("checkin_date", "checkout_date")
+    ):
+        return None
+    for name in _PARTIAL_NUMBER_FIELDS:
+        value = _partial_field(text, name, r"(\d+)\s*[,}]")
+        if value is not None:
+            params[name] = int(value)
+    pets = _partial_field(text, "pets", r"(true|false)")
+    if pets is not None:
+        params["pets"] = pets == "true"
+    return params
+
+
+def _parse_headcount(text: str) -> Tuple[Optional[Dict], str]:
+    """解析成人、儿童、房间数与宠物；表述有歧义时返回 (None, text)"""
+    params: Dict = {}
+    if _FAMILY_RE.search(text):
+        return None, text
+
+    children_match = _CHILDREN_RE.search(text)
+    if children_match:
+        params["children"] = _first_number(children_match)
+        text = _CHILDREN_RE.sub(" ", text)
+
+    adults_match = _ADULTS_RE.search(text)
+    people_match = _PEOPLE_RE.search(text)
+    if adults_match:
+        params["adults"] = _first_number(adults_match)
+        text = _ADULTS_RE.sub(" ", text)
+    elif people_match:
+        # "三个人带一个孩子"无法确定成人数量
+        if "children" in params:
+            return None, text
+        params["adults"] = _first_number(people_match)
+    text = _PEOPLE_RE.sub(" ", text)
+
+    rooms_match = _ROOMS_RE.search(text)
+    if rooms_match:
+        params["rooms"] = _first_number(rooms_match)
+        text = _ROOMS_RE.sub(" ", text)
+
+    if _PETS_RE.search(text):
+        params["pets"] = True
+        text = _PETS_RE.sub(" ", text)
+
+    if any(value is None or value == 0 for key, value in params.items() if key != "pets"):
+        return None, text
+    return params, text
+
+
+def _extract_destination(text: str) -> Optional[str]:
+    # 去掉日期、人数等表述后留下的空白，避免把目的地和后面的"的酒店"隔开
+    cleaned = _FILLER_RE.sub("", re.sub(r"\s+", "", text))
+    cleaned = _HOTEL_TYPE_RE.sub("", cleaned)
+    for pattern in _DESTINATION_PATTERNS:
+        match = pattern.search(cleaned)
+        if not match:
+            continue
+        destination = match.group(1).strip()
+        if (
+            2 <= len(destination) <= 15
+            and not _BAD_DESTINATION_RE.search(destination)
+            and not _GENERIC_DESTINATION_RE.fullmatch(destination)
+        ):
+            return destination
+    return None
+
+
+def _miss(reason: str) -> None:
+    INTENT_FAST_PATH_TOTAL.inc(outcome="miss", reason=reason)
+    return None
+
+
+def fast_intent(message: str, travel_plan: Optional[Dict] = None, today: Optional[date] = None) -> Optional[Dict]:
+    """
+    用规则识别酒店意图
+
+    Returns:
+        与 LLM 意图分析相同结构的结果 {"intent": "book_hotel", "hotel-book": ..., "params": {...}}；
+        无法高置信度判断时返回 None
+    """
+    today = today or date.today()
+    text = message.strip()
+    if not text or len(text) > 80:
+        return _miss("length")
+    if not _HOTEL_RE.search(text):
+        return _miss("no_hotel_term")
+    if _NEGATION_RE.search(text):
+        return _miss("ambiguous")
+    if _UNPARSED_CONSTRAINT_RE.search(text):
+        return _miss("unparsed_constraint")
+
+    hotel_book = bool(_BOOK_RE.search(text))
+    params: Dict = {}
+
+    nth_match = _NTH_NIGHT_RE.search(text)
+    if nth_match:
+        if not travel_plan:
+            return _miss("nth_night_without_plan")
+        resolved = _resolve_nth_night(nth_match, travel_plan)
+        if not resolved:
+            return _miss("nth_night_unresolved")
+        params.update(resolved)
+        text = _NTH_NIGHT_RE.sub(" ", text)
+
+    checkin, checkout, text = _parse_dates(text, today)
+    if _UNPARSED_DATE_RE.search(text):
+        return _miss("unparsed_date")
+    if _NIGHTS_RE.search(text):
+        return _miss("unparsed_nights")
+    if checkin and "checkin_date" not in params:
+        params["checkin_date"] = checkin.isoformat()
+        params["checkout_date"] = checkout.isoformat()
+
+    headcount, text = _parse_headcount(text)
+    if headcount is None:
+        return _miss("ambiguous_headcount")
+    params.update(headcount)
+
+    if "destination" not in params:
+        destination = _extract_destination(text)
+        if not destination:
+            return _miss("no_destination")
+        params["destination"] = destination
+
+    INTENT_FAST_PATH_TOTAL.inc(outcome="hit", reason="")
+    return {"intent": "book_hotel", "hotel-book": hotel_book, "params": params, "source": "rules"}
+
+
+def fast_path_stats() -> Dict:
+    """规则快速通道命中率"""
+    counts = INTENT_FAST_PATH_TOTAL.snapshot()
+    hits = sum(v for k, v in counts.items() if k.startswith("hit,"))
+    misses = {k.split(",", 1)[1]: v for k, v in counts.items() if k.startswith("miss,")}
+    total = hits + sum(misses.values())
+    return {
+        "enabled": INTENT_FAST_PATH,
+        "hits": hits,
+        "misses": sum(misses.values()),
+        "miss_reasons": misses,
+        "hit_rate": round(hits / total, 3) if total else 0.0,
+    }
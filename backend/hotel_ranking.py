@@ -0,0 +1,201 @@
+"""
+酒店数值解析与预排序
+把抓取到的价格、评分、位置文本解析为数值字段，按用户约束过滤并打分，
+只把排名靠前的精简记录交给 LLM 生成推荐
+"""
+import math
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+# 交给 LLM 的候选酒店数量
+HOTEL_RANK_TOP_K = int(os.getenv("HOTEL_RANK_TOP_K", 6))
+
+# 各项得分的权重
+RANK_WEIGHTS = {
+    "score": 0.45,      # 住客评分
+    "reviews": 0.15,    # 点评数量（评分的可信度）
+    "price": 0.25,      # 价格越低越好
+    "distance": 0.15,   # 距离越近越好
+}
+
+# 货币符号/写法 -> 货币代码，按长度从长到短匹配（"HK$" 先于 "$"）
+_CURRENCY_SYMBOLS = [
+    ("HK$", "HKD"), ("US$", "USD"), ("NT$", "TWD"), ("MOP$", "MOP"), ("S$", "SGD"),
+    ("CNY", "CNY"), ("RMB", "CNY"), ("HKD", "HKD"), ("USD", "USD"), ("EUR", "EUR"),
+    ("JPY", "JPY"), ("GBP", "GBP"), ("元", "CNY"), ("￥", "CNY"), ("¥", "CNY"),
+    ("€", "EUR"), ("£", "GBP"), ("$", "USD"),
+]
+_NUMBER_RE = re.compile(r"\d[\d,]*(?:\.\d+)?")
+_SCORE_RE = re.compile(r"(?<![\d.])(10(?:\.0)?|\d(?:\.\d)?)(?![\d])")
+_REVIEWS_RE = re.compile(r"(\d[\d,]*)\s*(?:条|則|则|reviews?)", re.IGNORECASE)
+_DISTANCE_RE = re.compile(r"(\d+(?:\.\d+)?)\s*(公里|千米|km|米|m)(?![a-z])", re.IGNORECASE)
+
+
+def _to_number(text: str) -> Optional[float]:
+    try:
+        return float(text.replace(",", ""))
+    except ValueError:
+        return None
+
+
+def parse_price(text: Optional[str]) -> Tuple[Optional[float], Optional[str]]:
+    """
+    "HK$ 518" -> (518.0, "HKD")
+    含原价和折后价时取最后一个金额（折后价）
+    """
+    if not text:
+        return None, None
+    numbers = _NUMBER_RE.findall(text)
+    if not numbers:
+        return None, None
+    currency = next((code for symbol, code in _CURRENCY_SYMBOLS if symbol in text), None)
+    return _to_number(numbers[-1]), currency
+
+
+def parse_score(text: Optional[str]) -> Tuple[Optional[float], Optional[int]]:
+    """"8.7 很棒 243条点评" -> (8.7, 243)"""
+    if not text:
+        return None, None
+    reviews = None
+    reviews_match = _REVIEWS_RE.search(text)
+    if reviews_match:
+        reviews = int(reviews_match.group(1).replace(",", ""))
+        # 避免把点评数的一部分当成评分
+        text = text[:reviews_match.start()] + text[reviews_match.end():]
+    score_match = _SCORE_RE.search(text)
+    score = float(score_match.group(1)) if score_match else None
+    return score, reviews
+
+
+def parse_distance(text: Optional[str]) -> Optional[float]:
+    """"距市中心 1.2 公里" -> 1.2，"800 米" -> 0.8（单位：公里）"""
+    if not text:
+        return None
+    match = _DISTANCE_RE.search(text)
+    if not match:
+        return None
+    value = float(match.group(1))
+    return value / 1000 if match.group(2).lower() in ("米", "m") else value
+
+
+def enrich_hotel(hotel: Dict) -> Dict:
+    """为抓取到的酒店补充数值字段（原文本字段保留，供展示使用）"""
+    price_value, currency = parse_price(hotel.get("price"))
+    score_value, review_count = parse_score(hotel.get("score"))
+    hotel["price_value"] = price_value
+    hotel["currency"] = currency
+    hotel["score_value"] = score_value
+    hotel["review_count"] = review_count
+    hotel["distance_km"] = parse_distance(hotel.get("location"))
+    return hotel
+
+
+def _normalize(column: List[Optional[float]], higher_is_better: bool = True) -> List[float]:
+    """把一列数值按最小-最大归一化到 [0, 1]；缺失值取中性的 0.5"""
+    known = [v for v in column if v is not None]
+    if not known:
+        return [0.5] * len(column)
+    low, high = min(known), max(known)
+    span = high - low
+    result = []
+    for v in column:
+        if v is None:
+            result.append(0.5)
+        elif span == 0:
+            result.append(1.0)
+        else:
+            scaled = (v - low) / span
+            result.append(scaled if higher_is_better else 1 - scaled)
+    return result
+
+
+def _normalize_price(price: List[Optional[float]], currency: List[Optional[str]]) -> List[float]:
+    """
+    价格得分（越低越好），按货币分组分别归一化：不同货币的金额不可直接比较，
+    否则日元、韩元等标价总显得比人民币贵；组内只有一家酒店时无从比较，取中性的 0.5
+    """
+    groups: Dict[Optional[str], List[int]] = {}
+    for i, code in enumerate(currency):
+        groups.setdefault(code, []).append(i)
+    if len(groups) == 1:
+        return _normalize(price, higher_is_better=False)
+    result = [0.5] * len(price)
+    for indexes in groups.values():
+        if len(indexes) < 2:
+            continue
+        for i, value in zip(indexes, _normalize([price[i] for i in indexes], higher_is_better=False)):
+            result[i] = value
+    return result
+
+
+def rank_hotels(
+    hotels: List[Dict],
+    max_price: Optional[float] = None,
+    min_score: Optional[float] = None,
+    top_k: int = HOTEL_RANK_TOP_K,
+) -> List[Dict]:
+    """
+    按用户约束过滤并打分排序，返回前 top_k 家
+
+    max_price 为人民币，只用于过滤人民币标价的酒店；
+    过滤后没有任何酒店时放宽约束，仍按得分返回，避免推荐为空
+
+    Returns:
+        [{"index": 在原列表中的位置, "rank_score": 得分, "hotel": 酒店信息}, ...]
+    """
+    if not hotels:
+        return []
+    rows = [hotel if "price_value" in hotel else enrich_hotel(dict(hotel)) for hotel in hotels]
+
+    # 按列计算各项得分
+    price = [row["price_value"] for row in rows]
+    score = [row["score_value"] for row in rows]
+    reviews = [math.log1p(row["review_count"]) if row["review_count"] is not None else None for row in rows]
+    distance = [row["distance_km"] for row in rows]
+    columns = {
+        "score": _normalize(score),
+        "reviews": _normalize(reviews),
+        "price": _normalize_price(price, [row["currency"] for row in rows]),
+        "distance": _normalize(distance, higher_is_better=False),
+    }
+    totals = [
+        sum(RANK_WEIGHTS[name] * column[i] for name, column in columns.items())
+        for i in range(len(rows))
+    ]
+
+    # max_price 来自用户意图，单位是人民币；抓取到的价格按页面展示的货币（HKD/USD 等），
+    # 没有汇率换算，只对人民币标价的酒店做价格过滤，其他货币或无法识别货币时不按价格排除
+    def passes(i: int) -> bool:
+        if (max_price is not None and price[i] is not None and rows[i]["currency"] == "CNY"
+                and price[i] > max_price):
+            return False
+        if min_score is not None and score[i] is not None and score[i] < min_score:
+            return False
+        return True
+
+    candidates = [i for i in range(len(rows)) if passes(i)] or list(range(len(rows)))
+    candidates.sort(key=lambda i: totals[i], reverse=True)
+    return [
+        {"index": i, "rank_score": round(totals[i], 3), "hotel": rows[i]}
+        for i in candidates[:top_k]
+    ]
+
+
+def compact_records(ranked: List[Dict]) -> List[Dict]:
+    """生成发给 LLM 的精简记录，只保留推荐需要的字段并去掉空值"""
+    records = []
+    for item in ranked:
+        hotel = item["hotel"]
+        record = {
+            "index": item["index"],
+            "name": hotel.get("name"),
+            "price": hotel.get("price"),
+            "score": hotel.get("score_value"),
+            "reviews": hotel.get("review_count"),
+            "location": hotel.get("location"),
+            "distance_km": hotel.get("distance_km"),
+            "facilities": (hotel.get("facilities") or [])[:3],
+        }
+        records.append({k: v for k, v in record.items() if v not in (None, [], "")})
+    return records
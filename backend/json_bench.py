@@ -0,0 +1,241 @@
+"""
+LLM 输出 JSON 提取基准测试
+
+用接近真实大小的每日计划输出（干净的、带代码块标记/前缀说明/注释/尾随逗号的），
+对比旧版 extract_first_json（最多四次 json.loads + 正则清理）与 JsonObjectExtractor：
+统计一次性提取（JsonObjectExtractor.parse）的耗时、是否解析成功、结果是否一致，
+以及流式逐片喂入（feed，扫描分摊在 LLM 输出期间）的总耗时
+
+用法：
+    python json_bench.py
+    python json_bench.py --days 7 14 30 -n 200 --json json_bench.json
+"""
+import argparse
+import json
+import logging
+import re
+import statistics
+import time
+from typing import Callable, Dict, List, Optional
+
+from core.json_stream import JsonObjectExtractor
+
+logger = logging.getLogger("json_bench")
+logger.setLevel(logging.CRITICAL)   # 两种实现都不输出日志，只比较解析本身
+
+STREAM_CHUNK_CHARS = 24  # 流式输出每个片段的大约字符数
+
+
+def legacy_extract_first_json(text: str) -> dict:
+    """改为单次扫描之前的 main.extract_first_json，原样保留用于对比"""
+    cleaned_text = text.strip()
+
+    if cleaned_text.startswith('```'):
+        cleaned_text = re.sub(r'^```(?:json)?\s*\n?', '', cleaned_text)
+        cleaned_text = re.sub(r'\n?```\s*$', '', cleaned_text)
+        cleaned_text = cleaned_text.strip()
+
+    if not cleaned_text.startswith('{'):
+        json_start = cleaned_text.find('{')
+        if json_start > 0:
+            prefix = cleaned_text[:json_start].strip()
+            if len(prefix) < 50:
+                logger.warning(f"检测到JSON前缀文字，已移除: {prefix}")
+                cleaned_text = cleaned_text[json_start:]
+
+    try:
+        return json.loads(cleaned_text)
+    except json.JSONDecodeError as e:
+        logger.debug(f"直接解析失败: {e}")
+
+    start_idx = cleaned_text.find('{')
+    if start_idx == -1:
+        return {"type": "chat", "content": text}
+
+    bracket_stack = []
+    in_string = False
+    escape = False
+    for i in range(start_idx, len(cleaned_text)):
+        char = cleaned_text[i]
+        if escape:
+            escape = False
+            continue
+        if char == '\\':
+            escape = True
+            continue
+        if char == '"':
+            in_string = not in_string
+            continue
+        if not in_string:
+            if char == '{':
+                bracket_stack.append('{')
+            elif char == '[':
+                bracket_stack.append('[')
+            elif char == '}':
+                if bracket_stack and bracket_stack[-1] == '{':
+                    bracket_stack.pop()
+                    if len(bracket_stack) == 0:
+                        json_str = cleaned_text[start_idx:i+1]
+                        try:
+                            return json.loads(json_str)
+                        except Exception as e:
+                            logger.error(f"JSON解析失败: {e}, 内容: {json_str[:200]}...")
+                        break
+            elif char == ']':
+                if bracket_stack and bracket_stack[-1] == '[':
+                    bracket_stack.pop()
+
+    try:
+        return json.loads(cleaned_text)
+    except Exception as e:
+        logger.debug(f"整体解析失败: {e}")
+
+    try:
+        cleaned_no_comments = re.sub(r'//.*?(?=\n|$)', '', cleaned_text)
+        cleaned_no_comments = re.sub(r'/\*.*?\*/', '', cleaned_no_comments, flags=re.DOTALL)
+        return json.loads(cleaned_no_comments)
+    except Exception as e:
+        logger.debug(f"移除注释后仍解析失败: {e}")
+
+    return {"type": "chat", "content": text}
+
+
+def extract(text: str) -> dict:
+    """与 main.extract_first_json 相同的调用方式（不引入 main 及其依赖）"""
+    result = JsonObjectExtractor.parse(text).result()
+    return result if isinstance(result, dict) else {"type": "chat", "content": text}
+
+
+def extract_streamed(chunks: List[str]) -> dict:
+    """流式调用：逐片喂入，结束时直接取结果"""
+    extractor = JsonObjectExtractor()
+    for chunk in chunks:
+        extractor.feed(chunk)
+    result = extractor.result()
+    return result if isinstance(result, dict) else {"type": "chat", "content": "".join(chunks)}
+
+
+def sample_plan(days: int) -> Dict:
+    """与计划生成提示词要求的结构一致的 daily_plan_json"""
+    slots = [("09:00", "宽窄巷子"), ("11:30", "人民公园"), ("14:00", "成都博物馆"), ("19:00", "锦里古街")]
+    itinerary = []
+    for day in range(1, days + 1):
+        itinerary.append({
+            "day": day,
+            "date": f"2025-11-{day % 28 + 1:02d}",
+            "activities": [
+                {
+                    "time": time_slot,
+                    "name": f"{name}（第{day}天）",
+                    "description": f"游览{name}，感受当地的历史文化与生活气息，建议预留两到三小时，"
+                                   f"避开午间人流高峰。\"推荐\"在附近品尝特色小吃。",
+                    "location": {"lat": 30.66 + day / 1000, "lng": 104.06 + day / 1000},
+                    "transport": "地铁2号线 / 步行约10分钟",
+                    "tips": f"门票可在官网 https://example.com/tickets/{day} 提前预约",
+                }
+                for time_slot, name in slots
+            ],
+            "accommodation": {"area": "春熙路", "budget": "400-600元/晚"},
+        })
+    return {
+        "type": "daily_plan_json",
+        "plan": {"destination": "成都", "origin": "上海", "start_date": "2025-11-01",
+                 "end_date": f"2025-11-{days:02d}", "people": 2},
+        "itinerary": itinerary,
+        "notes": "天气转凉，注意携带外套；热门景点周末需提前预约。",
+        "corrections": [],
+    }
+
+
+def variants(plan: Dict) -> Dict[str, str]:
+    """同一份计划的几种常见 LLM 输出形态"""
+    clean = json.dumps(plan, ensure_ascii=False, indent=2)
+    commented = re.sub(r'("day": (\d+),)', r'\1 // 第\2天', clean)
+    commented = commented.replace("{\n", "{\n  /* 以下为生成的行程 */\n", 1)
+    trailing = re.sub(r'(["\d\]}e])(\n\s*[}\]])', r'\1,\2', clean)
+    mixed = re.sub(r'(["\d\]}e])(\n\s*[}\]])', r'\1,\2', commented)
+    return {
+        "clean": clean,
+        "fenced": f"```json\n{clean}\n```",
+        "prefixed": f"好的，这是为您生成的行程计划：\n{clean}\n希望您旅途愉快！",
+        "comments": commented,
+        "trailing_commas": trailing,
+        "mixed": f"好的，这是计划：\n```json\n{mixed}\n```",
+    }
+
+
+def _chunks(text: str, size: int = STREAM_CHUNK_CHARS) -> List[str]:
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def _time_us(fn: Callable, arg, runs: int) -> List[float]:
+    fn(arg)  # 预热
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn(arg)
+        samples.append((time.perf_counter() - started) * 1e6)
+    return samples
+
+
+def _summarize(samples: List[float]) -> Dict:
+    ordered = sorted(samples)
+    return {
+        "mean_us": round(statistics.mean(samples), 1),
+        "p50_us": round(ordered[len(ordered) // 2], 1),
+        "p95_us": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 1),
+    }
+
+
+def bench(day_counts: List[int], runs: int) -> List[Dict]:
+    rows = []
+    for days in day_counts:
+        plan = sample_plan(days)
+        for name, text in variants(plan).items():
+            legacy_result = legacy_extract_first_json(text)
+            new_result = extract(text)
+            extractor = JsonObjectExtractor.parse(text)
+            extractor.result()
+            chunks = _chunks(text)
+            legacy = _summarize(_time_us(legacy_extract_first_json, text, runs))
+            single = _summarize(_time_us(extract, text, runs))
+            streamed = _summarize(_time_us(extract_streamed, chunks, runs))
+            rows.append({
+                "days": days,
+                "variant": name,
+                "chars": len(text),
+                "legacy": {**legacy, "parsed": legacy_result == plan},
+                "single_pass": {**single, "parsed": new_result == plan, "repairs": extractor.repairs},
+                "streamed": {**streamed, "chunks": len(chunks)},
+                "speedup": round(legacy["mean_us"] / single["mean_us"], 2) if single["mean_us"] else None,
+            })
+    return rows
+
+
+def _print_report(rows: List[Dict]):
+    print(f"{'天数':<6}{'形态':<18}{'字符':>8}{'旧版 µs':>12}{'单次 µs':>12}{'流式 µs':>12}{'加速':>8}  "
+          f"{'旧版解析':<8}{'单次解析':<8}修复")
+    for row in rows:
+        legacy, single, streamed = row["legacy"], row["single_pass"], row["streamed"]
+        print(f"{row['days']:<6}{row['variant']:<18}{row['chars']:>8}{legacy['mean_us']:>12.1f}"
+              f"{single['mean_us']:>12.1f}{streamed['mean_us']:>12.1f}{row['speedup'] or 0:>7.2f}x  "
+              f"{'✓' if legacy['parsed'] else '✗':<8}{'✓' if single['parsed'] else '✗':<8}"
+              f"{','.join(single['repairs']) or '-'}")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="LLM 输出 JSON 提取基准测试")
+    parser.add_argument("--days", type=int, nargs="+", default=[3, 7, 14], help="生成计划的天数")
+    parser.add_argument("-n", "--runs", type=int, default=100)
+    parser.add_argument("--json", help="把报告另存为 JSON 文件")
+    args = parser.parse_args(argv)
+
+    rows = bench(args.days, args.runs)
+    _print_report(rows)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
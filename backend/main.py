@@ -4,15 +4,26 @@ import json
 from typing import List, Optional
 from fastapi import FastAPI, HTTPException, UploadFile, File, Request, status
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from openai import OpenAI
 from dotenv import load_dotenv
 import uvicorn
 import logging
 import asyncio
 from hotel_agent import HotelAgent
+from hotel_intent import fast_path_stats
+from trip_planner import trip_planner
+from core.browser_pool import browser_pool
+from core.browser_profile import browser_profile
+from core.hotel_cache import hotel_cache, normalize_search_key
+from core.json_stream import JsonArrayStream, JsonObjectExtractor
+from core.llm_gateway import llm_gateway
+from core.scrape_queue import scrape_queue
+from core.metrics import metrics
+from core.placeholder_stream import PlaceholderScanner
+from core.prompt_budget import compact_json, record_prompt
+from core.sse import sse_stream
 import urllib.parse
 import urllib.request
 
@@ -57,123 +68,183 @@ async def startup():
     async with engine.begin() as conn:
         # 仅在测试环境使用，生产环境建议使用 Alembic 迁移
         await conn.run_sync(Base.metadata.create_all)
+    # 预热酒店搜索使用的浏览器池（失败时搜索会退回到临时启动浏览器）
+    try:
+        await browser_pool.start()
+    except Exception as e:
+        logger.error(f"浏览器池启动失败: {e}")
 
-# 初始化OpenAI客户端
-client = OpenAI(
-    base_url="https://ark.cn-beijing.volces.com/api/v3",
-    api_key=os.environ.get("ARK_API_KEY"),
-)
+# 关闭事件：释放浏览器池与 LLM 连接池
+@app.on_event("shutdown")
+async def shutdown():
+    await browser_pool.stop()
+    await llm_gateway.close()
 
 # 初始化酒店代理
 hotel_agent = HotelAgent()
 
 AMAP_KEY = os.environ.get("AMAP_KEY")
 
-def extract_first_json(text: str) -> dict:
+# 意图分析输出到一半、已能解析出目的地和日期时提前启动酒店搜索，与剩余的 LLM 输出重叠
+HOTEL_SPECULATIVE_SEARCH = os.getenv("HOTEL_SPECULATIVE_SEARCH", "true").lower() == "true"
+SPECULATIVE_SEARCHES = metrics.counter(
+    "hotel_speculative_search_total", "根据部分意图提前启动的酒店搜索（adopted 被采用 / discarded 被丢弃）", ("outcome",)
+)
+
+JSON_REPAIRS = metrics.counter(
+    "llm_json_repairs_total", "解析 LLM 输出的 JSON 时做的修复（repair 为 none 表示无需修复、failed 表示解析失败）", ("repair",)
+)
+
+def extract_first_json(text: str, extractor: Optional[JsonObjectExtractor] = None) -> dict:
     """
     提取第一个有效的JSON对象（支持嵌套数组和对象）
-    增强版：自动清理常见的LLM输出格式问题
+    干净的输出只解码一次；否则单次扫描同时处理代码块标记、前后说明文字、注释和尾随逗号后再解码一次；
+    无法解析时按聊天内容返回
+
+    Args:
+        extractor: 流式调用时已逐片喂入完整文本的提取器，传入后不再重新扫描 text
     """
-    import re
-    
-    # 0. 预处理：清理常见的LLM输出问题
-    cleaned_text = text.strip()
-    
-    # 移除markdown代码块标记
-    if cleaned_text.startswith('```'):
-        # 移除开头的```json或```
-        cleaned_text = re.sub(r'^```(?:json)?\s*\n?', '', cleaned_text)
-        # 移除结尾的```
-        cleaned_text = re.sub(r'\n?```\s*$', '', cleaned_text)
-        cleaned_text = cleaned_text.strip()
-    
-    # 移除常见的前缀文字（如"好的，这是计划："）
-    if not cleaned_text.startswith('{'):
-        # 查找第一个{的位置，移除之前的所有内容
-        json_start = cleaned_text.find('{')
-        if json_start > 0:
-            prefix = cleaned_text[:json_start].strip()
-            if len(prefix) < 50:  # 只移除短前缀（避免误删）
-                logger.warning(f"检测到JSON前缀文字，已移除: {prefix}")
-                cleaned_text = cleaned_text[json_start:]
-    
-    # 1. 直接尝试解析清理后的文本
-    try:
-        return json.loads(cleaned_text)
-    except json.JSONDecodeError as e:
-        logger.debug(f"直接解析失败: {e}")
-    
-    # 2. 查找JSON对象（使用栈匹配括号，支持数组）
-    start_idx = cleaned_text.find('{')
-    if start_idx == -1:
-        logger.warning("未找到JSON起始括号")
-        return {"type": "chat", "content": text}
-    
-    # 使用栈来跟踪所有类型的括号
-    bracket_stack = []
-    in_string = False
-    escape = False
-    
-    for i in range(start_idx, len(cleaned_text)):
-        char = cleaned_text[i]
-        
-        if escape:
-            escape = False
-            continue
-            
-        if char == '\\':
-            escape = True
-            continue
-            
-        if char == '"':
-            in_string = not in_string
-            continue
-        
-        if not in_string:
-            if char == '{':
-                bracket_stack.append('{')
-            elif char == '[':
-                bracket_stack.append('[')
-            elif char == '}':
-                if bracket_stack and bracket_stack[-1] == '{':
-                    bracket_stack.pop()
-                    if len(bracket_stack) == 0:
-                        # 找到完整的JSON对象
-                        json_str = cleaned_text[start_idx:i+1]
-                        try:
-                            result = json.loads(json_str)
-                            logger.info(f"✅ 通过括号匹配成功解析JSON")
-                            return result
-                        except Exception as e:
-                            logger.error(f"JSON解析失败: {e}, 内容: {json_str[:200]}...")
-                            pass
-                        break
-            elif char == ']':
-                if bracket_stack and bracket_stack[-1] == '[':
-                    bracket_stack.pop()
-    
-    # 3. 如果栈匹配失败，尝试直接解析整个清理后的文本
-    try:
-        return json.loads(cleaned_text)
-    except Exception as e:
-        logger.debug(f"整体解析失败: {e}")
-    
-    # 4. 最后尝试：移除JSON注释（虽然不标准，但有些LLM会输出）
-    try:
-        # 移除 // 单行注释
-        cleaned_no_comments = re.sub(r'//.*?(?=\n|$)', '', cleaned_text)
-        # 移除 /* */ 多行注释
-        cleaned_no_comments = re.sub(r'/\*.*?\*/', '', cleaned_no_comments, flags=re.DOTALL)
-        result = json.loads(cleaned_no_comments)
-        logger.info(f"✅ 移除注释后成功解析JSON")
+    if extractor is None:
+        extractor = JsonObjectExtractor.parse(text)
+    result = extractor.result()
+    if isinstance(result, dict):
+        for repair in extractor.repairs or ["none"]:
+            JSON_REPAIRS.inc(repair=repair)
+        if extractor.repairs:
+            logger.info(f"✅ 修复后成功解析JSON: {', '.join(extractor.repairs)}")
         return result
-    except Exception as e:
-        logger.debug(f"移除注释后仍解析失败: {e}")
-    
-    # 5. 返回原始内容作为聊天
-    logger.warning(f"无法解析JSON，返回聊天模式。原始内容前100字符: {text[:100]}")
+
+    JSON_REPAIRS.inc(repair="failed")
+    logger.warning(f"无法解析JSON（{extractor.error}），返回聊天模式。原始内容前100字符: {text[:100]}")
     return {"type": "chat", "content": text}
 
+# 以下系统提示词在导入时构建一次，请求中只拼接用户相关的部分
+# 旅行规划需求分析提示词
+TRAVEL_PLAN_INTENT_PROMPT = (
+    "你是一个智能旅行规划助手。你需要判断用户是否需要旅行计划规划推荐。"
+    "输出严格的JSON。当不需要旅行规划时，返回 {\"plan_needed\": false, \"message\": \"normal_chat\"}。"
+    "当需要旅行规划时，返回 {\"plan_needed\": true, \"plan\": {\"destination\": ..., \"origin\": ..., \"start_date\": ..., \"end_date\": ..., \"people\": 可选, \"attractions\": 可选数组}, \"corrections\": 可选列表 }。"
+    "不得添加虚构数据。若用户输入存在明显错误如地名拼写，将在 corrections 中给出 from/to 的纠正，并要求确认。"
+    "优先使用 YYYY-MM-DD 日期格式。"
+)
+
+# 计划生成提示词（用户需求插在两段之间）
+PLAN_GENERATION_PROMPT_HEAD = (
+    "# 旅行规划JSON生成任务\n\n"
+    "## 🚨 输出格式要求（必须严格遵守）\n"
+    "1. **只输出一个完整的JSON对象，不要添加任何前后文字、标记或解释**\n"
+    "2. **不要使用markdown代码块标记（```json）**\n"
+    "3. **确保JSON完整闭合，所有括号、引号必须配对**\n"
+    "4. **不要截断输出，必须输出完整的JSON**\n"
+    "5. **使用标准JSON格式，不要使用注释或非标准语法**\n\n"
+
+    "## ✅ 正确示例\n"
+    '{"type":"daily_plan_json","plan":{"destination":"上海","origin":"成都","start_date":"2025-11-16","end_date":"2025-11-18","people":2,"city":"上海"},"itinerary":[{"day":1,"date":"2025-11-16","title":"Day 1","activities":[{"name":"外滩","notes":"观赏夜景"}],"summary":"交通以地铁为主"}]}\n\n'
+
+    "## ❌ 错误示例\n"
+    "```json\n{...}\n```  ← 不要markdown标记\n"
+    "好的，这是计划：{...}  ← 不要额外文字\n"
+    '{"type":"daily_plan_json"...  ← 不要截断\n\n'
+)
+
+PLAN_GENERATION_PROMPT_TAIL = (
+    "## 🎯 JSON结构规范\n"
+    "```\n"
+    "{\n"
+    '  "type": "daily_plan_json",  // 固定值\n'
+    '  "plan": {\n'
+    '    "destination": "目的地",\n'
+    '    "origin": "出发地",\n'
+    '    "start_date": "YYYY-MM-DD",\n'
+    '    "end_date": "YYYY-MM-DD",\n'
+    '    "people": 2,  // 人数，默认2\n'
+    '    "city": "城市名"  // ⚠️ 必填：从destination提取城市名（如"上海迪士尼"→"上海"）\n'
+    "  },\n"
+    '  "itinerary": [  // 每日行程数组\n'
+    "    {\n"
+    '      "day": 1,\n'
+    '      "date": "YYYY-MM-DD",\n'
+    '      "title": "Day 1",\n'
+    '      "activities": [  // 当天活动数组\n'
+    '        {"name": "景点官方名称", "notes": "可选说明"}\n'
+    "      ],\n"
+    '      "summary": "当天总结（交通方式、注意事项）"\n'
+    "    }\n"
+    "  ]\n"
+    "}\n"
+    "```\n\n"
+
+    "## 📌 行程规划规则\n"
+    "1. **景点选择**：\n"
+    "   - 用户指定景点(attractions)：必须包含，可适当补充\n"
+    "   - 未指定景点：根据目的地推荐热门景点\n"
+    "2. **排期规则**：\n"
+    "   - 全天景点（游乐园/爬山）：单独一天\n"
+    "   - 城市打卡（博物馆/寺庙）：每天3-4个，邻近景点组合\n"
+    "3. **活动名称**：使用标准化中文景点官方名称（如\"外滩\"而非\"外滩风景区\"）\n"
+    "4. **城市字段**：从destination提取城市名，不带\"市\"字（\"杭州\"不是\"杭州市\"）\n\n"
+
+    "## ⚠️ 最后提醒\n"
+    "- 第一个字符必须是 `{`\n"
+    "- 最后一个字符必须是 `}`\n"
+    "- 中间不要有任何非JSON内容\n"
+    "- 确保所有字符串使用双引号\n"
+    "- 确保JSON完整不截断\n\n"
+    "现在开始输出JSON："
+)
+
+# 旅行需求收集提示词（草稿与当前计划插在开头一行之后）
+CHAT_INTENT_PROMPT_HEAD = "你是旅行规划助手，职责：收集旅行必填信息。\n"
+
+CHAT_INTENT_PROMPT_RULES = (
+    "\n【输出格式】严格JSON，无任何额外文字！\n"
+    "正确：{\"type\":\"chat\",\"content\":\"...\"}\n"
+    "错误：好的，{...}（不要任何前后文字）\n"
+    "\n【输出类型】\n"
+    "1. 普通聊天：{\"type\":\"chat\",\"content\":\"...\"}\n"
+    "2. 收集信息：{\"type\":\"draft_update\",\"updates\":{...},\"draft\":{...},\"missing_required\":[...],\"is_complete\":true/false,\"next_question\":\"...\"}\n"
+    "3. 修改计划：{\"type\":\"daily_plan_json\",\"plan\":{...},\"itinerary\":[...]}（当current_plan存在且用户要求修改时）\n"
+    "\n【核心规则 - 重要】\n"
+    "你只负责收集4个必填字段：\n"
+    "1. destination - 目的地城市\n"
+    "2. origin - 出发地城市\n"
+    "3. start_date - 开始日期（YYYY-MM-DD）\n"
+    "4. end_date - 结束日期（YYYY-MM-DD）\n"
+    "\n【可选字段 - 不要追问】\n"
+    "- people：人数（用户提到就记录，没提到就null）\n"
+    "- attractions：景点列表（用户提到就记录，没提到就null或[]）\n"
+    "❌ 绝对不要主动询问：\"还想去哪些景点\"、\"想去什么地方\"\n"
+    "✅ 用户没提景点很正常，我们会自动推荐\n"
+    "\n【判断完成】\n"
+    "当4个必填字段都有值时：\n"
+    "- 设置 is_complete = true\n"
+    "- next_question 可以是确认信息，如：\"好的，已收集完成！正在为您规划行程...\"\n"
+    "\n【合并逻辑】\n"
+    "- 提取用户新输入中的字段\n"
+    "- 与草稿合并（不覆盖已有非空字段）\n"
+    "- 缺少必填字段时，自然追问（只问缺的）\n"
+    "\n再次强调：只输出JSON！"
+)
+
+PLAN_MODIFICATION_RULES = """⚠️ 计划修改模式已激活！
+- 如果用户的输入是要修改这个计划（例如："把第二天的XX改成YY"、"增加一个景点"、"删除第三天"、"调整行程"等），请：
+  1. 理解用户的修改意图
+  2. 基于当前计划进行相应的修改
+  3. 返回完整的修改后的计划JSON（type = "daily_plan_json"）
+  4. 保持其他未修改的部分不变
+  5. 确保日期连续性和逻辑合理性
+
+- 修改规则：
+  * 景点替换：替换指定景点，保持其他景点不变
+  * 增加景点：在指定位置或天数插入新景点
+  * 删除景点：移除指定景点，后续景点前移
+  * 天数调整：如果修改涉及天数变化，要相应调整后续所有天数和日期
+  * 保持格式：输出的JSON结构必须与原计划完全一致
+
+⚠️ 重要：修改计划时，必须返回 type="daily_plan_json" 的完整计划JSON！
+"""
+
+
 class TravelPlanRequest(BaseModel):
     message: str
 
@@ -201,6 +272,11 @@ class ChatRequest(BaseModel):
     travel_draft: Optional[TravelPlanDraft] = None  # 旅行计划草稿
     current_plan: Optional[dict] = None  # 🆕 当前激活的旅行计划（用于修改）
 
+class PlanStreamRequest(BaseModel):
+    travel_draft: TravelPlanDraft  # 已收集完整的旅行计划草稿
+    model: str = "doubao-1-5-thinking-vision-pro-250428"
+    system_prompt: Optional[str] = None
+
 class ChatResponse(BaseModel):
     message: str
     role: str = "assistant"
@@ -209,6 +285,10 @@ class HotelChatRequest(BaseModel):
     message: str
     travel_plan: Optional[dict] = None  # 🆕 用户的旅行计划（可选）
 
+class HotelItineraryRequest(BaseModel):
+    travel_plan: dict  # 完整旅行计划（含 plan 与 itinerary）
+    group_by: str = "area"  # "area"：同一区域的连续几晚合并为一次入住；"night"：每晚单独搜索
+
 class RouteTestRequest(BaseModel):
     origin_name: str
     destination_name: str
@@ -241,6 +321,66 @@ async def root():
     return {"message": "AI Chat API is running"}
 
 
+class _HotelSearch:
+    """
+    已启动的酒店搜索；进度事件（排队位置、解析出的酒店）先缓存在队列中，调用 stream() 时按顺序产出
+    根据部分意图提前启动的搜索在被采用之前不会向客户端推送任何事件
+    """
+
+    def __init__(self, params: dict):
+        self.params = params
+        self.key = normalize_search_key(params)
+        self._events: asyncio.Queue = asyncio.Queue()
+        self._task = asyncio.create_task(hotel_agent.search_hotels(params, on_event=self._events.put_nowait))
+
+    async def stream(self):
+        """
+        Yields:
+            ("event", 进度事件) ...，最后是 ("result", 搜索结果)
+        """
+        try:
+            while True:
+                next_event = asyncio.ensure_future(self._events.get())
+                done, _ = await asyncio.wait({self._task, next_event}, return_when=asyncio.FIRST_COMPLETED)
+                if next_event in done:
+                    yield "event", next_event.result()
+                    continue
+                next_event.cancel()
+                break
+            while not self._events.empty():
+                yield "event", self._events.get_nowait()
+            yield "result", self._task.result()
+        finally:
+            # 客户端断开时取消本次等待（共享的抓取任务由 single-flight 决定是否继续）
+            self.cancel()
+
+    def cancel(self):
+        if not self._task.done():
+            self._task.cancel()
+
+
+def _sse_response(events, name: str) -> StreamingResponse:
+    """事件生成器（产出事件字典）→ SSE 响应；关闭反向代理缓冲，写出的事件立即到达客户端"""
+    return StreamingResponse(
+        sse_stream(events, name),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _recommendation_events(items, hotels: list) -> list:
+    """把占位符识别结果转换为 recommendation_chunk / hotel_card 事件；编号超出酒店列表的占位符直接丢弃"""
+    events = []
+    for kind, value in items:
+        if kind == "text":
+            events.append({"type": "recommendation_chunk", "content": value})
+            continue
+        index = int(value)
+        if 0 <= index < len(hotels):
+            events.append({"type": "hotel_card", "index": index, "hotel": hotels[index]})
+    return events
+
+
 @app.post("/api/hotel-chat")
 async def hotel_chat(request: HotelChatRequest):
     """
@@ -249,6 +389,16 @@ async def hotel_chat(request: HotelChatRequest):
     """
     try:
         async def generate_hotel_stream():
+            # 意图分析输出到一半时提前启动的搜索，以及步骤3实际使用的搜索
+            speculative: Optional[_HotelSearch] = None
+            search: Optional[_HotelSearch] = None
+
+            def start_speculative_search(partial_params: dict):
+                nonlocal speculative
+                if HOTEL_SPECULATIVE_SEARCH and speculative is None:
+                    logger.info(f"⚡ 根据部分意图提前搜索酒店: {json.dumps(partial_params, ensure_ascii=False)}")
+                    speculative = _HotelSearch(partial_params)
+
             try:
                 # 🆕 记录是否有旅行计划
                 if request.travel_plan:
@@ -257,171 +407,262 @@ async def hotel_chat(request: HotelChatRequest):
                     logger.info("📅 未提供旅行计划")
                 
                 # 步骤1: 意图识别
-                step1_running = json.dumps({'step': 1, 'status': 'running', 'message': '正在分析您的需求...'}, ensure_ascii=False)
-                logger.info(f"发送步骤1 running: {step1_running}")
-                yield f"data: {step1_running}\n\n"
-                yield ": ping\n\n"  # SSE 注释行，强制刷新
-                await asyncio.sleep(0.1)
+                step1_running = {'step': 1, 'status': 'running', 'message': '正在分析您的需求...'}
+                logger.info(f"发送步骤1 running: {json.dumps(step1_running, ensure_ascii=False)}")
+                yield step1_running
                 
-                # 在线程池中运行同步代码
-                loop = asyncio.get_event_loop()
                 # 🆕 传递旅行计划到意图分析
-                intent_result = await loop.run_in_executor(
-                    None, 
-                    hotel_agent.analyze_intent, 
-                    request.message, 
-                    request.travel_plan
+                intent_result = await hotel_agent.analyze_intent(
+                    request.message, request.travel_plan, on_partial=start_speculative_search
                 )
                 
-                step1_completed = json.dumps({'step': 1, 'status': 'completed', 'message': '需求分析完成', 'data': intent_result}, ensure_ascii=False)
-                logger.info(f"发送步骤1 completed: {step1_completed}")
-                yield f"data: {step1_completed}\n\n"
-                yield ": ping\n\n"  # SSE 注释行，强制刷新
-                await asyncio.sleep(0.1)
+                step1_completed = {'step': 1, 'status': 'completed', 'message': '需求分析完成', 'data': intent_result}
+                logger.info(f"发送步骤1 completed: {json.dumps(step1_completed, ensure_ascii=False)}")
+                yield step1_completed
 
                 # 基于 hotel-book 门控：仅当明确需要预订时进入酒店搜索与推荐
                 hotel_book = bool(intent_result.get("hotel-book", False))
                 if not hotel_book:
                     # 未明确预订，进行二次确认而不进入搜索
-                    yield f"data: {json.dumps({'step': 2, 'status': 'completed', 'message': '未明确需要预订，建议确认后再继续'}, ensure_ascii=False)}\n\n"
+                    yield {'step': 2, 'status': 'completed', 'message': '未明确需要预订，建议确认后再继续'}
                     confirm_text = (
                         "我可以为您搜索并推荐可预订的酒店。请确认是否需要预订酒店，并可补充入住时间、人数与目的地等信息。"
                     )
-                    yield f"data: {json.dumps({'type': 'final_response', 'content': confirm_text}, ensure_ascii=False)}\n\n"
-                    yield f"data: {json.dumps({'type': 'done'}, ensure_ascii=False)}\n\n"
+                    yield {'type': 'final_response', 'content': confirm_text}
+                    yield {'type': 'done'}
                     return
 
                 # 普通聊天意图直接走聊天（冗余保护）
                 if intent_result.get("intent") == "chat":
-                    yield f"data: {json.dumps({'step': 2, 'status': 'running', 'message': '正在生成回复...'}, ensure_ascii=False)}\n\n"
-                    await asyncio.sleep(0.1)
-                    response = await loop.run_in_executor(None, hotel_agent.chat, request.message)
-                    yield f"data: {json.dumps({'step': 2, 'status': 'completed', 'message': '回复生成完成'}, ensure_ascii=False)}\n\n"
-                    yield f"data: {json.dumps({'type': 'final_response', 'content': response}, ensure_ascii=False)}\n\n"
-                    yield f"data: {json.dumps({'type': 'done'}, ensure_ascii=False)}\n\n"
+                    yield {'step': 2, 'status': 'running', 'message': '正在生成回复...'}
+                    response = await hotel_agent.chat(request.message)
+                    yield {'step': 2, 'status': 'completed', 'message': '回复生成完成'}
+                    yield {'type': 'final_response', 'content': response}
+                    yield {'type': 'done'}
                     return
                 
                 # 酒店预订流程
                 params = intent_result.get("params", {})
                 
                 # 步骤2: 参数验证
-                yield f"data: {json.dumps({'step': 2, 'status': 'running', 'message': '正在准备搜索参数...'}, ensure_ascii=False)}\n\n"
-                await asyncio.sleep(0.1)
+                yield {'step': 2, 'status': 'running', 'message': '正在准备搜索参数...'}
                 
                 if not params.get("destination"):
-                    yield f"data: {json.dumps({'step': 2, 'status': 'error', 'message': '未能识别目的地，请提供更多信息'}, ensure_ascii=False)}\n\n"
-                    yield f"data: {json.dumps({'type': 'final_response', 'content': '抱歉，我没有理解您想去哪里。请告诉我您的目的地，比如"成都春熙路"或"上海外滩"。'}, ensure_ascii=False)}\n\n"
-                    yield f"data: {json.dumps({'type': 'done'}, ensure_ascii=False)}\n\n"
+                    yield {'step': 2, 'status': 'error', 'message': '未能识别目的地，请提供更多信息'}
+                    yield {'type': 'final_response', 'content': '抱歉，我没有理解您想去哪里。请告诉我您的目的地，比如"成都春熙路"或"上海外滩"。'}
+                    yield {'type': 'done'}
                     return
                 
-                yield f"data: {json.dumps({'step': 2, 'status': 'completed', 'message': '搜索参数准备完成', 'data': params}, ensure_ascii=False)}\n\n"
-                yield ": ping\n\n"  # SSE 注释行，强制刷新
-                await asyncio.sleep(0.1)
+                yield {'step': 2, 'status': 'completed', 'message': '搜索参数准备完成', 'data': params}
                 
                 # 步骤3: 搜索酒店
                 destination = params.get("destination", "")
-                step3_running = json.dumps({'step': 3, 'status': 'running', 'message': f'正在搜索 {destination} 的酒店...'}, ensure_ascii=False)
-                logger.info(f"发送步骤3 running: {step3_running}")
-                yield f"data: {step3_running}\n\n"
-                yield ": ping\n\n"  # SSE 注释行，强制刷新
-                await asyncio.sleep(0.1)
+                step3_running = {'step': 3, 'status': 'running', 'message': f'正在搜索 {destination} 的酒店...'}
+                logger.info(f"发送步骤3 running: {json.dumps(step3_running, ensure_ascii=False)}")
+                yield step3_running
                 
-                # 执行异步酒店搜索
+                # 执行异步酒店搜索，排队期间推送排队位置，每解析出一家酒店立即推送
                 logger.info("开始执行酒店搜索...")
-                search_result = await hotel_agent.search_hotels(params)
+                # 提前启动的搜索参数与最终意图一致时直接采用，否则丢弃并按最终参数重新搜索
+                if speculative is not None:
+                    if speculative.key == normalize_search_key(params):
+                        search = speculative
+                        SPECULATIVE_SEARCHES.inc(outcome="adopted")
+                    else:
+                        # 立即取消，释放抓取队列名额和浏览器页面，不与实际搜索竞争
+                        logger.info("提前启动的搜索与最终意图参数不一致，取消并按最终参数重新搜索")
+                        speculative.cancel()
+                        SPECULATIVE_SEARCHES.inc(outcome="discarded")
+                        speculative = None
+                search = search or _HotelSearch(params)
+                search_result = {}
+                partial_count = 0
+                async for kind, payload in search.stream():
+                    if kind == "result":
+                        search_result = payload
+                    elif payload.get("type") == "hotel_partial":
+                        partial_count += 1
+                        yield {'type': 'hotel_partial', 'index': payload.get('index'), 'hotel': payload.get('hotel')}
+                        yield {'step': 3, 'status': 'running', 'message': f'已找到 {partial_count} 家酒店，继续搜索中...'}
+                    elif payload.get("type") == "queue":
+                        position = payload.get("position", 0)
+                        eta = payload.get("estimated_wait_s", 0)
+                        if position > 0:
+                            queue_msg = f'排队中（第 {position} 位），预计等待约 {int(eta)} 秒...'
+                        else:
+                            queue_msg = f'正在搜索 {destination} 的酒店...'
+                        yield {'step': 3, 'status': 'running', 'message': queue_msg, 'queue_position': position, 'estimated_wait_s': eta}
                 logger.info(f"酒店搜索完成，结果: {search_result.get('success')}")
+                # 每次搜索输出一条结构化记录，便于日志检索与统计；
+                # 抓取相关的测量值只在本次实际抓取（未命中缓存）时记录，命中时为 null
+                scraped = search_result.get("cache") in (None, "miss")
+                logger.info("hotel_search_record " + json.dumps({
+                    "destination": destination,
+                    "checkin_date": params.get("checkin_date"),
+                    "checkout_date": params.get("checkout_date"),
+                    "success": bool(search_result.get("success")),
+                    "hotels": len(search_result.get("hotels", [])),
+                    "cache": search_result.get("cache"),
+                    "coalesced": search_result.get("coalesced", False) if scraped else None,
+                    "speculative": search is speculative,
+                    "pool_wait_ms": search_result.get("pool_wait_ms") if scraped else None,
+                    "failure": search_result.get("failure"),
+                    "telemetry": search_result.get("telemetry") if scraped else None,
+                }, ensure_ascii=False))
                 
                 if not search_result.get("success"):
                     error_msg = search_result.get("error", "未知错误")
-                    yield f"data: {json.dumps({'step': 3, 'status': 'error', 'message': f'搜索失败: {error_msg}'}, ensure_ascii=False)}\n\n"
-                    yield f"data: {json.dumps({'type': 'final_response', 'content': f'抱歉，搜索酒店时遇到问题：{error_msg}'}, ensure_ascii=False)}\n\n"
-                    yield f"data: {json.dumps({'type': 'done'}, ensure_ascii=False)}\n\n"
+                    yield {'step': 3, 'status': 'error', 'message': f'搜索失败: {error_msg}'}
+                    yield {'type': 'final_response', 'content': f'抱歉，搜索酒店时遇到问题：{error_msg}'}
+                    yield {'type': 'done'}
                     return
                 
                 hotels_count = len(search_result.get("hotels", []))
-                yield f"data: {json.dumps({'step': 3, 'status': 'completed', 'message': f'找到 {hotels_count} 家酒店'}, ensure_ascii=False)}\n\n"
-                await asyncio.sleep(0.1)
+                step3_message = f'找到 {hotels_count} 家酒店'
+                if search_result.get("occupancy_applied") is False:
+                    # 回退到首页表单且未能设置入住信息，结果是 Booking 默认的 2 位成人、1 间房
+                    step3_message += '（未能按您的入住人数和房间数筛选，结果按 2 位成人、1 间房搜索）'
+                yield {'step': 3, 'status': 'completed', 'message': step3_message}
                 
                 if hotels_count == 0:
-                    yield f"data: {json.dumps({'type': 'final_response', 'content': '抱歉，没有找到符合条件的酒店。请尝试调整搜索条件。'}, ensure_ascii=False)}\n\n"
-                    yield f"data: {json.dumps({'type': 'done'}, ensure_ascii=False)}\n\n"
+                    yield {'type': 'final_response', 'content': '抱歉，没有找到符合条件的酒店。请尝试调整搜索条件。'}
+                    yield {'type': 'done'}
                     return
                 
                 # 步骤4: 生成推荐
-                yield f"data: {json.dumps({'step': 4, 'status': 'running', 'message': '正在为您生成个性化推荐...'}, ensure_ascii=False)}\n\n"
-                await asyncio.sleep(0.1)
+                yield {'step': 4, 'status': 'running', 'message': '正在为您生成个性化推荐...'}
 
                 # 开始流式输出推荐内容（在完成所有片段之前，保持第4步为running）
                 logger.info("开始流式输出推荐内容")
-                yield f"data: {json.dumps({'type': 'recommendation_start'}, ensure_ascii=False)}\n\n"
-                await asyncio.sleep(0.1)
+                yield {'type': 'recommendation_start'}
 
-                # 真正的流式生成推荐
+                # 真正的流式生成推荐；[HOTEL_CARD:X] 占位符从文本中去掉，改为立即推送对应酒店的 hotel_card 事件
                 try:
+                    hotels = search_result.get("hotels", [])
+                    cards = PlaceholderScanner("[HOTEL_CARD:")
                     # 🆕 传递旅行计划到推荐生成
-                    for chunk in hotel_agent.generate_recommendations(request.message, search_result, request.travel_plan):
-                        if chunk:
-                            yield f"data: {json.dumps({'type': 'recommendation_chunk', 'content': chunk}, ensure_ascii=False)}\n\n"
-                            await asyncio.sleep(0.05)  # 小延迟以实现打字机效果
+                    async for chunk in hotel_agent.generate_recommendations(request.message, search_result, request.travel_plan, params):
+                        for event in _recommendation_events(cards.feed(chunk), hotels):
+                            yield event
+                    for event in _recommendation_events(cards.flush(), hotels):
+                        yield event
                 except Exception as e:
                     logger.error(f"生成推荐时出错: {str(e)}")
                     # 标记第4步为error
-                    yield f"data: {json.dumps({'step': 4, 'status': 'error', 'message': f'生成推荐时出错: {str(e)}'}, ensure_ascii=False)}\n\n"
-                    yield f"data: {json.dumps({'type': 'error', 'content': f'生成推荐时出错: {str(e)}'}, ensure_ascii=False)}\n\n"
+                    yield {'step': 4, 'status': 'error', 'message': f'生成推荐时出错: {str(e)}'}
+                    yield {'type': 'error', 'content': f'生成推荐时出错: {str(e)}'}
                     return
 
                 # 推荐完成后，先结束推荐流，再标记第4步完成
                 logger.info("推荐内容发送完成")
-                yield f"data: {json.dumps({'type': 'recommendation_end'}, ensure_ascii=False)}\n\n"
-                await asyncio.sleep(0.1)
+                yield {'type': 'recommendation_end'}
                 
-                # 🆕 发送完整的酒店列表数据（包括URL和图片），供前端显示酒店卡片
+                # 🆕 发送完整的酒店列表数据（包括URL和图片）；已通过 hotel_card 事件收到卡片的前端可忽略
                 hotels_data = search_result.get("hotels", [])
                 logger.info(f"发送酒店列表数据，共 {len(hotels_data)} 家酒店")
-                yield f"data: {json.dumps({'type': 'hotels_data', 'hotels': hotels_data}, ensure_ascii=False)}\n\n"
-                await asyncio.sleep(0.1)
+                yield {'type': 'hotels_data', 'hotels': hotels_data}
                 
-                yield f"data: {json.dumps({'step': 4, 'status': 'completed', 'message': '推荐生成完成'}, ensure_ascii=False)}\n\n"
-                await asyncio.sleep(0.1)
-                yield f"data: {json.dumps({'type': 'done'}, ensure_ascii=False)}\n\n"
+                yield {'step': 4, 'status': 'completed', 'message': '推荐生成完成'}
+                yield {'type': 'done'}
                 
             except Exception as e:
                 logger.error(f"酒店聊天流式生成错误: {str(e)}")
-                yield f"data: {json.dumps({'type': 'error', 'content': f'处理请求时出错: {str(e)}'}, ensure_ascii=False)}\n\n"
+                yield {'type': 'error', 'content': f'处理请求时出错: {str(e)}'}
+            finally:
+                # 最终意图不需要搜索（不预订/普通聊天）或中途出错时取消提前启动的搜索
+                if speculative is not None and search is not speculative:
+                    speculative.cancel()
+                    SPECULATIVE_SEARCHES.inc(outcome="discarded")
         
-        return StreamingResponse(generate_hotel_stream(), media_type="text/event-stream")
+        return _sse_response(generate_hotel_stream(), "hotel_chat")
     
     except Exception as e:
         logger.error(f"酒店聊天接口错误: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/hotel-itinerary")
+async def hotel_itinerary(request: HotelItineraryRequest):
+    """
+    整段行程酒店搜索接口
+    按旅行计划规划每晚住宿并发搜索，每段住宿搜索完成后立即推送
+    """
+    async def generate_itinerary_stream():
+        try:
+            yield {'step': 1, 'status': 'running', 'message': '正在根据行程规划住宿...'}
+            stays = hotel_agent.plan_stays(request.travel_plan, request.group_by)
+            if not stays:
+                yield {'step': 1, 'status': 'error', 'message': '行程中没有需要住宿的夜晚'}
+                yield {'type': 'final_response', 'content': '没有从旅行计划中找到需要住宿的夜晚，请检查行程日期。'}
+                yield {'type': 'done'}
+                return
+            yield {'step': 1, 'status': 'completed', 'message': f'共需安排 {len(stays)} 段住宿', 'data': stays}
+            yield {'type': 'stays_planned', 'stays': stays}
+            
+            yield {'step': 2, 'status': 'running', 'message': f'正在同时搜索 {len(stays)} 段住宿的酒店...'}
+            finished = 0
+            async for item in hotel_agent.search_itinerary(stays):
+                index = item["stay_index"]
+                if item["type"] == "event":
+                    event = item["event"]
+                    if event.get("type") == "hotel_partial":
+                        yield {'type': 'hotel_partial', 'stay_index': index, 'index': event.get('index'), 'hotel': event.get('hotel')}
+                    elif event.get("type") == "queue" and event.get("position", 0) > 0:
+                        yield {'type': 'stay_queued', 'stay_index': index, 'queue_position': event['position'], 'estimated_wait_s': event.get('estimated_wait_s', 0)}
+                    continue
+                
+                finished += 1
+                result = item["result"]
+                logger.info(f"第 {index + 1} 段住宿搜索完成，成功: {result.get('success')}, 酒店数: {len(result.get('hotels', []))}")
+                yield {'type': 'stay_result', 'stay_index': index, 'stay': stays[index], 'success': bool(result.get('success')), 'hotels': result.get('hotels', []), 'error': result.get('error'), 'cache': result.get('cache')}
+                yield {'step': 2, 'status': 'running', 'message': f'已完成 {finished}/{len(stays)} 段住宿的搜索'}
+            
+            yield {'step': 2, 'status': 'completed', 'message': f'{len(stays)} 段住宿搜索完成'}
+            yield {'type': 'done'}
+        except Exception as e:
+            logger.error(f"整段行程酒店搜索错误: {str(e)}")
+            yield {'type': 'error', 'content': f'处理请求时出错: {str(e)}'}
+    
+    return _sse_response(generate_itinerary_stream(), "hotel_itinerary")
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus 文本格式的进程内指标"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/hotel-search/stats")
+async def hotel_search_stats():
+    """酒店搜索运行统计：浏览器池、结果缓存、请求合并、抓取队列、浏览器持久化配置、规则意图识别与 LLM 网关"""
+    return {
+        "browser_pool": browser_pool.stats(),
+        "cache": hotel_cache.stats(),
+        "single_flight": hotel_agent.search_flight.stats(),
+        "scrape_queue": scrape_queue.stats(),
+        "browser_profile": browser_profile.stats(),
+        "intent_fast_path": fast_path_stats(),
+        "llm": llm_gateway.stats(),
+        "trip_planner": trip_planner.stats(),
+    }
+
 @app.post("/api/travel-plan")
 async def travel_plan(request: TravelPlanRequest):
     try:
         async def generate_travel_stream():
             try:
-                step1_running = json.dumps({'step': 1, 'status': 'running', 'message': '正在分析您的旅行需求...'}, ensure_ascii=False)
-                yield f"data: {step1_running}\n\n"
-                await asyncio.sleep(0.1)
-
-                loop = asyncio.get_event_loop()
-
-                def analyze():
-                    system_prompt = (
-                        "你是一个智能旅行规划助手。你需要判断用户是否需要旅行计划规划推荐。"
-                        "输出严格的JSON。当不需要旅行规划时，返回 {\"plan_needed\": false, \"message\": \"normal_chat\"}。"
-                        "当需要旅行规划时，返回 {\"plan_needed\": true, \"plan\": {\"destination\": ..., \"origin\": ..., \"start_date\": ..., \"end_date\": ..., \"people\": 可选, \"attractions\": 可选数组}, \"corrections\": 可选列表 }。"
-                        "不得添加虚构数据。若用户输入存在明显错误如地名拼写，将在 corrections 中给出 from/to 的纠正，并要求确认。"
-                        "优先使用 YYYY-MM-DD 日期格式。"
-                    )
-                    resp = client.chat.completions.create(
+                yield {'step': 1, 'status': 'running', 'message': '正在分析您的旅行需求...'}
+
+                async def analyze():
+                    messages = [
+                        {"role": "system", "content": TRAVEL_PLAN_INTENT_PROMPT},
+                        {"role": "user", "content": request.message},
+                    ]
+                    record_prompt("travel_plan_intent", messages)
+                    resp = await llm_gateway.complete(
+                        "travel_plan_intent",
                         model="doubao-1-5-thinking-vision-pro-250428",
-                        messages=[
-                            {"role": "system", "content": system_prompt},
-                            {"role": "user", "content": request.message},
-                        ],
+                        messages=messages,
                         temperature=0.3,
                         max_tokens=1200,
+                        timeout=60,
                     )
                     content = resp.choices[0].message.content.strip()
                     try:
@@ -433,36 +674,31 @@ async def travel_plan(request: TravelPlanRequest):
                             return json.loads(m.group())
                         return {"plan_needed": False, "message": "normal_chat"}
 
-                intent = await loop.run_in_executor(None, analyze)
-                step1_completed = json.dumps({'step': 1, 'status': 'completed', 'message': '需求分析完成', 'data': intent}, ensure_ascii=False)
-                yield f"data: {step1_completed}\n\n"
-                await asyncio.sleep(0.1)
+                intent = await analyze()
+                yield {'step': 1, 'status': 'completed', 'message': '需求分析完成', 'data': intent}
 
                 if not intent.get('plan_needed'):
-                    yield f"data: {json.dumps({'type': 'final_response', 'content': '普通聊天'}, ensure_ascii=False)}\n\n"
-                    yield f"data: {json.dumps({'type': 'done'}, ensure_ascii=False)}\n\n"
+                    yield {'type': 'final_response', 'content': '普通聊天'}
+                    yield {'type': 'done'}
                     return
 
                 plan = intent.get('plan', {})
                 required = ['destination', 'origin', 'start_date', 'end_date']
                 missing = [k for k in required if not plan.get(k)]
 
-                yield f"data: {json.dumps({'step': 2, 'status': 'running', 'message': '正在验证必填项...'}, ensure_ascii=False)}\n\n"
-                await asyncio.sleep(0.1)
+                yield {'step': 2, 'status': 'running', 'message': '正在验证必填项...'}
 
                 if missing:
                     msg = '缺少必填项: ' + ', '.join(missing)
-                    yield f"data: {json.dumps({'step': 2, 'status': 'error', 'message': msg}, ensure_ascii=False)}\n\n"
+                    yield {'step': 2, 'status': 'error', 'message': msg}
                     ask_text = '请补充以下信息：' + '、'.join(missing) + '。例如：目的地、出发地、开始时间(YYYY-MM-DD)、结束时间(YYYY-MM-DD)。'
-                    yield f"data: {json.dumps({'type': 'ask', 'content': ask_text}, ensure_ascii=False)}\n\n"
-                    yield f"data: {json.dumps({'type': 'done'}, ensure_ascii=False)}\n\n"
+                    yield {'type': 'ask', 'content': ask_text}
+                    yield {'type': 'done'}
                     return
 
-                yield f"data: {json.dumps({'step': 2, 'status': 'completed', 'message': '必填项已完整', 'data': plan}, ensure_ascii=False)}\n\n"
-                await asyncio.sleep(0.1)
+                yield {'step': 2, 'status': 'completed', 'message': '必填项已完整', 'data': plan}
 
-                yield f"data: {json.dumps({'type': 'travel_json_start'}, ensure_ascii=False)}\n\n"
-                await asyncio.sleep(0.05)
+                yield {'type': 'travel_json_start'}
                 json_text = json.dumps({
                     'destination': plan.get('destination'),
                     'origin': plan.get('origin'),
@@ -471,18 +707,15 @@ async def travel_plan(request: TravelPlanRequest):
                     'people': plan.get('people'),
                     'attractions': plan.get('attractions')
                 }, ensure_ascii=False)
-                for i in range(0, len(json_text), 50):
-                    yield f"data: {json.dumps({'type': 'travel_json_chunk', 'content': json_text[i:i+50]}, ensure_ascii=False)}\n\n"
-                    await asyncio.sleep(0.02)
-                yield f"data: {json.dumps({'type': 'travel_json_end'}, ensure_ascii=False)}\n\n"
-                await asyncio.sleep(0.1)
-                yield f"data: {json.dumps({'type': 'done'}, ensure_ascii=False)}\n\n"
+                yield {'type': 'travel_json_chunk', 'content': json_text}
+                yield {'type': 'travel_json_end'}
+                yield {'type': 'done'}
 
             except Exception as e:
                 logger.error(f"旅行规划流式生成错误: {str(e)}")
-                yield f"data: {json.dumps({'type': 'error', 'content': f'处理请求时出错: {str(e)}'}, ensure_ascii=False)}\n\n"
+                yield {'type': 'error', 'content': f'处理请求时出错: {str(e)}'}
 
-        return StreamingResponse(generate_travel_stream(), media_type="text/event-stream")
+        return _sse_response(generate_travel_stream(), "travel_plan")
     except Exception as e:
         logger.error(f"旅行规划接口错误: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -509,115 +742,22 @@ async def chat(request: ChatRequest):
             logger.info(f"📍 收到生成计划请求，草稿内容: {json.dumps(draft, ensure_ascii=False)}")
             if draft.get("destination") and draft.get("origin") and draft.get("start_date") and draft.get("end_date"):
                 logger.info("✅ 必填字段验证通过，开始生成计划...")
+
+                # 长行程：骨架 + 逐天并行生成，骨架失败时回退到单次调用
+                if trip_planner.should_fan_out(draft):
+                    result = await trip_planner.generate(draft, request.model, request.system_prompt)
+                    if result:
+                        return result
                 
-                # 构建计划生成提示词
-                PLAN_GENERATION_PROMPT = (
-                    "# 旅行规划JSON生成任务\n\n"
-                    "## 🚨 输出格式要求（必须严格遵守）\n"
-                    "1. **只输出一个完整的JSON对象，不要添加任何前后文字、标记或解释**\n"
-                    "2. **不要使用markdown代码块标记（```json）**\n"
-                    "3. **确保JSON完整闭合，所有括号、引号必须配对**\n"
-                    "4. **不要截断输出，必须输出完整的JSON**\n"
-                    "5. **使用标准JSON格式，不要使用注释或非标准语法**\n\n"
-                    
-                    "## ✅ 正确示例\n"
-                    '{"type":"daily_plan_json","plan":{"destination":"上海","origin":"成都","start_date":"2025-11-16","end_date":"2025-11-18","people":2,"city":"上海"},"itinerary":[{"day":1,"date":"2025-11-16","title":"Day 1","activities":[{"name":"外滩","notes":"观赏夜景"}],"summary":"交通以地铁为主"}]}\n\n'
-                    
-                    "## ❌ 错误示例\n"
-                    "```json\n{...}\n```  ← 不要markdown标记\n"
-                    "好的，这是计划：{...}  ← 不要额外文字\n"
-                    '{"type":"daily_plan_json"...  ← 不要截断\n\n'
-                    
-                    f"## 📋 用户需求\n{json.dumps(draft, ensure_ascii=False, indent=2)}\n\n"
-                    
-                    "## 🎯 JSON结构规范\n"
-                    "```\n"
-                    "{\n"
-                    '  "type": "daily_plan_json",  // 固定值\n'
-                    '  "plan": {\n'
-                    '    "destination": "目的地",\n'
-                    '    "origin": "出发地",\n'
-                    '    "start_date": "YYYY-MM-DD",\n'
-                    '    "end_date": "YYYY-MM-DD",\n'
-                    '    "people": 2,  // 人数，默认2\n'
-                    '    "city": "城市名"  // ⚠️ 必填：从destination提取城市名（如"上海迪士尼"→"上海"）\n'
-                    "  },\n"
-                    '  "itinerary": [  // 每日行程数组\n'
-                    "    {\n"
-                    '      "day": 1,\n'
-                    '      "date": "YYYY-MM-DD",\n'
-                    '      "title": "Day 1",\n'
-                    '      "activities": [  // 当天活动数组\n'
-                    '        {"name": "景点官方名称", "notes": "可选说明"}\n'
-                    "      ],\n"
-                    '      "summary": "当天总结（交通方式、注意事项）"\n'
-                    "    }\n"
-                    "  ]\n"
-                    "}\n"
-                    "```\n\n"
-                    
-                    "## 📌 行程规划规则\n"
-                    "1. **景点选择**：\n"
-                    "   - 用户指定景点(attractions)：必须包含，可适当补充\n"
-                    "   - 未指定景点：根据目的地推荐热门景点\n"
-                    "2. **排期规则**：\n"
-                    "   - 全天景点（游乐园/爬山）：单独一天\n"
-                    "   - 城市打卡（博物馆/寺庙）：每天3-4个，邻近景点组合\n"
-                    "3. **活动名称**：使用标准化中文景点官方名称（如\"外滩\"而非\"外滩风景区\"）\n"
-                    "4. **城市字段**：从destination提取城市名，不带\"市\"字（\"杭州\"不是\"杭州市\"）\n\n"
-                    
-                    "## ⚠️ 最后提醒\n"
-                    "- 第一个字符必须是 `{`\n"
-                    "- 最后一个字符必须是 `}`\n"
-                    "- 中间不要有任何非JSON内容\n"
-                    "- 确保所有字符串使用双引号\n"
-                    "- 确保JSON完整不截断\n\n"
-                    "现在开始输出JSON："
-                )
-                
-                plan_messages = [
-                    {"role": "system", "content": PLAN_GENERATION_PROMPT},
-                    {"role": "user", "content": f"请为我规划{draft.get('destination')}的旅行，从{draft.get('start_date')}到{draft.get('end_date')}。"}
-                ]
-                
-                if request.system_prompt:
-                    plan_messages.insert(1, {"role": "system", "content": request.system_prompt})
-                
-                # 调用LLM生成计划
-                # 使用较低的temperature确保输出格式稳定，增加max_tokens避免截断
-                plan_resp = client.chat.completions.create(
+                plan_resp = await llm_gateway.complete(
+                    "plan_generation",
                     model=request.model,
-                    messages=plan_messages,
+                    messages=_plan_generation_messages(draft, request.system_prompt),
                     temperature=0.3,  # 降低随机性，提高格式稳定性
                     max_tokens=6000,  # 增加token限制，避免JSON被截断
+                    timeout=300,  # 长行程的完整计划生成较慢
                 )
-                
-                plan_raw = plan_resp.choices[0].message.content.strip()
-                logger.info(f"🤖 LLM返回原始内容长度: {len(plan_raw)} 字符")
-                logger.info(f"🤖 LLM返回原始内容（前500字符）: {plan_raw[:500]}...")
-                
-                plan_data = extract_first_json(plan_raw)
-                if plan_data:
-                    logger.info(f"📊 解析后的JSON类型: {plan_data.get('type')}")
-                    # 如果解析成功但类型不对，输出完整内容用于调试
-                    if plan_data.get('type') != 'daily_plan_json':
-                        logger.error(f"❌ 类型错误！完整LLM返回:\n{plan_raw}")
-                else:
-                    logger.error(f"❌ JSON解析返回None！完整LLM返回:\n{plan_raw}")
-                
-                # 返回生成的计划
-                if plan_data.get("type") == "daily_plan_json":
-                    logger.info("✅ 成功生成每日计划！")
-                    return {
-                        "type": "daily_plan_json",
-                        "plan": plan_data.get("plan", draft),
-                        "itinerary": plan_data.get("itinerary", []),
-                        "notes": plan_data.get("notes"),
-                        "corrections": plan_data.get("corrections"),
-                    }
-                else:
-                    logger.error(f"❌ 计划生成失败，返回类型错误: {plan_data.get('type')}")
-                    return {"type": "chat", "content": "计划生成失败，请重试"}
+                return _daily_plan_response(plan_resp.choices[0].message.content.strip(), draft)
 
         # 构建提示词 - 支持草稿模式
         draft_info = ""
@@ -631,77 +771,26 @@ async def chat(request: ChatRequest):
         
         if has_draft:
             draft_dict = request.travel_draft.dict(exclude_none=True)
-            draft_info = f"\n\n【当前收集到的信息】（用户正在逐步提供）：\n{json.dumps(draft_dict, ensure_ascii=False, indent=2)}"
+            draft_info = f"\n\n【当前收集到的信息】（用户正在逐步提供）：\n{compact_json(draft_dict)}"
         
         # 🆕 检查是否有当前计划（用于修改）
         plan_modification_info = ""
         if request.current_plan:
-            plan_json = json.dumps(request.current_plan, ensure_ascii=False, indent=2)
-            plan_modification_info = f"""
-
-【当前已有旅行计划】
-以下是用户当前激活的旅行计划：
-```json
-{plan_json}
-```
-
-⚠️ 计划修改模式已激活！
-- 如果用户的输入是要修改这个计划（例如："把第二天的XX改成YY"、"增加一个景点"、"删除第三天"、"调整行程"等），请：
-  1. 理解用户的修改意图
-  2. 基于当前计划进行相应的修改
-  3. 返回完整的修改后的计划JSON（type = "daily_plan_json"）
-  4. 保持其他未修改的部分不变
-  5. 确保日期连续性和逻辑合理性
-
-- 修改规则：
-  * 景点替换：替换指定景点，保持其他景点不变
-  * 增加景点：在指定位置或天数插入新景点
-  * 删除景点：移除指定景点，后续景点前移
-  * 天数调整：如果修改涉及天数变化，要相应调整后续所有天数和日期
-  * 保持格式：输出的JSON结构必须与原计划完全一致
-
-⚠️ 重要：修改计划时，必须返回 type="daily_plan_json" 的完整计划JSON！
-"""
+            plan_modification_info = (
+                f"\n\n【当前已有旅行计划】\n以下是用户当前激活的旅行计划：\n{compact_json(request.current_plan)}\n\n"
+                + PLAN_MODIFICATION_RULES
+            )
         
-        INTENT_PROMPT = (
-            "你是旅行规划助手，职责：收集旅行必填信息。\n"
-            f"{draft_info}\n"
-            f"{plan_modification_info}\n"
-            "\n【输出格式】严格JSON，无任何额外文字！\n"
-            "正确：{\"type\":\"chat\",\"content\":\"...\"}\n"
-            "错误：好的，{...}（不要任何前后文字）\n"
-            "\n【输出类型】\n"
-            "1. 普通聊天：{\"type\":\"chat\",\"content\":\"...\"}\n"
-            "2. 收集信息：{\"type\":\"draft_update\",\"updates\":{...},\"draft\":{...},\"missing_required\":[...],\"is_complete\":true/false,\"next_question\":\"...\"}\n"
-            "3. 修改计划：{\"type\":\"daily_plan_json\",\"plan\":{...},\"itinerary\":[...]}（当current_plan存在且用户要求修改时）\n"
-            "\n【核心规则 - 重要】\n"
-            "你只负责收集4个必填字段：\n"
-            "1. destination - 目的地城市\n"
-            "2. origin - 出发地城市\n"
-            "3. start_date - 开始日期（YYYY-MM-DD）\n"
-            "4. end_date - 结束日期（YYYY-MM-DD）\n"
-            "\n【可选字段 - 不要追问】\n"
-            "- people：人数（用户提到就记录，没提到就null）\n"
-            "- attractions：景点列表（用户提到就记录，没提到就null或[]）\n"
-            "❌ 绝对不要主动询问：\"还想去哪些景点\"、\"想去什么地方\"\n"
-            "✅ 用户没提景点很正常，我们会自动推荐\n"
-            "\n【判断完成】\n"
-            "当4个必填字段都有值时：\n"
-            "- 设置 is_complete = true\n"
-            "- next_question 可以是确认信息，如：\"好的，已收集完成！正在为您规划行程...\"\n"
-            "\n【合并逻辑】\n"
-            "- 提取用户新输入中的字段\n"
-            "- 与草稿合并（不覆盖已有非空字段）\n"
-            "- 缺少必填字段时，自然追问（只问缺的）\n"
-            "\n再次强调：只输出JSON！"
-        )
+        INTENT_PROMPT = f"{CHAT_INTENT_PROMPT_HEAD}{draft_info}\n{plan_modification_info}\n{CHAT_INTENT_PROMPT_RULES}"
 
         intent_messages = [{"role": "system", "content": INTENT_PROMPT}]
         if request.system_prompt:
             intent_messages.append({"role": "system", "content": request.system_prompt})
         intent_messages.append({"role": "user", "content": last_user_text or ""})
+        record_prompt("chat_intent", intent_messages)
 
-        intent_resp = client.chat.completions.create(
+        intent_resp = await llm_gateway.complete(
+            "chat_intent",
             model=request.model,
             messages=intent_messages,
             temperature=0.3,
@@ -755,7 +844,8 @@ async def chat(request: ChatRequest):
             content_txt = intent_data.get("content")
             if content_txt:
                 return {"type": "chat", "content": content_txt}
-            chat_resp = client.chat.completions.create(
+            chat_resp = await llm_gateway.complete(
+                "chat",
                 model=request.model,
                 messages=[
                     {"role": "system", "content": "你是一个专业的AI助手。"},
@@ -763,6 +853,7 @@ async def chat(request: ChatRequest):
                 ],
                 temperature=0.7,
                 max_tokens=1000,
+                timeout=60,
             )
             return {"type": "chat", "content": chat_resp.choices[0].message.content}
 
@@ -773,6 +864,112 @@ async def chat(request: ChatRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _plan_generation_messages(draft: dict, system_prompt: Optional[str] = None) -> list:
+    """构建每日计划生成的消息列表"""
+    plan_generation_prompt = (
+        PLAN_GENERATION_PROMPT_HEAD
+        + f"## 📋 用户需求\n{compact_json(draft)}\n\n"
+        + PLAN_GENERATION_PROMPT_TAIL
+    )
+    plan_messages = [
+        {"role": "system", "content": plan_generation_prompt},
+        {"role": "user", "content": f"请为我规划{draft.get('destination')}的旅行，从{draft.get('start_date')}到{draft.get('end_date')}。"}
+    ]
+    if system_prompt:
+        plan_messages.insert(1, {"role": "system", "content": system_prompt})
+    record_prompt("plan_generation", plan_messages)
+    return plan_messages
+
+
+def _daily_plan_response(plan_raw: str, draft: dict, extractor: Optional[JsonObjectExtractor] = None) -> dict:
+    """解析 LLM 返回的完整计划文本，转换为接口返回的每日计划（失败时返回提示重试的聊天消息）"""
+    logger.info(f"🤖 LLM返回原始内容长度: {len(plan_raw)} 字符")
+    logger.info(f"🤖 LLM返回原始内容（前500字符）: {plan_raw[:500]}...")
+    
+    plan_data = extract_first_json(plan_raw, extractor)
+    if plan_data:
+        logger.info(f"📊 解析后的JSON类型: {plan_data.get('type')}")
+        # 如果解析成功但类型不对，输出完整内容用于调试
+        if plan_data.get('type') != 'daily_plan_json':
+            logger.error(f"❌ 类型错误！完整LLM返回:\n{plan_raw}")
+    else:
+        logger.error(f"❌ JSON解析返回None！完整LLM返回:\n{plan_raw}")
+    
+    # 返回生成的计划
+    if plan_data.get("type") == "daily_plan_json":
+        logger.info("✅ 成功生成每日计划！")
+        return {
+            "type": "daily_plan_json",
+            "plan": plan_data.get("plan", draft),
+            "itinerary": plan_data.get("itinerary", []),
+            "notes": plan_data.get("notes"),
+            "corrections": plan_data.get("corrections"),
+        }
+    logger.error(f"❌ 计划生成失败，返回类型错误: {plan_data.get('type')}")
+    return {"type": "chat", "content": "计划生成失败，请重试"}
+
+
+@app.post("/api/chat/plan-stream")
+async def chat_plan_stream(request: PlanStreamRequest):
+    """
+    每日计划流式生成（/api/chat 中 __GENERATE_PLAN__ 的 SSE 版本）
+    LLM 每输出完一天的行程就推送 plan_day 事件，结束后推送与 /api/chat 返回结构相同的 plan_complete 事件
+    """
+    # 与 /api/chat 一致，在打开 SSE 流之前检查
+    if not os.environ.get("ARK_API_KEY"):
+        raise HTTPException(status_code=500, detail="ARK_API_KEY环境变量未设置")
+
+    draft = request.travel_draft.dict()
+    logger.info(f"📍 收到流式生成计划请求，草稿内容: {json.dumps(draft, ensure_ascii=False)}")
+
+    async def generate_plan_stream():
+        try:
+            missing = [k for k in ("destination", "origin", "start_date", "end_date") if not draft.get(k)]
+            if missing:
+                yield {'type': 'error', 'content': '缺少必填项: ' + ', '.join(missing)}
+                return
+
+            yield {'type': 'plan_start'}
+
+            # 长行程：逐天并行生成，按完成顺序推送；骨架失败时回退到下面的单次流式调用
+            if trip_planner.should_fan_out(draft):
+                run = trip_planner.start(draft, request.model, request.system_prompt)
+                async for index, day in run.days():
+                    yield {'type': 'plan_day', 'index': index, 'total': len(run.dates), 'day': day}
+                result = run.result()
+                if result:
+                    logger.info(f"📅 并行计划生成完成，共 {len(result['itinerary'])} 天")
+                    yield {'type': 'plan_complete', 'data': result}
+                    yield {'type': 'done'}
+                    return
+
+            days = JsonArrayStream(("itinerary",))
+            extractor = JsonObjectExtractor()   # 与逐天解析同步扫描，结束时无需再扫一遍全文
+            day_count = 0
+            async for text in llm_gateway.stream(
+                "plan_generation",
+                model=request.model,
+                messages=_plan_generation_messages(draft, request.system_prompt),
+                temperature=0.3,
+                max_tokens=6000,
+                timeout=300,
+            ):
+                extractor.feed(text)
+                for day in days.feed(text):
+                    yield {'type': 'plan_day', 'index': day_count, 'day': day}
+                    day_count += 1
+
+            logger.info(f"📅 流式计划生成完成，逐天推送 {day_count} 天，解析失败 {days.items_failed} 天")
+            result = _daily_plan_response(days.text.strip(), draft, extractor)
+            yield {'type': 'plan_complete', 'data': result}
+            yield {'type': 'done'}
+        except Exception as e:
+            logger.error(f"每日计划流式生成错误: {str(e)}")
+            yield {'type': 'error', 'content': f'生成计划时出错: {str(e)}'}
+
+    return _sse_response(generate_plan_stream(), "plan_stream")
+
+
 def _amap_geocode_sync(name: str, city: Optional[str] = None):
     if not AMAP_KEY:
         raise RuntimeError("AMAP_KEY未设置")
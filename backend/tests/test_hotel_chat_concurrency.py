@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+main = pytest.importorskip("main")
+
+
+class _SlowGateway:
+    """推荐流输出第一段后停住，直到测试放行"""
+
+    def __init__(self):
+        self.started = asyncio.Event()
+        self.release = asyncio.Event()
+
+    async def stream(self, call, **kwargs):
+        yield "为您推荐："
+        self.started.set()
+        await self.release.wait()
+        for chunk in ("第一家", "[HOTEL_CARD:0]", "很合适"):
+            await asyncio.sleep(0.01)
+            yield chunk
+
+
+def test_other_endpoints_respond_during_recommendation_stream(monkeypatch):
+    async def analyze_intent(message, travel_plan=None, on_partial=None):
+        return {
+            "intent": "book_hotel",
+            "hotel-book": True,
+            "params": {"destination": "成都春熙路", "checkin_date": "2025-11-13", "checkout_date": "2025-11-14"},
+        }
+
+    async def search_hotels(params, on_event=None):
+        hotels = [{"name": "A", "price": "¥ 400", "score": "8.6 很棒 120条点评", "location": "距市中心 1 公里"}]
+        return {"success": True, "hotels": hotels, "search_params": params, "cache": "hit"}
+
+    async def scenario():
+        gateway = _SlowGateway()
+        monkeypatch.setattr(main.hotel_agent, "llm", gateway)
+        monkeypatch.setattr(main.hotel_agent, "analyze_intent", analyze_intent)
+        monkeypatch.setattr(main.hotel_agent, "search_hotels", search_hotels)
+
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            chat = asyncio.create_task(client.post("/api/hotel-chat", json={"message": "帮我订成都春熙路的酒店"}))
+            await asyncio.wait_for(gateway.started.wait(), 5)
+
+            # 推荐流仍在进行时，其他接口照常响应
+            response = await asyncio.wait_for(client.get("/"), 2)
+            assert response.status_code == 200
+            assert not chat.done()
+
+            gateway.release.set()
+            chat_response = await asyncio.wait_for(chat, 5)
+
+        assert chat_response.status_code == 200
+        assert "hotel_card" in chat_response.text
+        assert '"type": "done"' in chat_response.text
+
+    asyncio.run(scenario())
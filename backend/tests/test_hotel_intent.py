@@ -0,0 +1,61 @@
+from datetime import date
+
+import pytest
+
+from hotel_intent import fast_intent
+
+TODAY = date(2025, 11, 1)
+
+
+def test_request_example_hits():
+    result = fast_intent("帮我订成都春熙路11月13号的酒店两个人", today=TODAY)
+    assert result is not None
+    assert result["hotel-book"] is True
+    assert result["params"] == {
+        "destination": "成都春熙路",
+        "checkin_date": "2025-11-13",
+        "checkout_date": "2025-11-14",
+        "adults": 2,
+    }
+
+
+def test_nights_used_for_checkout():
+    result = fast_intent("帮我订外滩附近的酒店，11月13号入住3晚", today=TODAY)
+    assert result is not None
+    assert result["params"]["destination"] == "外滩"
+    assert result["params"]["checkout_date"] == "2025-11-16"
+
+
+@pytest.mark.parametrize(
+    "message, destination",
+    [
+        ("帮我订三亚亚龙湾的海景酒店", "三亚亚龙湾"),
+        ("帮我订成都春熙路附近的亲子酒店", "成都春熙路"),
+    ],
+)
+def test_hotel_type_is_not_destination(message, destination):
+    result = fast_intent(message, today=TODAY)
+    assert result is not None
+    assert result["params"]["destination"] == destination
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        # 酒店属性不能当作目的地
+        "帮我订一家评分高的酒店在三亚",
+        "我想订一家五星级酒店在广州",
+        "帮我订靠近地铁站的酒店",
+        # 类型修饰词去掉后没有可用的目的地
+        "帮我订一家带泳池的酒店在三亚",
+        # 规则不提取的预算条件
+        "帮我订北京的酒店，预算500以内",
+        "帮我订北京300元以下的酒店",
+        # 没有入住日期，晚数用不上
+        "帮我订酒店，住在外滩附近，3晚",
+        # 晚数与日期范围不一致
+        "帮我订成都春熙路的酒店，11月13号到15号住三晚",
+    ],
+)
+def test_falls_back_to_llm(message):
+    assert fast_intent(message, today=TODAY) is None
@@ -0,0 +1,32 @@
+from hotel_ranking import rank_hotels
+
+
+def _hotel(name, price, score="8.5 很棒 100条点评"):
+    return {"name": name, "price": price, "score": score, "location": "距市中心 1 公里"}
+
+
+def test_max_price_filters_cny_prices():
+    hotels = [_hotel("A", "¥ 450"), _hotel("B", "CNY 900")]
+    names = [item["hotel"]["name"] for item in rank_hotels(hotels, max_price=500)]
+    assert names == ["A"]
+
+
+def test_max_price_ignored_for_other_currencies():
+    # HK$ 518 / US$ 90 与人民币 500 的预算不可直接比较，不应被排除
+    hotels = [_hotel("A", "HK$ 518"), _hotel("B", "US$ 90"), _hotel("C", "¥ 900")]
+    names = {item["hotel"]["name"] for item in rank_hotels(hotels, max_price=500)}
+    assert names == {"A", "B"}
+
+
+def test_price_score_compared_within_currency():
+    # 评分、距离相同；JPY 金额大但不应因此被当作最贵的酒店
+    hotels = [
+        _hotel("cny_cheap", "¥ 300"),
+        _hotel("cny_expensive", "CNY 900"),
+        _hotel("jpy_cheap", "JPY 8,000"),
+        _hotel("jpy_expensive", "JPY 30,000"),
+    ]
+    ranked = {item["hotel"]["name"]: item["rank_score"] for item in rank_hotels(hotels)}
+    assert ranked["jpy_cheap"] == ranked["cny_cheap"]
+    assert ranked["jpy_expensive"] == ranked["cny_expensive"]
+    assert ranked["jpy_cheap"] > ranked["cny_expensive"]
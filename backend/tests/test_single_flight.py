@@ -0,0 +1,50 @@
+import asyncio
+
+from core.single_flight import SingleFlight
+
+
+def test_rejoin_after_cancel_starts_fresh_flight():
+    async def scenario():
+        flights = SingleFlight()
+        calls = 0
+
+        async def fetch(emit):
+            nonlocal calls
+            calls += 1
+            attempt = calls
+            try:
+                await asyncio.sleep(0.05 if attempt > 1 else 10)
+            except asyncio.CancelledError:
+                # 模拟取消后的清理（关闭页面、保存登录态）
+                await asyncio.sleep(0.05)
+                raise
+            return {"attempt": attempt}
+
+        first = asyncio.create_task(flights.do("k", fetch))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        await asyncio.sleep(0)
+
+        # 第一个任务仍在清理时到达的相同请求
+        result, shared = await flights.do("k", fetch)
+        assert result == {"attempt": 2}
+        assert shared is False
+        assert first.cancelled()
+
+    asyncio.run(scenario())
+
+
+def test_followers_share_result():
+    async def scenario():
+        flights = SingleFlight()
+
+        async def fetch(emit):
+            await asyncio.sleep(0.01)
+            return {"hotels": [1]}
+
+        results = await asyncio.gather(flights.do("k", fetch), flights.do("k", fetch))
+        assert [shared for _, shared in results] == [False, True]
+        assert results[0][0] == results[1][0] == {"hotels": [1]}
+        assert flights.in_flight() == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,30 @@
+import asyncio
+
+from core.sse import HEARTBEAT_FRAME, sse_stream
+
+
+async def _collect(events, **kwargs):
+    return [frame async for frame in sse_stream(events, "test", **kwargs)]
+
+
+def test_events_are_written_and_stream_ends():
+    async def events():
+        yield {"type": "a"}
+        yield {"type": "b"}
+
+    frames = asyncio.run(asyncio.wait_for(_collect(events(), heartbeat_interval=0.01), 2))
+    body = "".join(frames)
+    assert '"type": "a"' in body and '"type": "b"' in body
+    assert '"type": "error"' not in body
+
+
+def test_generator_cancelled_error_ends_stream():
+    async def events():
+        yield {"type": "a"}
+        await asyncio.sleep(0.02)
+        raise asyncio.CancelledError()
+
+    # 修复前写出端会一直发送心跳，wait_for 超时
+    frames = asyncio.run(asyncio.wait_for(_collect(events(), heartbeat_interval=0.01), 2))
+    assert HEARTBEAT_FRAME in frames
+    assert '"type": "error"' in frames[-1]
@@ -0,0 +1,274 @@
+"""
+长行程每日计划并行生成
+单次调用逐天生成整份计划时，耗时随天数线性增长，且长行程容易在 max_tokens 处被截断。
+天数较多时改为两步：
+1. 骨架：天数和日期由草稿直接算出，一次小调用只为每天分配片区和景点
+2. 逐天：每天的详细活动各自一次调用，在并发上限内并行，单天失败单独重试
+结果合并为与单次调用相同的 daily_plan_json 结构，总耗时取决于最慢的一天而不是所有天之和
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import date, timedelta
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from core.json_stream import JsonObjectExtractor
+from core.llm_gateway import llm_gateway
+from core.metrics import metrics
+from core.prompt_budget import compact_json, record_prompt
+
+logger = logging.getLogger(__name__)
+
+PLAN_FANOUT = os.getenv("PLAN_FANOUT", "true").lower() == "true"
+PLAN_FANOUT_MIN_DAYS = int(os.getenv("PLAN_FANOUT_MIN_DAYS", 4))   # 少于这个天数仍用单次调用
+PLAN_DAY_CONCURRENCY = int(os.getenv("PLAN_DAY_CONCURRENCY", 4))   # 单个计划同时进行的逐天调用数
+PLAN_DAY_RETRIES = int(os.getenv("PLAN_DAY_RETRIES", 2))           # 单天生成失败后的重试次数
+PLAN_DAY_TIMEOUT = float(os.getenv("PLAN_DAY_TIMEOUT", 60))
+PLAN_SKELETON_TIMEOUT = float(os.getenv("PLAN_SKELETON_TIMEOUT", 60))
+PLAN_MAX_DAYS = 30
+
+PLAN_FANOUT_TOTAL = metrics.counter(
+    "plan_fanout_total", "并行生成的计划（ok 成功 / skeleton_failed 骨架失败回退到单次调用）", ("outcome",)
+)
+PLAN_DAY_SECONDS = metrics.histogram(
+    "plan_day_generation_seconds", "单天行程生成耗时（不含排队，含重试；outcome 为 ok / fallback）", ("outcome",)
+)
+PLAN_DAY_RETRIES_TOTAL = metrics.counter("plan_day_retries_total", "单天行程生成的重试次数")
+
+SKELETON_PROMPT = (
+    "你是旅行规划助手。为下面的行程排出每天的骨架，只分配片区和景点，不写详细安排。\n"
+    "只输出一个JSON对象，不要任何前后文字或markdown标记：\n"
+    '{"city":"城市名（不带市字）","days":[{"day":1,"area":"当天所在片区","title":"当天主题",'
+    '"attractions":["景点官方名称"]}],"notes":"整体注意事项"}\n'
+    "规则：\n"
+    "1. days 的天数和顺序必须与给出的日期列表一致\n"
+    "2. 用户指定的景点(attractions)必须安排进去，可适当补充热门景点\n"
+    "3. 全天景点（游乐园/爬山）单独一天；城市打卡每天3-4个，同一天的景点尽量在同一片区\n"
+    "4. 景点使用标准化中文官方名称（如\"外滩\"而非\"外滩风景区\"），不同天不要重复"
+)
+
+DAY_PROMPT = (
+    "你是旅行规划助手。根据整体行程骨架，为其中指定的一天生成详细安排。\n"
+    "只输出一个JSON对象，不要任何前后文字或markdown标记：\n"
+    '{"day":1,"date":"YYYY-MM-DD","title":"Day 1","activities":[{"name":"景点官方名称","notes":"可选说明"}],'
+    '"summary":"当天总结（交通方式、注意事项）"}\n'
+    "规则：\n"
+    "1. 以骨架中当天的景点为主，按游览顺序排列，可补充同片区的餐饮或小众景点\n"
+    "2. 不要安排骨架中其他天已有的景点\n"
+    "3. 活动名称使用标准化中文官方名称"
+)
+
+
+def trip_dates(draft: Dict) -> List[str]:
+    """草稿中的行程日期列表（含首尾）；日期缺失、格式错误或超出上限时返回空列表"""
+    try:
+        start = date.fromisoformat(str(draft.get("start_date")))
+        end = date.fromisoformat(str(draft.get("end_date")))
+    except ValueError:
+        return []
+    days = (end - start).days + 1
+    if days < 1 or days > PLAN_MAX_DAYS:
+        return []
+    return [(start + timedelta(days=i)).isoformat() for i in range(days)]
+
+
+def _parse_object(text: str) -> Optional[Dict]:
+    result = JsonObjectExtractor.parse(text).result()
+    return result if isinstance(result, dict) else None
+
+
+class PlanRun:
+    """
+    一次并行生成
+
+    用法：
+        run = trip_planner.start(draft, model)
+        async for index, day in run.days():   # 每完成一天产出一次（按完成顺序，index 为第几天 - 1）
+            ...
+        result = run.result()                  # 合并后的 daily_plan_json；骨架失败时为 None
+    """
+
+    def __init__(self, planner: "TripPlanner", draft: Dict, model: str, system_prompt: Optional[str] = None):
+        self.planner = planner
+        self.draft = draft
+        self.model = model
+        self.system_prompt = system_prompt
+        self.dates = trip_dates(draft)
+        self.skeleton: Optional[Dict] = None
+        self._days: Dict[int, Dict] = {}
+
+    def _messages(self, system: str, user: str) -> List[Dict]:
+        messages = [{"role": "system", "content": system}]
+        if self.system_prompt:
+            messages.append({"role": "system", "content": self.system_prompt})
+        messages.append({"role": "user", "content": user})
+        return messages
+
+    async def _generate_skeleton(self) -> Optional[Dict]:
+        messages = self._messages(
+            SKELETON_PROMPT,
+            f"用户需求：{compact_json(self.draft)}\n日期列表：{compact_json(self.dates)}",
+        )
+        record_prompt("plan_skeleton", messages)
+        try:
+            response = await llm_gateway.complete(
+                "plan_skeleton",
+                model=self.model,
+                messages=messages,
+                temperature=0.3,
+                max_tokens=400 + 80 * len(self.dates),
+                timeout=PLAN_SKELETON_TIMEOUT,
+            )
+        except Exception as e:
+            logger.warning(f"行程骨架生成失败: {e}")
+            return None
+        skeleton = _parse_object(response.choices[0].message.content or "")
+        if not skeleton or not isinstance(skeleton.get("days"), list):
+            logger.warning("行程骨架解析失败")
+            return None
+
+        # 天数和日期以草稿为准，模型少给或多给的天按位置对齐
+        given = [d for d in skeleton["days"] if isinstance(d, dict)]
+        skeleton["days"] = [
+            {
+                **(given[i] if i < len(given) else {}),
+                "day": i + 1,
+                "date": day_date,
+            }
+            for i, day_date in enumerate(self.dates)
+        ]
+        return skeleton
+
+    def _fallback_day(self, outline: Dict) -> Dict:
+        """重试仍失败的一天：直接用骨架中的景点"""
+        return {
+            "day": outline["day"],
+            "date": outline["date"],
+            "title": outline.get("title") or f"Day {outline['day']}",
+            "activities": [{"name": name} for name in outline.get("attractions") or [] if name],
+            "summary": outline.get("area") or "",
+        }
+
+    async def _generate_day(self, outline: Dict, semaphore: asyncio.Semaphore) -> Dict:
+        outline_json = compact_json(
+            [{k: d.get(k) for k in ("day", "area", "attractions")} for d in self.skeleton["days"]]
+        )
+        messages = self._messages(
+            DAY_PROMPT,
+            f"目的地：{self.skeleton.get('city') or self.draft.get('destination')}\n"
+            f"行程骨架：{outline_json}\n"
+            f"请生成第{outline['day']}天（{outline['date']}）的详细安排，当天骨架：{compact_json(outline)}",
+        )
+        record_prompt("plan_day", messages)
+        async with semaphore:
+            started = time.perf_counter()
+            for attempt in range(PLAN_DAY_RETRIES + 1):
+                if attempt:
+                    PLAN_DAY_RETRIES_TOTAL.inc()
+                    self.planner.day_retries += 1
+                    await asyncio.sleep(0.5 * attempt)
+                try:
+                    response = await llm_gateway.complete(
+                        "plan_day",
+                        model=self.model,
+                        messages=messages,
+                        temperature=0.3,
+                        max_tokens=1200,
+                        timeout=PLAN_DAY_TIMEOUT,
+                    )
+                except Exception as e:
+                    logger.warning(f"第{outline['day']}天行程生成失败（第{attempt + 1}次）: {e}")
+                    continue
+                day = _parse_object(response.choices[0].message.content or "")
+                if day and isinstance(day.get("activities"), list) and day["activities"]:
+                    day["day"], day["date"] = outline["day"], outline["date"]
+                    day.setdefault("title", outline.get("title") or f"Day {outline['day']}")
+                    PLAN_DAY_SECONDS.observe(time.perf_counter() - started, outcome="ok")
+                    return day
+                logger.warning(f"第{outline['day']}天行程解析失败（第{attempt + 1}次）")
+
+        self.planner.day_fallbacks += 1
+        PLAN_DAY_SECONDS.observe(time.perf_counter() - started, outcome="fallback")
+        logger.error(f"第{outline['day']}天行程重试 {PLAN_DAY_RETRIES} 次仍失败，使用骨架中的景点")
+        return self._fallback_day(outline)
+
+    async def days(self) -> AsyncIterator[Tuple[int, Dict]]:
+        """生成骨架后并行生成每一天，按完成顺序产出 (index, day)；骨架失败时不产出任何内容"""
+        self.planner.runs += 1
+        self.skeleton = await self._generate_skeleton()
+        if self.skeleton is None:
+            self.planner.skeleton_failures += 1
+            PLAN_FANOUT_TOTAL.inc(outcome="skeleton_failed")
+            return
+
+        semaphore = asyncio.Semaphore(PLAN_DAY_CONCURRENCY)
+        tasks = {
+            asyncio.ensure_future(self._generate_day(outline, semaphore)): index
+            for index, outline in enumerate(self.skeleton["days"])
+        }
+        try:
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    index = tasks[task]
+                    self._days[index] = task.result()
+                    yield index, self._days[index]
+            PLAN_FANOUT_TOTAL.inc(outcome="ok")
+        finally:
+            # 调用方提前停止（如客户端断开）时取消尚未完成的天
+            for task in tasks:
+                task.cancel()
+
+    def result(self) -> Optional[Dict]:
+        """合并为与单次调用相同结构的 daily_plan_json"""
+        if self.skeleton is None:
+            return None
+        plan = {k: v for k, v in self.draft.items() if v not in (None, "", [])}
+        plan.setdefault("people", 2)
+        plan["city"] = self.skeleton.get("city") or plan.get("destination")
+        return {
+            "type": "daily_plan_json",
+            "plan": plan,
+            "itinerary": [self._days[i] for i in sorted(self._days)],
+            "notes": self.skeleton.get("notes"),
+            "corrections": None,
+        }
+
+
+class TripPlanner:
+    """长行程并行生成的入口，统计信息在多次生成间累计"""
+
+    def __init__(self):
+        self.runs = 0
+        self.skeleton_failures = 0
+        self.day_retries = 0
+        self.day_fallbacks = 0
+
+    def should_fan_out(self, draft: Dict) -> bool:
+        return PLAN_FANOUT and len(trip_dates(draft)) >= PLAN_FANOUT_MIN_DAYS
+
+    def start(self, draft: Dict, model: str, system_prompt: Optional[str] = None) -> PlanRun:
+        return PlanRun(self, draft, model, system_prompt)
+
+    async def generate(self, draft: Dict, model: str, system_prompt: Optional[str] = None) -> Optional[Dict]:
+        """并行生成完整计划；骨架失败时返回 None，由调用方回退到单次调用"""
+        run = self.start(draft, model, system_prompt)
+        async for _ in run.days():
+            pass
+        return run.result()
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": PLAN_FANOUT,
+            "min_days": PLAN_FANOUT_MIN_DAYS,
+            "concurrency": PLAN_DAY_CONCURRENCY,
+            "runs": self.runs,
+            "skeleton_failures": self.skeleton_failures,
+            "day_retries": self.day_retries,
+            "day_fallbacks": self.day_fallbacks,
+        }
+
+
+trip_planner = TripPlanner()